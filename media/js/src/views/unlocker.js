@@ -21,7 +21,15 @@ define([
                 }
             } else {
                 // There's a video on the page, so find out if the user
-                // has already watched it.
+                // has already watched it. The page usually tells us.
+                var watched = $('#watched-videos').data('watched-video-ids');
+                if ($.isArray(watched)) {
+                    if (_.contains(watched, lockedVideoId)) {
+                        this.unlock();
+                    }
+                    return;
+                }
+
                 var me = this;
                 $.get('/api/watched_videos/', function(data) {
                     var match = _.find(data, function(e) {
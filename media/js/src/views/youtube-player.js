@@ -1,8 +1,7 @@
 define([
     'jquery',
-    'models/watched-video',
     'utils'
-], function($, WatchedVideo, utils) {
+], function($, utils) {
     var youtubePlayer = {
         loadYouTubeAPI: function(container, videoId) {
             if (typeof YT === 'undefined' ||
@@ -39,11 +38,14 @@ define([
     };
 
     /**
-     * Save a WatchedVideo to the server.
+     * Save WatchedVideos to the server, in one request.
      */
-    function recordWatchedVideo(videoId) {
-        var watchedVideo = new WatchedVideo({'video_id': videoId});
-        watchedVideo.save(null, {
+    function recordWatchedVideos(videoIds) {
+        $.ajax({
+            type: 'POST',
+            url: '/api/watched_videos/batch/',
+            contentType: 'application/json',
+            data: JSON.stringify({'video_ids': videoIds}),
             success: function() {
                 $('li.next').removeClass('disabled');
             }
@@ -57,7 +59,7 @@ define([
     window.onPlayerStateChange = function(event) {
         if (event.data === YT.PlayerState.ENDED) {
             // The video ended, so unlock the 'next' button.
-            recordWatchedVideo(lockedVideoId);
+            recordWatchedVideos([lockedVideoId]);
         }
     };
 
@@ -4,14 +4,15 @@ from ordered_model.admin import OrderedModelAdmin
 from worth2.goals.models import (
     GoalCheckInOption, GoalOption, GoalSettingResponse, GoalCheckInResponse
 )
+from worth2.main.admin import BumpsCatalogVersionMixin
 
 
-class GoalCheckInOptionAdmin(OrderedModelAdmin):
+class GoalCheckInOptionAdmin(BumpsCatalogVersionMixin, OrderedModelAdmin):
     list_display = ('text', 'move_up_down_links')
     model = GoalCheckInOption
 
 
-class GoalOptionAdmin(OrderedModelAdmin):
+class GoalOptionAdmin(BumpsCatalogVersionMixin, OrderedModelAdmin):
     list_display = ('text', 'goal_type', 'move_up_down_links')
     model = GoalOption
 
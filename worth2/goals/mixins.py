@@ -1,15 +1,80 @@
 from collections import OrderedDict
-from django import forms
+from django import forms, http
 from django.contrib import messages
 from django.db.models import Q
 from django.forms.formsets import formset_factory
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import render
 from django.template.defaultfilters import pluralize
 
 from worth2.goals.forms import GoalCheckInForm, GoalSettingForm
-from worth2.goals.models import (
-    GoalCheckInResponse, GoalOption, GoalSettingResponse
-)
+from worth2.goals.models import GoalCheckInResponse, GoalSettingResponse
+from worth2.main.catalog import get_form_class
+from worth2.main.forms import CatalogChoiceField
+
+
+def make_goal_check_in_form(catalog):
+    """Make the check-in Form class, with the catalog's options.
+
+    :returns: a class
+    """
+    field = GoalCheckInForm.base_fields['what_got_in_the_way']
+
+    class CatalogGoalCheckInForm(GoalCheckInForm):
+        what_got_in_the_way = CatalogChoiceField(
+            catalog.get_goal_check_in_options(),
+            label=field.label,
+            required=False,
+            widget=forms.Select(attrs=field.widget.attrs),
+        )
+
+    return CatalogGoalCheckInForm
+
+
+def make_goal_setting_form(goal_type, catalog):
+    """Make the goal setting Form class for this goal type.
+
+    :returns: a class
+    """
+
+    class DynamicGoalSettingForm(GoalSettingForm):
+
+        option = CatalogChoiceField(
+            catalog.get_goal_options(goal_type),
+            label='Main %s goal' % goal_type,
+            widget=forms.Select(
+                attrs={'class': 'form-control goal-option'}),
+        )
+
+    # Put the form's fields in the right order.
+    DynamicGoalSettingForm.base_fields = OrderedDict(
+        (k, DynamicGoalSettingForm.base_fields[k])
+        for k in ['option', 'other_text', 'text']
+    )
+    return DynamicGoalSettingForm
+
+
+def get_goal_check_in_formset_class(min_num):
+    """Returns the check-in FormSet class for this many goals."""
+    form_class = get_form_class(('goal-check-in',), make_goal_check_in_form)
+    return get_form_class(
+        ('goal-check-in-formset', min_num),
+        lambda catalog: formset_factory(form_class, min_num=min_num))
+
+
+def get_goal_setting_formset_class(goal_type, extra):
+    """Returns the goal setting FormSet class for this goal type."""
+    form_class = get_form_class(
+        ('goal-setting', goal_type),
+        lambda catalog: make_goal_setting_form(goal_type, catalog))
+    return get_form_class(
+        ('goal-setting-formset', goal_type, extra),
+        lambda catalog: formset_factory(
+            form_class,
+            extra=extra,
+            # min_num is 1 because there's always a 'Main' goal form.
+            min_num=1,
+            validate_min=True,
+        ))
 
 
 class GoalCheckInViewMixin(object):
@@ -28,9 +93,8 @@ class GoalCheckInViewMixin(object):
             goal_setting_block=goalsettingblock,
         ).filter(~Q(option__text__iexact='n/a')).order_by('form_id')
 
-        self.GoalCheckInFormSet = formset_factory(
-            GoalCheckInForm,
-            min_num=self.goal_setting_responses.count())
+        self.GoalCheckInFormSet = get_goal_check_in_formset_class(
+            self.goal_setting_responses.count())
 
         # If there's existing responses to this pageblock, use them
         # to bind the formset.
@@ -38,7 +102,8 @@ class GoalCheckInViewMixin(object):
             goal_setting_response__in=self.goal_setting_responses)
 
         initial_data = []
-        for r in responses.order_by('goal_setting_response__form_id'):
+        for r in responses.select_related('what_got_in_the_way').order_by(
+                'goal_setting_response__form_id'):
             initial_data.append({
                 'i_will_do_this': r.i_will_do_this,
                 'what_got_in_the_way': r.what_got_in_the_way,
@@ -63,24 +128,22 @@ class GoalCheckInViewMixin(object):
             prefix='pageblock-%s' % goalcheckinblock.pk)
 
         if formset.is_valid():
-            for formdata in formset.cleaned_data:
-                if formdata == {}:
+            formdata = {}
+            for data in formset.cleaned_data:
+                if data == {}:
                     continue
 
-                resp_id = formdata.pop('goal_setting_response_id')
-                resp = get_object_or_404(GoalSettingResponse, pk=resp_id)
-                updated_values = formdata.copy()
-                try:
-                    GoalCheckInResponse.objects.create_or_update(
-                        goal_setting_response=resp,
-                        defaults=updated_values)
-                except:
-                    GoalCheckInResponse.objects.filter(
-                        goal_setting_response=resp,
-                    ).delete()
-
-                    updated_values.update({'goal_setting_response': resp})
-                    GoalCheckInResponse.objects.create(**updated_values)
+                data = data.copy()
+                resp_id = data.pop('goal_setting_response_id')
+                formdata[resp_id] = data
+
+            # Only check in on the user's own goals.
+            owned = GoalSettingResponse.objects.filter(
+                user=request.user, pk__in=formdata.keys()).count()
+            if owned != len(formdata):
+                raise http.Http404
+
+            GoalCheckInResponse.objects.bulk_save(request.user, formdata)
 
         return formset
 
@@ -118,21 +181,7 @@ class GoalSettingViewMixin(object):
         To be used by both GET and POST.
         """
 
-        class DynamicGoalSettingForm(GoalSettingForm):
-
-            option = forms.ModelChoiceField(
-                label='Main %s goal' % goalsettingblock.block().goal_type,
-                queryset=GoalOption.objects.filter(
-                    goal_type=goalsettingblock.block().goal_type),
-                widget=forms.Select(
-                    attrs={'class': 'form-control goal-option'}),
-            )
-
-        # Put the form's fields in the right order.
-        DynamicGoalSettingForm.base_fields = OrderedDict(
-            (k, DynamicGoalSettingForm.base_fields[k])
-            for k in ['option', 'other_text', 'text']
-        )
+        goal_type = goalsettingblock.block().goal_type
 
         # If there's existing responses to this pageblock, use them
         # to bind the formset.
@@ -148,16 +197,11 @@ class GoalSettingViewMixin(object):
         else:
             extra = goalsettingblock.block().goal_amount - 1
 
-        self.GoalSettingFormSet = formset_factory(
-            DynamicGoalSettingForm,
-            extra=extra,
-            # min_num is 1 because there's always a 'Main' goal form.
-            min_num=1,
-            validate_min=True,
-        )
+        self.GoalSettingFormSet = get_goal_setting_formset_class(
+            goal_type, extra)
 
         initial_data = []
-        for r in responses.order_by('form_id'):
+        for r in responses.select_related('option').order_by('form_id'):
             initial_data.append({
                 'option': r.option,
                 'other_text': r.other_text,
@@ -174,55 +218,17 @@ class GoalSettingViewMixin(object):
         This method returns the populated formset.
         """
 
-        block = goalsettingblock.block()
         formset = self.GoalSettingFormSet(
             request.POST,
             prefix='pageblock-%s' % goalsettingblock.pk)
 
         if formset.is_valid():
-            for i, formdata in enumerate(formset.cleaned_data):
-                # Formsets with multiple forms put an empty dictionary in
-                # the cleaned data for unpopulated forms. We don't want
-                # to attempt to make a GoalSettingResponse for these
-                # optional, empty forms.
-                if formdata == {}:
-                    continue
-
-                updated_values = formdata.copy()
-                try:
-                    obj, created = GoalSettingResponse.objects \
-                        .update_or_create(
-                            form_id=i,
-                            user=request.user,
-                            goal_setting_block=block,
-                            defaults=updated_values)
-
-                    if not created:
-                        # If the goal setting response was updated, that
-                        # means the user went back and updated it. It may
-                        # have an existing checkin response associated with
-                        # it, which should be cleared since it wouldn't
-                        # make sense to have attached on the new goal.
-                        checkin_response = GoalCheckInResponse.objects.get(
-                            goal_setting_response=obj)
-                        if checkin_response:
-                            checkin_response.delete()
-                except:
-                    # In case there's a unique_together exception, or something
-                    # similar, (which is unlikely, but possible if you have
-                    # stale data), we can handle it by refreshing the data.
-                    GoalSettingResponse.objects.filter(
-                        form_id=i,
-                        user=request.user,
-                        goal_setting_block=block,
-                    ).delete()
-
-                    updated_values.update({
-                        'form_id': i,
-                        'user': request.user,
-                        'goal_setting_block': block,
-                    })
-                    GoalSettingResponse.objects.create(**updated_values)
+            # Formsets with multiple forms put an empty dictionary in
+            # the cleaned data for unpopulated forms, which bulk_save
+            # skips.
+            GoalSettingResponse.objects.bulk_save(
+                request.user, goalsettingblock.block(),
+                formset.cleaned_data)
 
         return formset
 
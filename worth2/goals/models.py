@@ -1,13 +1,18 @@
 from django import forms
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from django.template.defaultfilters import slugify
+from django.utils import timezone
 from django.utils.encoding import smart_str
 from ordered_model.models import OrderedModel
 from pagetree.generic.models import BasePageBlock
 from pagetree.reports import ReportColumnInterface, ReportableInterface
 
-from worth2.main.utils import get_first_block_in_module, get_module_number
+from worth2.goals.signals import goal_responses_saved
+from worth2.main.catalog import get_content_catalog
+from worth2.main.utils import (
+    apply_changes, bulk_update, get_first_block_in_module, get_module_number
+)
 
 
 GOAL_TYPES = (
@@ -60,6 +65,16 @@ class GoalSettingBlock(BasePageBlock):
         c = self.goal_setting_responses.filter(user=user).count()
         return c > 0
 
+    @classmethod
+    def bulk_unlocked(cls, user, block_ids):
+        """Returns the ids of these blocks that are unlocked for the user.
+
+        This answers unlocked() for many blocks with one query.
+        """
+        return GoalSettingResponse.objects.filter(
+            user=user, goal_setting_block__id__in=block_ids).values_list(
+            'goal_setting_block_id', flat=True)
+
     def __unicode__(self):
         session_num = get_module_number(self.pageblock())
         return unicode('%s goals [Session %d] id: %d' % (
@@ -90,7 +105,7 @@ class GoalSettingBlock(BasePageBlock):
 
     def report_metadata(self):
         rows = []
-        options = GoalOption.objects.filter(goal_type=self.goal_type)
+        options = get_content_catalog().get_goal_options(self.goal_type)
         for idx in xrange(0, self.goal_amount):
             for option in options:  # 1 row per option
                 col = GoalSettingColumn(self, idx, 'option', option)
@@ -162,6 +177,54 @@ class GoalSettingResponseManager(models.Manager):
         else:
             self.none()
 
+    def bulk_save(self, user, block, formdata):
+        """Save a goal setting formset's cleaned data for the user.
+
+        The existing responses are fetched with one query, and the new
+        and changed ones are written in bulk, in one transaction. A
+        changed goal's check-in response is deleted, since it wouldn't
+        make sense to keep it for the new goal.
+
+        :param formdata: the formset's cleaned_data. Each form's index
+          is its response's form_id, and empty forms are skipped.
+
+        :returns: the number of responses created or changed.
+        :rtype: int
+        """
+        wanted = dict(
+            (form_id, values) for form_id, values in enumerate(formdata)
+            if values != {})
+
+        with transaction.atomic():
+            existing = dict(
+                (r.form_id, r) for r in self.select_for_update().filter(
+                    user=user, goal_setting_block=block,
+                    form_id__in=wanted.keys()))
+
+            now = timezone.now()
+            created = []
+            changed = []
+            for form_id, values in wanted.items():
+                response = existing.get(form_id)
+                if response is None:
+                    created.append(GoalSettingResponse(
+                        user=user, goal_setting_block=block,
+                        form_id=form_id, **values))
+                elif apply_changes(response, values):
+                    response.updated_at = now
+                    changed.append(response)
+
+            self.bulk_create(created)
+            bulk_update(changed, ['option', 'other_text', 'text',
+                                  'updated_at'])
+            if changed:
+                GoalCheckInResponse.objects.filter(
+                    goal_setting_response__in=changed).delete()
+
+        if created or changed:
+            goal_responses_saved.send(sender=self.model, user=user)
+        return len(created) + len(changed)
+
 
 class GoalSettingResponse(models.Model):
     """Participant responses to 'main' and 'extra' goals."""
@@ -233,6 +296,17 @@ class GoalSettingColumn(ReportColumnInterface):
         else:
             return getattr(response, self.field) or ''  # replace None with ''
 
+    def bulk_user_value(self, user, data):
+        response = data.goal_setting_response(
+            user, self.block.id, self.goal_idx)
+
+        if response is None:
+            return ''
+        elif self.field == 'option':
+            return response.option_id
+        else:
+            return getattr(response, self.field) or ''  # replace None with ''
+
 
 class GoalCheckInOption(OrderedModel):
     """Editable options for the goal check-in form."""
@@ -248,6 +322,46 @@ class GoalCheckInOption(OrderedModel):
         return unicode(self.text)
 
 
+class GoalCheckInResponseManager(models.Manager):
+    def bulk_save(self, user, formdata):
+        """Save a goal check-in formset's cleaned data for the user.
+
+        The existing check-ins are fetched with one query, and the new
+        and changed ones are written in bulk, in one transaction.
+
+        :param formdata: a dict of GoalSettingResponse id -> the
+          cleaned data of that goal's check-in form.
+
+        :returns: the number of check-ins created or changed.
+        :rtype: int
+        """
+        with transaction.atomic():
+            existing = dict(
+                (r.goal_setting_response_id, r)
+                for r in self.select_for_update().filter(
+                    goal_setting_response__id__in=formdata.keys()))
+
+            now = timezone.now()
+            created = []
+            changed = []
+            for response_id, values in formdata.items():
+                checkin = existing.get(response_id)
+                if checkin is None:
+                    created.append(GoalCheckInResponse(
+                        goal_setting_response_id=response_id, **values))
+                elif apply_changes(checkin, values):
+                    checkin.updated_at = now
+                    changed.append(checkin)
+
+            self.bulk_create(created)
+            bulk_update(changed, ['i_will_do_this', 'what_got_in_the_way',
+                                  'other', 'updated_at'])
+
+        if created or changed:
+            goal_responses_saved.send(sender=self.model, user=user)
+        return len(created) + len(changed)
+
+
 class GoalCheckInResponse(models.Model):
     """Participant responses for the Check In page.
 
@@ -276,6 +390,8 @@ class GoalCheckInResponse(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = GoalCheckInResponseManager()
+
     def __unicode__(self):
         return unicode('"%s" from %s' % (
             unicode(self.get_i_will_do_this_display()),
@@ -314,6 +430,30 @@ class GoalCheckInPageBlock(BasePageBlock):
 
         return False
 
+    @classmethod
+    def bulk_unlocked(cls, user, block_ids):
+        """Returns the ids of these blocks that are unlocked for the user.
+
+        This answers unlocked() for many blocks with two queries.
+        """
+        setting_block_ids = dict(cls.objects.filter(
+            pk__in=block_ids).values_list('id', 'goal_setting_block_id'))
+
+        # goal setting block id -> whether any response was checked in on
+        checked_in = {}
+        responses = GoalSettingResponse.objects.filter(
+            user=user,
+            goal_setting_block__id__in=setting_block_ids.values(),
+        ).annotate(checkins=models.Count('goal_checkin_response'))
+        for setting_block_id, checkins in responses.values_list(
+                'goal_setting_block_id', 'checkins'):
+            checked_in[setting_block_id] = \
+                checked_in.get(setting_block_id, False) or checkins > 0
+
+        return [block_id for block_id, setting_block_id
+                in setting_block_ids.items()
+                if checked_in.get(setting_block_id, True)]
+
     @staticmethod
     def add_form():
         return GoalCheckInPageBlockForm()
@@ -337,7 +477,7 @@ class GoalCheckInPageBlock(BasePageBlock):
             for chc in self.PROGRESS_CHOICES:
                 col = GoalCheckInColumn(self, idx, "progress", chc[0], chc[1])
                 rows.append(col)
-            for opt in GoalCheckInOption.objects.all():
+            for opt in get_content_catalog().get_goal_check_in_options():
                 col = GoalCheckInColumn(self, idx, "barrier", opt.id, opt.text)
                 rows.append(col)
             rows.append(GoalCheckInColumn(self, idx, "other"))
@@ -413,5 +553,18 @@ class GoalCheckInColumn(ReportColumnInterface):
         else:
             return response.other or ''
 
+    def bulk_user_value(self, user, data):
+        response = data.goal_checkin_response(
+            user, self.block.goal_setting_block_id, self.goal_idx)
+
+        if response is None:
+            return ''
+        elif self.field == 'progress':
+            return response.i_will_do_this
+        elif self.field == 'barrier':
+            return response.what_got_in_the_way_id or ''
+        else:
+            return response.other or ''
+
 ReportableInterface.register(GoalSettingBlock)
 ReportableInterface.register(GoalCheckInPageBlock)
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent when a user's goal responses are written in bulk, since bulk
+# writes don't send post_save.
+goal_responses_saved = Signal(providing_args=['user'])
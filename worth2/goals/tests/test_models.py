@@ -3,7 +3,8 @@
 from django.test import TestCase, TransactionTestCase
 from pagetree.helpers import get_hierarchy
 from worth2.goals.models import (
-    GoalSettingColumn, GoalSettingResponse, GoalCheckInColumn
+    GoalSettingColumn, GoalSettingResponse, GoalCheckInColumn,
+    GoalCheckInResponse
 )
 from worth2.goals.tests.factories import (
     GoalSettingBlockFactory, GoalOptionFactory, GoalSettingResponseFactory,
@@ -82,6 +83,63 @@ class GoalSettingResponseTest(TestCase):
 
         self.assertEqual(responses.count(), 1)
 
+    def test_bulk_save(self):
+        block = GoalSettingBlockFactory()
+        user = ParticipantFactory().user
+        option = GoalOptionFactory()
+        main = GoalSettingResponseFactory(
+            goal_setting_block=block, user=user, option=option,
+            text='main goal', form_id=0)
+        checkin = GoalCheckInResponseFactory(goal_setting_response=main)
+        extra = GoalSettingResponseFactory(
+            goal_setting_block=block, user=user, option=option,
+            text='extra goal', form_id=1)
+        checkin2 = GoalCheckInResponseFactory(goal_setting_response=extra)
+
+        with self.assertNumQueries(10):
+            saved = GoalSettingResponse.objects.bulk_save(user, block, [
+                {'option': option, 'other_text': None, 'text': 'new goal'},
+                {'option': option, 'other_text': None, 'text': 'extra goal'},
+                {'option': option, 'other_text': 'other', 'text': 'third'},
+            ])
+        self.assertEqual(saved, 2)
+
+        responses = GoalSettingResponse.objects.filter(
+            user=user, goal_setting_block=block).order_by('form_id')
+        self.assertEqual([r.text for r in responses],
+                         ['new goal', 'extra goal', 'third'])
+        # Existing responses are updated in place.
+        self.assertEqual(responses[0].pk, main.pk)
+        self.assertEqual(responses[1].pk, extra.pk)
+        self.assertGreater(responses[0].updated_at, main.updated_at)
+        self.assertEqual(responses[1].updated_at, extra.updated_at)
+
+        # Only the changed goal's check-in is cleared.
+        self.assertFalse(GoalCheckInResponse.objects.filter(
+            pk=checkin.pk).exists())
+        self.assertTrue(GoalCheckInResponse.objects.filter(
+            pk=checkin2.pk).exists())
+
+    def test_bulk_save_skips_empty_forms(self):
+        block = GoalSettingBlockFactory()
+        user = ParticipantFactory().user
+        option = GoalOptionFactory()
+
+        saved = GoalSettingResponse.objects.bulk_save(user, block, [
+            {}, {'option': option, 'other_text': None, 'text': 'goal'}, {},
+        ])
+        self.assertEqual(saved, 1)
+        self.assertEqual(
+            list(GoalSettingResponse.objects.filter(user=user).values_list(
+                'form_id', flat=True)),
+            [1])
+
+        with self.assertNumQueries(3):
+            saved = GoalSettingResponse.objects.bulk_save(user, block, [
+                {}, {'option': option, 'other_text': None, 'text': 'goal'},
+            ])
+        self.assertEqual(saved, 0)
+
 
 class GoalCheckInBlockTest(TestCase):
     def setUp(self):
@@ -117,6 +175,58 @@ class GoalCheckInResponseTest(TestCase):
         self.assertTrue(
             self.o.goal_setting_response.user.username in unicode(self.o))
 
+    def test_bulk_save(self):
+        response = self.o.goal_setting_response
+        response2 = GoalSettingResponseFactory(
+            user=response.user,
+            goal_setting_block=response.goal_setting_block,
+            form_id=1)
+        option = GoalCheckInOptionFactory()
+
+        with self.assertNumQueries(6):
+            saved = GoalCheckInResponse.objects.bulk_save(response.user, {
+                response.pk: {
+                    'i_will_do_this': 'in progress',
+                    'what_got_in_the_way': option,
+                    'other': '',
+                },
+                response2.pk: {
+                    'i_will_do_this': 'yes',
+                    'what_got_in_the_way': None,
+                    'other': '',
+                },
+            })
+        self.assertEqual(saved, 2)
+
+        checkin = GoalCheckInResponse.objects.get(
+            goal_setting_response=response)
+        self.assertEqual(checkin.pk, self.o.pk)
+        self.assertEqual(checkin.i_will_do_this, 'in progress')
+        self.assertEqual(checkin.what_got_in_the_way, option)
+        self.assertEqual(
+            GoalCheckInResponse.objects.get(
+                goal_setting_response=response2).i_will_do_this,
+            'yes')
+
+    def test_bulk_save_clears_barrier(self):
+        # The only changed check-in's barrier is cleared, so every value
+        # in that column of the update is NULL.
+        self.assertIsNotNone(self.o.what_got_in_the_way)
+        response = self.o.goal_setting_response
+
+        saved = GoalCheckInResponse.objects.bulk_save(response.user, {
+            response.pk: {
+                'i_will_do_this': 'yes',
+                'what_got_in_the_way': None,
+                'other': '',
+            },
+        })
+        self.assertEqual(saved, 1)
+
+        checkin = GoalCheckInResponse.objects.get(pk=self.o.pk)
+        self.assertEqual(checkin.i_will_do_this, 'yes')
+        self.assertIsNone(checkin.what_got_in_the_way)
+
 
 class GoalSettingColumnTest(TestCase):
     def setUp(self):
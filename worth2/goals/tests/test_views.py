@@ -172,6 +172,30 @@ class GoalCheckInPageBlockTest(LoggedInParticipantTestMixin, TestCase):
         self.assertEqual(formset.initial[1]['other'], 'form 2')
         self.assertEqual(formset.initial[2]['other'], 'form 3')
 
+    def test_post_updates_existing_check_ins(self):
+        checkin = GoalCheckInResponseFactory(
+            goal_setting_response=self.setting_resp1,
+            i_will_do_this='no')
+
+        self.client.post(self.url, self.valid_post_data)
+
+        responses = GoalCheckInResponse.objects.filter(
+            goal_setting_response__in=self.setting_responses)
+        self.assertEqual(responses.count(), 3)
+        updated = responses.get(goal_setting_response=self.setting_resp1)
+        self.assertEqual(updated.pk, checkin.pk)
+        self.assertEqual(updated.i_will_do_this, 'yes')
+
+    def test_post_other_users_goal(self):
+        other_resp = GoalSettingResponseFactory(
+            goal_setting_block=self.goalsettingblock)
+        data = self.valid_post_data.copy()
+        data['%s-0-goal_setting_response_id' % self.p] = other_resp.pk
+
+        r = self.client.post(self.url, data)
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(GoalCheckInResponse.objects.count(), 0)
+
     def test_post_only_main_goal(self):
         """
         Assert that a submission with only the Main form populated
@@ -0,0 +1 @@
+default_app_config = 'worth2.main.apps.MainConfig'
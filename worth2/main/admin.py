@@ -2,15 +2,54 @@ from django.contrib import admin
 from ordered_model.admin import OrderedModelAdmin
 from pagetree.models import Hierarchy, Section
 
-from worth2.main.models import Avatar, Location, Participant
+from worth2.main.catalog import bump_catalog_version
+from worth2.main.models import Avatar, Location, Participant, ReportJob
+
+
+class BumpsCatalogVersionMixin(object):
+    """Bump the catalog version once an admin edit is committed.
+
+    The admin's add, change and delete views run in a transaction, so
+    the catalog_changed signal handler bumps the version before the
+    change can be seen. Without this, a catalog rebuilt in between
+    would be cached under the new version with the old options.
+    """
+
+    def changeform_view(self, request, *args, **kwargs):
+        response = super(BumpsCatalogVersionMixin, self).changeform_view(
+            request, *args, **kwargs)
+        if request.method == 'POST':
+            bump_catalog_version()
+        return response
+
+    def delete_view(self, request, *args, **kwargs):
+        response = super(BumpsCatalogVersionMixin, self).delete_view(
+            request, *args, **kwargs)
+        if request.method == 'POST':
+            bump_catalog_version()
+        return response
+
+    def changelist_view(self, request, *args, **kwargs):
+        # Bulk actions and list_editable changes are posted here.
+        response = super(BumpsCatalogVersionMixin, self).changelist_view(
+            request, *args, **kwargs)
+        if request.method == 'POST':
+            bump_catalog_version()
+        return response
+
+
+class LocationAdmin(BumpsCatalogVersionMixin, admin.ModelAdmin):
+    pass
+
 
 admin.site.register(Hierarchy)
 admin.site.register(Section)
-admin.site.register(Location)
+admin.site.register(Location, LocationAdmin)
 admin.site.register(Participant)
+admin.site.register(ReportJob)
 
 
-class AvatarAdmin(OrderedModelAdmin):
+class AvatarAdmin(BumpsCatalogVersionMixin, OrderedModelAdmin):
     list_display = ('image', 'is_default', 'move_up_down_links')
 
 
@@ -1,13 +1,16 @@
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
 from rest_framework import viewsets, permissions
+from rest_framework.decorators import list_route
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
 from worth2.main.auth import AnySessionAuthentication
-from worth2.main.models import Participant
+from worth2.main.enrollment import ParticipantImport
+from worth2.main.models import Participant, WatchedVideo
 from worth2.main.serializers import (
-    ParticipantSerializer, WatchedVideoSerializer
+    ParticipantImportSerializer, ParticipantSerializer,
+    WatchedVideoBatchSerializer, WatchedVideoSerializer
 )
 
 
@@ -51,6 +54,37 @@ class ParticipantViewSet(viewsets.ModelViewSet):
     queryset = Participant.objects.all()
     serializer_class = ParticipantSerializer
 
+    @list_route(methods=['post'], url_path='import')
+    def import_csv(self, request):
+        """Create a participant for each study ID in a CSV.
+
+        Params:
+          file: a CSV with a study ID on each row, and optionally a
+            cohort ID in the second column.
+
+        If any row is invalid, nothing is created, and the errors are
+        returned for each invalid row.
+        """
+        serializer = ParticipantImportSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        participant_import = ParticipantImport.from_csv(
+            serializer.validated_data['file'])
+        if not participant_import.rows:
+            return Response({'file': ['No study IDs were found.']},
+                            status=400)
+        if not participant_import.is_valid():
+            return Response({'rows': participant_import.errors},
+                            status=400)
+
+        participants = participant_import.save(request.user)
+        if participants is None:
+            return Response({'rows': participant_import.errors},
+                            status=400)
+        serializer = ParticipantSerializer(
+            participants, many=True, context={'request': request})
+        return Response(serializer.data, status=201)
+
 
 class WatchedVideoViewSet(viewsets.ModelViewSet):
     serializer_class = WatchedVideoSerializer
@@ -61,4 +95,23 @@ class WatchedVideoViewSet(viewsets.ModelViewSet):
         return self.request.user.watched_videos.all()
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        # Watching a video again isn't an error.
+        WatchedVideo.objects.record(
+            self.request.user, [serializer.validated_data['video_id']])
+
+    @list_route(methods=['post'])
+    def batch(self, request):
+        """Record several watched videos at once.
+
+        Params:
+          video_ids: a list of YouTube video ids
+
+        Returns the ids of all the videos the user has watched.
+        """
+        serializer = WatchedVideoBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        WatchedVideo.objects.record(
+            request.user, serializer.validated_data['video_ids'])
+
+        return Response({'video_ids': list(
+            self.get_queryset().values_list('video_id', flat=True))})
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class MainConfig(AppConfig):
+    name = 'worth2.main'
+    label = 'main'
+
+    def ready(self):
+        # Connect the signal handlers
+        from worth2.main import signals
+        signals.connect_pageblock_signals()
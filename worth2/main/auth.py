@@ -2,21 +2,35 @@ import base64
 import hashlib
 import hmac
 
+from django.apps import apps
 from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth.models import User
 from rest_framework import permissions
 from rest_framework.authentication import SessionAuthentication
 
 
 def generate_random_username():
-    random_number = User.objects.make_random_password(
-        length=7, allowed_chars='123456789')
+    return generate_random_usernames(1)[0]
 
-    while User.objects.filter(username=random_number):
-        random_number = User.objects.make_random_password(
-            length=7, allowed_chars='123456789')
 
-    return "%s%s" % ('participant_', random_number)
+def generate_random_usernames(count):
+    """Returns a list of new participant usernames.
+
+    All the candidates are checked against the existing users together,
+    so this usually takes one query however many are needed.
+    """
+    usernames = set()
+    while len(usernames) < count:
+        candidates = set(
+            'participant_%s' % User.objects.make_random_password(
+                length=7, allowed_chars='123456789')
+            for i in range(count - len(usernames))) - usernames
+        taken = User.objects.filter(
+            username__in=candidates).values_list('username', flat=True)
+        usernames.update(candidates.difference(taken))
+
+    return list(usernames)
 
 
 def generate_password(username):
@@ -25,9 +39,84 @@ def generate_password(username):
     return base64.b64encode(digest).decode()
 
 
+def verify_password(username, password):
+    """Checks a participant's password against generate_password()."""
+    return hmac.compare_digest(
+        str(password), str(generate_password(username)))
+
+
+class UserRole(object):
+    """What a user is in WORTH, along with their participant records.
+
+    The profile, participant and avatar are loaded together, with one
+    query, and put in the user's related object caches as well, so
+    user.profile.participant.avatar doesn't need any more queries.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.profile = None
+        self.participant = None
+
+        if user is None or user.is_anonymous():
+            return
+
+        InactiveUserProfile = apps.get_model('main', 'InactiveUserProfile')
+        self.profile = InactiveUserProfile.objects.select_related(
+            'participant__avatar').filter(user__id=user.pk).first()
+        setattr(user, User.profile.cache_name, self.profile)
+        if self.profile is not None:
+            setattr(self.profile, InactiveUserProfile.user.cache_name, user)
+            self.participant = getattr(self.profile, 'participant', None)
+
+    @property
+    def is_facilitator(self):
+        return bool(getattr(self.user, 'is_active', False))
+
+    @property
+    def is_participant(self):
+        return self.profile is not None and not self.user.is_active
+
+    @property
+    def avatar(self):
+        """Returns the participant's chosen Avatar, if there is one."""
+        if self.participant is None:
+            return None
+        return self.participant.avatar
+
+
+def get_user_role(user):
+    """Returns the user's UserRole.
+
+    The role is kept on the user object, so it's only resolved once
+    for each request.
+
+    :rtype: UserRole
+    """
+    if user is None:
+        return UserRole(None)
+
+    role = getattr(user, '_role_cache', None)
+    if role is None:
+        role = UserRole(user)
+        user._role_cache = role
+    return role
+
+
+def get_request_role(request):
+    """Returns the UserRole that UserRoleMiddleware attached to the
+    request, or resolves it if the middleware didn't run.
+
+    :rtype: UserRole
+    """
+    role = getattr(request, 'role', None)
+    if role is None:
+        role = get_user_role(getattr(request, 'user', None))
+    return role
+
+
 def user_is_participant(user):
-    return not user.is_anonymous() and \
-        (hasattr(user, 'profile') and user.profile.is_participant())
+    return get_user_role(user).is_participant
 
 
 def user_is_facilitator(user):
@@ -45,15 +134,13 @@ class IsActivePermission(permissions.BasePermission):
     """A DRF permission to give facilitators and admins access."""
 
     def has_permission(self, request, view):
-        user = getattr(request, 'user', None)
-        return user_is_facilitator(user)
+        return get_request_role(request).is_facilitator
 
 
 class IsParticipantPermission(permissions.BasePermission):
     """A DRF permission to give participants permission."""
     def has_permission(self, request, view):
-        user = getattr(request, 'user', None)
-        return user_is_participant(user)
+        return get_request_role(request).is_participant
 
 
 class AnySessionAuthentication(SessionAuthentication):
@@ -75,3 +162,28 @@ class AnySessionAuthentication(SessionAuthentication):
         self.enforce_csrf(request)
 
         return (user, None)
+
+
+class ParticipantBackend(ModelBackend):
+    """Authenticate participants without hashing their passwords.
+
+    A participant's password is just generate_password() of their
+    username, so it can be checked with one HMAC instead of Django's
+    PBKDF2 hash. The facilitator sign-in is the only place that passes
+    participant_username, so this backend isn't used by any login form.
+    Only inactive users with a Participant profile are authenticated.
+    """
+
+    def authenticate(self, participant_username=None,
+                     participant_password=None):
+        if participant_username is None or participant_password is None:
+            return None
+        if not verify_password(participant_username, participant_password):
+            return None
+
+        try:
+            return User.objects.get(
+                username=participant_username, is_active=False,
+                profile__participant__isnull=False)
+        except User.DoesNotExist:
+            return None
@@ -0,0 +1,191 @@
+"""Cached option tables, and the forms built from them.
+
+WORTH's options are edited in the admin maybe once a month, but
+they're used on nearly every page: GoalOptions, GoalCheckInOptions,
+the self-talk Statements and their Refutations, Avatars and Locations.
+ContentCatalog loads all of these at once, and each process keeps one,
+along with the form classes built from it, until the shared catalog
+version stamp changes. The signal handlers in worth2.main.signals bump
+the stamp whenever any of these objects are saved or deleted.
+
+Form classes can also depend on their block's content, so they're
+thrown away when the pagetree version changes too.
+"""
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+
+from worth2.main.hierarchy import get_pagetree_version
+
+
+# The models in the catalog, by (app label, model).
+CATALOG_MODELS = (
+    ('goals', 'GoalOption'),
+    ('goals', 'GoalCheckInOption'),
+    ('selftalk', 'Statement'),
+    ('selftalk', 'Refutation'),
+    ('main', 'Avatar'),
+    ('main', 'Location'),
+)
+
+
+CATALOG_VERSION_KEY = 'worth2.catalog.version'
+
+
+def get_catalog_version():
+    """Returns the current catalog version stamp.
+
+    :rtype: str
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class ContentCatalog(object):
+    """WORTH's options, in their usual order."""
+
+    def __init__(self, goal_options, goal_check_in_options, statements,
+                 refutations, avatars, locations):
+        """
+        :param goal_options: a list of GoalOption
+        :param goal_check_in_options: a list of GoalCheckInOption
+        :param statements: a list of Statement
+        :param refutations: a list of Refutation
+        :param avatars: a list of Avatar
+        :param locations: a list of Location
+        """
+        self.goal_options = {}
+        for option in goal_options:
+            self.goal_options.setdefault(option.goal_type, []).append(option)
+
+        self.goal_check_in_options = goal_check_in_options
+        self.statements = dict((s.pk, s) for s in statements)
+
+        self.refutations = dict((r.pk, r) for r in refutations)
+        self.statement_refutations = {}
+        for refutation in refutations:
+            self.statement_refutations.setdefault(
+                refutation.statement_id, []).append(refutation)
+
+        self.avatars = avatars
+        self.avatar_urls = {}
+        self.locations = locations
+
+    @classmethod
+    def build(cls):
+        GoalOption, GoalCheckInOption, Statement, Refutation, Avatar, \
+            Location = [apps.get_model(*label) for label in CATALOG_MODELS]
+        return cls(
+            list(GoalOption.objects.all()),
+            list(GoalCheckInOption.objects.all()),
+            list(Statement.objects.all()),
+            list(Refutation.objects.all()),
+            list(Avatar.objects.all()),
+            list(Location.objects.order_by('pk')))
+
+    def get_goal_options(self, goal_type):
+        return self.goal_options.get(goal_type, [])
+
+    def get_goal_check_in_options(self):
+        return self.goal_check_in_options
+
+    def get_statement(self, statement_id):
+        return self.statements.get(statement_id)
+
+    def get_refutation(self, refutation_id):
+        return self.refutations.get(refutation_id)
+
+    def get_refutations(self, statement_id):
+        return self.statement_refutations.get(statement_id, [])
+
+    def get_avatars(self):
+        return self.avatars
+
+    def get_default_avatar(self):
+        """Returns the default Avatar, or None if there isn't one."""
+        for avatar in self.avatars:
+            if avatar.is_default:
+                return avatar
+        return None
+
+    def get_avatar_url(self, avatar_id):
+        """Returns the url of this Avatar's image, or '' if there's no
+        such Avatar.
+
+        Building the url can mean a call to the storage backend, so
+        each one is only built once for this catalog.
+        """
+        url = self.avatar_urls.get(avatar_id)
+        if url is None:
+            url = ''
+            for avatar in self.avatars:
+                if avatar.pk == avatar_id:
+                    url = avatar.image.url
+                    break
+            self.avatar_urls[avatar_id] = url
+        return url
+
+    def get_default_avatar_url(self):
+        """Returns the url of the default Avatar's image, or '' if
+        there isn't one.
+        """
+        default_avatar = self.get_default_avatar()
+        if default_avatar is None:
+            return ''
+        return self.get_avatar_url(default_avatar.pk)
+
+    def get_locations(self):
+        """Returns the Locations, in the order they were added."""
+        return self.locations
+
+
+# This process's catalog and form classes, along with the catalog and
+# pagetree versions they were built for.
+_catalog = [None]
+_form_classes = {}
+_versions = [None]
+
+
+def _check_versions():
+    versions = (get_catalog_version(), get_pagetree_version())
+    if versions != _versions[0]:
+        _catalog[0] = None
+        _form_classes.clear()
+        _versions[0] = versions
+
+
+def get_content_catalog():
+    """Returns this process's ContentCatalog.
+
+    :rtype: ContentCatalog
+    """
+    _check_versions()
+    if _catalog[0] is None:
+        _catalog[0] = ContentCatalog.build()
+    return _catalog[0]
+
+
+def get_form_class(key, build):
+    """Returns the form class cached under this key.
+
+    The class is made by calling build(catalog) the first time it's
+    needed, and again whenever the catalog or pagetree changes.
+
+    :param key: a hashable key that identifies everything the class
+      depends on, besides the catalog and pagetree content.
+    :rtype: class
+    """
+    catalog = get_content_catalog()
+    form_class = _form_classes.get(key)
+    if form_class is None:
+        form_class = build(catalog)
+        _form_classes[key] = form_class
+    return form_class
@@ -0,0 +1,178 @@
+"""Enrolling a whole cohort of participants at once.
+
+Facilitators get a list of study IDs before a cohort starts. Creating
+them one at a time through ParticipantSerializer means a query for
+each username attempt and two saves per participant, so
+ParticipantImport validates the whole list first, and then creates
+all the Users, profiles and Participants with bulk inserts in a single
+transaction. Nothing is created if any row is invalid.
+"""
+import csv
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from worth2.main.auth import generate_random_usernames
+from worth2.main.models import (
+    InactiveUserProfile, Participant, cohort_id_validator,
+    study_id_regex_validator, study_id_validator
+)
+from worth2.main.utils import bulk_insert_child_rows
+
+
+class ParticipantImportRow(object):
+    def __init__(self, line, study_id, cohort_id=None):
+        """
+        :param line: the row's line number in the import, starting at 1.
+        """
+        self.line = line
+        self.study_id = study_id
+        self.cohort_id = cohort_id or None
+        self.errors = []
+
+    def validate(self):
+        validators = [('study_id', study_id_regex_validator),
+                      ('study_id', study_id_validator)]
+        if self.cohort_id is not None:
+            validators.append(('cohort_id', cohort_id_validator))
+
+        for name, validator in validators:
+            try:
+                validator(getattr(self, name))
+            except ValidationError as e:
+                self.errors.extend(e.messages)
+                # The study ID's other validator would only repeat
+                # the same problem.
+                if name == 'study_id':
+                    break
+
+    def as_dict(self):
+        return {
+            'line': self.line,
+            'study_id': self.study_id,
+            'errors': self.errors,
+        }
+
+
+class ParticipantImport(object):
+    """A list of participants to enroll."""
+
+    def __init__(self, rows):
+        """
+        :param rows: a list of ParticipantImportRow
+        """
+        self.rows = rows
+
+    @classmethod
+    def from_csv(cls, lines):
+        """Reads an import from a CSV of study IDs.
+
+        Each row has a study ID, and optionally a cohort ID in the
+        second column. Blank rows, and a header row starting with
+        "study_id", are skipped.
+
+        :param lines: an iterable of the CSV's lines, like a file.
+        """
+        rows = []
+        for line, values in enumerate(csv.reader(lines), 1):
+            values = [v.strip() for v in values]
+            if not values or not values[0]:
+                continue
+            if line == 1 and values[0].lower().replace(' ', '_') == \
+                    'study_id':
+                continue
+            cohort_id = values[1] if len(values) > 1 else None
+            rows.append(ParticipantImportRow(line, values[0], cohort_id))
+        return cls(rows)
+
+    def is_valid(self):
+        """Validates every row, along with the study IDs' uniqueness.
+
+        :rtype: bool
+        """
+        seen = {}
+        for row in self.rows:
+            row.validate()
+            if row.study_id in seen:
+                row.errors.append(
+                    'This study ID is repeated on line %d.' %
+                    seen[row.study_id])
+            else:
+                seen[row.study_id] = row.line
+
+        existing = set(Participant.objects.filter(
+            study_id__in=seen.keys()).values_list('study_id', flat=True))
+        for row in self.rows:
+            if row.study_id in existing:
+                row.errors.append(
+                    'A participant with this study ID already exists.')
+
+        return not self.errors
+
+    @property
+    def errors(self):
+        """Returns the invalid rows, as dicts for the API.
+
+        :rtype: list
+        """
+        return [row.as_dict() for row in self.rows if row.errors]
+
+    def save(self, created_by):
+        """Creates the participants, and an inactive User for each.
+
+        This should only be called after is_valid(). If another
+        participant takes one of the study IDs in the meantime, nothing
+        is created, and that row gets an error, like is_valid() would
+        have given it.
+
+        :param created_by: the facilitator enrolling these participants.
+        :returns: a queryset of the new participants, or None if a
+          study ID was taken.
+        """
+        study_ids = [row.study_id for row in self.rows]
+        try:
+            with transaction.atomic():
+                self.create(created_by)
+        except IntegrityError:
+            taken = set(Participant.objects.filter(
+                study_id__in=study_ids).values_list('study_id', flat=True))
+            if not taken:
+                raise
+            for row in self.rows:
+                if row.study_id in taken:
+                    row.errors.append(
+                        'A participant with this study ID already exists.')
+            return None
+
+        return Participant.objects.filter(study_id__in=study_ids)
+
+    def create(self, created_by):
+        usernames = generate_random_usernames(len(self.rows))
+        # Participants sign in through ParticipantBackend, so their
+        # passwords aren't hashed.
+        User.objects.bulk_create([
+            User(username=username, is_active=False,
+                 password=make_password(None))
+            for username in usernames])
+        # bulk_create() doesn't set primary keys, so they're looked up
+        # after each insert.
+        user_ids = dict(User.objects.filter(
+            username__in=usernames).values_list('username', 'pk'))
+
+        InactiveUserProfile.objects.bulk_create([
+            InactiveUserProfile(user_id=user_ids[username],
+                                created_by=created_by)
+            for username in usernames])
+        profile_ids = dict(InactiveUserProfile.objects.filter(
+            user__id__in=user_ids.values()).values_list('user_id', 'pk'))
+
+        # The parent rows already exist, so only Participant's own
+        # table is left to insert.
+        bulk_insert_child_rows([
+            Participant(
+                inactiveuserprofile_ptr_id=profile_ids[user_ids[username]],
+                user_id=user_ids[username],
+                study_id=row.study_id, cohort_id=row.cohort_id)
+            for username, row in zip(usernames, self.rows)])
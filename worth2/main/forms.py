@@ -1,6 +1,8 @@
 from django import forms
+from django.utils.encoding import force_text
 
-from worth2.main.models import Location, Participant
+from worth2.main.catalog import get_content_catalog
+from worth2.main.models import Participant
 
 
 class SignInParticipantForm(forms.Form):
@@ -14,11 +16,8 @@ class SignInParticipantForm(forms.Form):
             is_archived=False).order_by('study_id'),
     )
 
-    participant_location = forms.ModelChoiceField(
-        label='Location',
-        empty_label='Choose a Location',
-        queryset=Location.objects.order_by('name'),
-    )
+    # See full definition for this field in self.__init__()
+    participant_location = forms.ChoiceField()
 
     participant_destination = forms.ChoiceField(
         label='Take participant to:',
@@ -62,3 +61,57 @@ class SignInParticipantForm(forms.Form):
             required=False,
             choices=cohort_choices,
         )
+
+        locations = sorted(get_content_catalog().get_locations(),
+                           key=lambda location: location.name)
+        self.fields['participant_location'] = CatalogChoiceField(
+            locations,
+            label='Location',
+            empty_label='Choose a Location',
+        )
+
+
+class CatalogChoiceField(forms.ChoiceField):
+    """Like ModelChoiceField, for a list of objects that's already loaded.
+
+    ModelChoiceField runs its queryset whenever it's rendered or
+    cleaned. This field's choices come from a list instead, like the
+    options in a ContentCatalog, and it cleans a submitted pk to the
+    matching object.
+    """
+
+    default_error_messages = forms.ModelChoiceField.default_error_messages
+
+    def __init__(self, objects, empty_label='---------', *args, **kwargs):
+        self.objects = dict((obj.pk, obj) for obj in objects)
+        choices = [('', empty_label)] + [
+            (obj.pk, force_text(obj)) for obj in objects]
+        super(CatalogChoiceField, self).__init__(
+            choices=choices, *args, **kwargs)
+
+    def prepare_value(self, value):
+        if hasattr(value, '_meta'):
+            return value.pk
+        return super(CatalogChoiceField, self).prepare_value(value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice')
+
+    def validate(self, value):
+        # to_python() has already checked that the value is a choice.
+        forms.Field.validate(self, value)
+
+    def has_changed(self, initial, data):
+        try:
+            data = self.to_python(data)
+        except forms.ValidationError:
+            return True
+        return force_text(self.prepare_value(initial) or '') != \
+            force_text(self.prepare_value(data) or '')
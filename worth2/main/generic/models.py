@@ -2,6 +2,9 @@ from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db import models
 from pagetree.models import Hierarchy, UserPageVisit
+from worth2.main.hierarchy import (
+    get_hierarchy_snapshot, get_hierarchy_snapshot_by_id
+)
 from worth2.main.utils import get_verbose_section_name
 
 
@@ -66,7 +69,10 @@ class BaseUserProfile(models.Model):
     def next_location_verbose(self):
         last_location = self.last_location()
         if last_location:
-            return get_verbose_section_name(last_location.get_next())
+            snapshot = get_hierarchy_snapshot_by_id(
+                last_location.hierarchy_id)
+            return get_verbose_section_name(
+                snapshot.get_next(last_location.id))
         else:
             return None
 
@@ -74,11 +80,14 @@ class BaseUserProfile(models.Model):
         return self.percent_complete_hierarchy()
 
     def percent_complete_hierarchy(self):
-        hierarchy = Hierarchy.get_hierarchy('main')
-        pages = len(hierarchy.get_root().get_descendants())
-        visits = UserPageVisit.objects.filter(user=self.user).count()
-
-        if pages:
-            return int(visits / float(pages) * 100)
-        else:
+        snapshot = get_hierarchy_snapshot()
+        pages = snapshot.page_count
+        if not pages:
             return 0
+
+        # Like page_count, only the sections below the root are counted.
+        visits = UserPageVisit.objects.filter(
+            user=self.user,
+            section__id__in=snapshot.get_descendant_ids(
+                snapshot.root.id)).count()
+        return int(visits / float(pages) * 100)
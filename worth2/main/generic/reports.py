@@ -0,0 +1,20 @@
+from pagetree.reports import StandaloneReportColumn
+
+
+class BulkStandaloneReportColumn(StandaloneReportColumn):
+    """A StandaloneReportColumn that can read from preloaded report data.
+
+    ``value_func`` is called with a user, just like in pagetree's
+    StandaloneReportColumn. ``bulk_value_func`` is called with a user
+    and a ParticipantReportData instance, and should answer the same
+    value without touching the database.
+    """
+
+    def __init__(self, name, group, value_type, description, value_func,
+                 bulk_value_func):
+        super(BulkStandaloneReportColumn, self).__init__(
+            name, group, value_type, description, value_func)
+        self.bulk_value_func = bulk_value_func
+
+    def bulk_user_value(self, user, data):
+        return self.bulk_value_func(user, data)
@@ -0,0 +1,453 @@
+"""A compiled, in-memory snapshot of a pagetree hierarchy.
+
+Walking the treebeard tree through the database is slow, and WORTH's
+content rarely changes. So each process keeps a HierarchySnapshot that
+answers the common tree lookups without any queries, along with an
+index of each section's pageblocks and an index of the quizzes by css
+class, and rebuilds them when the shared pagetree version stamp
+changes. The signal handlers in worth2.main.signals bump the stamp
+whenever pagetree content is edited.
+"""
+from collections import defaultdict, namedtuple
+import re
+import uuid
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from pagetree.models import Hierarchy, PageBlock, Section
+
+
+PAGETREE_VERSION_KEY = 'worth2.pagetree.version'
+
+
+def get_pagetree_version():
+    """Returns the current pagetree version stamp.
+
+    :rtype: str
+    """
+    version = cache.get(PAGETREE_VERSION_KEY)
+    if version is None:
+        # The stamp was never set, or it was evicted. Either way,
+        # start a new version.
+        cache.add(PAGETREE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(PAGETREE_VERSION_KEY)
+    return version
+
+
+def bump_pagetree_version():
+    cache.set(PAGETREE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def prefetch_blocks(pageblocks):
+    """Returns a list of these pageblocks, with their blocks loaded.
+
+    A pageblock's block is a generic foreign key, so block() and
+    render() would otherwise cost a query for each pageblock, every
+    time. Here they're loaded with one query for each content type.
+
+    :param pageblocks: a PageBlock queryset
+    :rtype: list
+    """
+    return list(pageblocks.select_related(
+        'content_type').prefetch_related('content_object'))
+
+
+def get_section_pageblocks(section):
+    """Returns the section's pageblocks in order, with their blocks
+    loaded.
+
+    :rtype: list
+    """
+    return prefetch_blocks(section.pageblock_set.all())
+
+
+BlockEntry = namedtuple(
+    'BlockEntry', 'pageblock_id app_label model object_id needs_submit')
+
+
+class SectionBlockIndex(object):
+    """A section's pageblocks, grouped by content type.
+
+    Only ids are kept here, so that stale model instances are never
+    shared between requests. Looking up the first block of a type that
+    isn't on the page costs no queries.
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: a BlockEntry for each of the section's
+          pageblocks, in order.
+        """
+        self.entries = tuple(entries)
+        self._by_type = {}
+        for entry in entries:
+            self._by_type.setdefault(
+                (entry.app_label, entry.model), []).append(
+                entry.pageblock_id)
+
+    @staticmethod
+    def load_entries(pageblocks):
+        """Returns a dict of section id -> [BlockEntry] for these
+        pageblocks.
+        """
+        entries = defaultdict(list)
+        for pageblock in prefetch_blocks(pageblocks):
+            block = pageblock.block()
+            needs_submit = hasattr(block, 'needs_submit') and \
+                block.needs_submit()
+            entries[pageblock.section_id].append(BlockEntry(
+                pageblock.pk,
+                pageblock.content_type.app_label,
+                pageblock.content_type.model,
+                pageblock.object_id,
+                needs_submit))
+        return entries
+
+    @classmethod
+    def build(cls, section_id):
+        entries = cls.load_entries(
+            PageBlock.objects.filter(section__id=section_id))
+        return cls(entries[section_id])
+
+    def get_pageblock_ids(self, app_label, model):
+        return tuple(self._by_type.get((app_label, model), ()))
+
+    def get_first_block(self, app_label, model, blocktest=None):
+        """Returns the first PageBlock of this type, or None.
+
+        If blocktest is passed in, the first PageBlock that passes
+        that test is returned instead.
+        """
+        ids = self.get_pageblock_ids(app_label, model)
+        if not ids:
+            return None
+
+        if not hasattr(blocktest, '__call__'):
+            return PageBlock.objects.filter(pk=ids[0]).first()
+
+        pageblocks = PageBlock.objects.filter(pk__in=ids)
+        for pageblock in pageblocks:
+            if blocktest(pageblock):
+                return pageblock
+        return None
+
+    def has_responses(self):
+        """Returns True if any of the blocks need to be submitted."""
+        return any(entry.needs_submit for entry in self.entries)
+
+
+class HierarchySnapshot(object):
+    """The structure of one hierarchy, compiled for fast lookups.
+
+    The sections are kept in pre-order, which is the order of the
+    pagetree's depth-first traversal. Lists of ids are stored as
+    tuples, so callers can't change them.
+    """
+
+    def __init__(self, hierarchy, sections, version):
+        """
+        :param sections: all the hierarchy's sections, in pre-order.
+        """
+        self.hierarchy = hierarchy
+        self.version = version
+        self.sections = sections
+        self.root = sections[0] if sections else None
+
+        self._block_indexes = {}
+        self._all_block_indexes = False
+        self._by_id = {}
+        self._by_slug = {}
+        self._index = {}
+        self._urls = {}
+        children = {}
+        descendants = {}
+        modules = {}
+
+        ancestors = []
+        for idx, section in enumerate(sections):
+            while ancestors and ancestors[-1].depth >= section.depth:
+                ancestors.pop()
+
+            self._by_id[section.id] = section
+            self._by_slug.setdefault(section.slug, section)
+            self._index[section.id] = idx
+            children[section.id] = []
+            descendants[section.id] = []
+
+            # This matches Section.get_absolute_url()
+            slugs = [a.slug for a in ancestors[1:]] + [section.slug]
+            self._urls[section.id] = '%s%s/' % (
+                hierarchy.get_absolute_url(), '/'.join(slugs))
+
+            if ancestors:
+                children[ancestors[-1].id].append(section.id)
+            for ancestor in ancestors:
+                descendants[ancestor.id].append(section.id)
+
+            # Modules are the sections at depth 2.
+            if section.depth == 2:
+                modules[section.id] = section
+            elif section.depth > 2:
+                modules[section.id] = ancestors[1]
+
+            ancestors.append(section)
+
+        self._children = dict(
+            (k, tuple(v)) for k, v in children.items())
+        self._descendant_ids = dict(
+            (k, tuple(v)) for k, v in descendants.items())
+        self._modules = modules
+        self._module_numbers = dict(
+            (section_id, self.parse_module_number(module))
+            for section_id, module in modules.items())
+
+    @classmethod
+    def build(cls, hierarchy, version):
+        sections = list(Section.objects.filter(
+            hierarchy=hierarchy).order_by('path'))
+        return cls(hierarchy, sections, version)
+
+    @staticmethod
+    def parse_module_number(module):
+        match = re.match(r'session-(\d)', module.slug)
+        if match:
+            return int(match.groups()[0])
+        else:
+            return -1
+
+    @property
+    def page_count(self):
+        """The number of sections, not counting the root."""
+        return max(len(self.sections) - 1, 0)
+
+    def get_section(self, section_id):
+        return self._by_id.get(section_id)
+
+    def get_section_by_slug(self, slug):
+        """Like Section.objects.get(slug=slug), within this hierarchy.
+
+        :raises: Section.DoesNotExist
+        """
+        try:
+            return self._by_slug[slug]
+        except KeyError:
+            raise Section.DoesNotExist(
+                'No section with the slug "%s" in %s.' % (
+                    slug, self.hierarchy.name))
+
+    def get_children(self, section_id):
+        return [self._by_id[i] for i in self._children.get(section_id, ())]
+
+    def get_modules(self):
+        if self.root is None:
+            return []
+        return self.get_children(self.root.id)
+
+    def get_descendant_ids(self, section_id):
+        """Returns a tuple of the section's descendants' ids, in
+        pre-order.
+        """
+        return self._descendant_ids.get(section_id, ())
+
+    def get_module(self, section_id):
+        """Returns the module that this section is in, or None for the
+        root.
+        """
+        return self._modules.get(section_id)
+
+    def get_module_number(self, section_id):
+        """Returns the module number that this section is in, or -1."""
+        return self._module_numbers.get(section_id, -1)
+
+    def get_block_index(self, section_id):
+        """Returns the SectionBlockIndex for this section.
+
+        Each section's index is built the first time it's needed.
+        """
+        index = self._block_indexes.get(section_id)
+        if index is None:
+            index = SectionBlockIndex.build(section_id)
+            self._block_indexes[section_id] = index
+        return index
+
+    def get_all_block_indexes(self):
+        """Returns a dict of section id -> SectionBlockIndex for every
+        section in the hierarchy.
+
+        The missing indexes are all built at once.
+        """
+        if not self._all_block_indexes:
+            entries = SectionBlockIndex.load_entries(PageBlock.objects.filter(
+                section__hierarchy=self.hierarchy))
+            for section in self.sections:
+                if section.id not in self._block_indexes:
+                    self._block_indexes[section.id] = SectionBlockIndex(
+                        entries[section.id])
+            self._all_block_indexes = True
+        return self._block_indexes
+
+    def get_absolute_url(self, section_id):
+        return self._urls.get(section_id)
+
+    def get_toc(self, section_id, deep=False):
+        """The table of contents below this section.
+
+        Returns a list of (section, has_children, closing) tuples in
+        pre-order, where closing is the number of nested lists that
+        end after that section. Without deep, only the children are
+        listed.
+        """
+        section = self.get_section(section_id)
+        if deep:
+            ids = self.get_descendant_ids(section_id)
+        else:
+            ids = self._children.get(section_id, ())
+
+        toc = []
+        for idx, child_id in enumerate(ids):
+            child = self._by_id[child_id]
+            has_children = deep and bool(self._children[child_id])
+            next_depth = section.depth + 1
+            if idx + 1 < len(ids):
+                next_depth = self._by_id[ids[idx + 1]].depth
+            closing = 0
+            if not has_children:
+                closing = max(child.depth - next_depth, 0)
+            toc.append((child, has_children, closing))
+        return toc
+
+    def get_next(self, section_id):
+        """The next section in the depth-first traversal, like
+        Section.get_next().
+        """
+        idx = self._index.get(section_id)
+        if idx is None or idx + 1 >= len(self.sections):
+            return None
+        return self.sections[idx + 1]
+
+    def get_previous(self, section_id):
+        """The previous section in the depth-first traversal, like
+        Section.get_previous(). This never returns the root.
+        """
+        idx = self._index.get(section_id)
+        if idx is None or idx < 2:
+            return None
+        return self.sections[idx - 1]
+
+
+class CssClassQuizIndex(object):
+    """The quizzes marked with each css class, by module.
+
+    A pageblock's css_extra is split into class tokens, so looking up
+    "quiz" doesn't match a block marked "i-am-worth-it-quiz".
+    """
+
+    def __init__(self, entries):
+        """
+        :param entries: a list of (quiz id, module number, css_extra)
+          tuples, in pageblock order.
+        """
+        self._quiz_ids = {}
+        for quiz_id, module, css_extra in entries:
+            for token in set(css_extra.split()):
+                self._quiz_ids.setdefault(token, []).append(quiz_id)
+                self._quiz_ids.setdefault(
+                    (token, module), []).append(quiz_id)
+
+        self._quiz_ids = dict(
+            (k, tuple(v)) for k, v in self._quiz_ids.items())
+
+    @classmethod
+    def build(cls):
+        quiz_type = ContentType.objects.get_by_natural_key(
+            'quizblock', 'quiz')
+        pageblocks = PageBlock.objects.filter(
+            content_type=quiz_type).exclude(css_extra='').exclude(
+            css_extra__isnull=True).values_list(
+            'object_id', 'section_id', 'section__hierarchy_id', 'css_extra')
+
+        entries = []
+        for quiz_id, section_id, hierarchy_id, css_extra in pageblocks:
+            snapshot = get_hierarchy_snapshot_by_id(hierarchy_id)
+            entries.append((
+                quiz_id, snapshot.get_module_number(section_id), css_extra))
+        return cls(entries)
+
+    def get_quiz_ids(self, css_class, module=None):
+        """Returns the ids of the quizzes with this css class, in
+        pageblock order.
+
+        If module is passed in, only the quizzes in that module are
+        returned.
+        """
+        if module is None:
+            return self._quiz_ids.get(css_class, ())
+        return self._quiz_ids.get((css_class, module), ())
+
+
+# This process's snapshots, by hierarchy id, along with the pagetree
+# version they were built for.
+_snapshots = {}
+_hierarchy_ids = {}
+_snapshots_version = [None]
+_css_class_quiz_index = [None]
+
+
+def _check_version():
+    version = get_pagetree_version()
+    if version != _snapshots_version[0]:
+        _snapshots.clear()
+        _hierarchy_ids.clear()
+        _css_class_quiz_index[0] = None
+        _snapshots_version[0] = version
+    return version
+
+
+def get_hierarchy_snapshot(name='main'):
+    """Returns the snapshot of the named hierarchy.
+
+    Like Hierarchy.get_hierarchy, the hierarchy is created if it
+    doesn't exist.
+
+    :rtype: HierarchySnapshot
+    """
+    _check_version()
+    hierarchy_id = _hierarchy_ids.get(name)
+    if hierarchy_id is None:
+        hierarchy_id = Hierarchy.get_hierarchy(name).id
+        _hierarchy_ids[name] = hierarchy_id
+    return get_hierarchy_snapshot_by_id(hierarchy_id)
+
+
+def get_hierarchy_snapshot_by_id(hierarchy_id):
+    """Returns the snapshot of the hierarchy with this id.
+
+    :rtype: HierarchySnapshot
+    """
+    version = _check_version()
+    snapshot = _snapshots.get(hierarchy_id)
+    if snapshot is None:
+        hierarchy = Hierarchy.objects.get(pk=hierarchy_id)
+        snapshot = HierarchySnapshot.build(hierarchy, version)
+        _snapshots[hierarchy_id] = snapshot
+    return snapshot
+
+
+def get_section_block_index(section):
+    """Returns the SectionBlockIndex for this section.
+
+    :rtype: SectionBlockIndex
+    """
+    snapshot = get_hierarchy_snapshot_by_id(section.hierarchy_id)
+    return snapshot.get_block_index(section.id)
+
+
+def get_css_class_quiz_index():
+    """Returns the index of the quizzes marked with each css class.
+
+    :rtype: CssClassQuizIndex
+    """
+    _check_version()
+    if _css_class_quiz_index[0] is None:
+        _css_class_quiz_index[0] = CssClassQuizIndex.build()
+    return _css_class_quiz_index[0]
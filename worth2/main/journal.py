@@ -0,0 +1,252 @@
+"""The data shown in a participant's session journals.
+
+The journal pulls goals, quiz responses and supporters out of all five
+sessions. JournalSnapshot builds every session's journal for a
+participant at once, with one query for each kind of data, and caches
+it under a per-user version stamp, along with the pagetree, catalog
+and report content versions. The signal handlers in worth2.main.signals
+bump the stamp whenever the participant's goals, quiz submissions or
+supporters change, the catalog version whenever a goal option is
+edited, and the report content version whenever a quiz question or
+answer is edited.
+"""
+from collections import namedtuple
+import uuid
+
+from django.core.cache import cache
+from pagetree.models import Section
+from quizblock.models import Answer, Response
+
+from worth2.goals.models import GoalSettingBlock, GoalSettingResponse
+from worth2.main.catalog import get_catalog_version
+from worth2.main.hierarchy import get_css_class_quiz_index
+from worth2.main.reports import get_report_content_version
+from worth2.ssnm.models import Supporter
+
+
+# A goal setting response, as shown in the journal.
+JournalGoal = namedtuple('JournalGoal', 'option other_text text')
+
+# A quiz response, along with the label of its matching answer.
+JournalResponse = namedtuple('JournalResponse', 'question value answer')
+
+
+# Each session's goal types, by context variable name.
+SESSION_GOALS = {
+    1: (('goals_services_responses', 'services'),),
+    2: (('goals_risk_responses', 'risk reduction'),
+        ('goals_services_responses', 'services')),
+    3: (('goals_support_responses', 'social support'),
+        ('goals_risk_responses', 'risk reduction'),
+        ('goals_services_responses', 'services')),
+    4: (('goals_support_responses', 'social support'),
+        ('goals_risk_responses', 'risk reduction'),
+        ('goals_services_responses', 'services')),
+    5: (('goals_risk_responses', 'risk reduction'),),
+}
+
+# The css classes of each session's quizzes.
+SESSION_QUIZZES = {
+    1: (),
+    2: ('i-am-worth-it-quiz', 'post-video-quiz', 'rate-my-risk'),
+    3: ('i-am-worth-it-quiz',),
+    4: ('i-am-worth-it-quiz', 'safety-plan-quiz'),
+    5: ('i-am-worth-it-quiz',),
+}
+
+SESSION_TITLES = {
+    1: 'Let\'s Talk: Sister to Sister',
+    2: 'What\'s the 411?',
+    3: 'Protecting Myself. Protecting my community.',
+    4: 'Staying Safe and Strong',
+    5: 'Because I am WORTH it!',
+}
+
+
+def journal_version_key(user_id):
+    return 'worth2.journal.%d.version' % user_id
+
+
+def get_journal_version(user_id):
+    key = journal_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_journal_version(user_id):
+    cache.set(journal_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def find_goal_blocks(snapshot):
+    """Returns a dict of (module number, goal type) -> the id of the
+    first GoalSettingBlock of that type in the module.
+
+    This finds the same blocks as GoalSettingResponseManager's
+    find_by_module(): the module's children are searched in order,
+    and then the module itself.
+    """
+    goal_types = dict(GoalSettingBlock.objects.values_list('pk', 'goal_type'))
+    indexes = snapshot.get_all_block_indexes()
+
+    blocks = {}
+    for module_num in SESSION_TITLES.keys():
+        try:
+            module = snapshot.get_section_by_slug('session-%d' % module_num)
+        except Section.DoesNotExist:
+            continue
+
+        sections = snapshot.get_children(module.id) + [module]
+        for section in sections:
+            for entry in indexes[section.id].entries:
+                if (entry.app_label, entry.model) != \
+                        ('goals', 'goalsettingblock'):
+                    continue
+                blocks.setdefault(
+                    (module_num, goal_types.get(entry.object_id)),
+                    entry.object_id)
+    return blocks
+
+
+def find_answer(answers, response):
+    """Like Response.answer(), among a question's answers."""
+    for answer in answers:
+        if response.value in (answer.value, answer.label):
+            return answer
+    return None
+
+
+class JournalSnapshot(object):
+    """A participant's journals for all the sessions."""
+
+    def __init__(self, sessions):
+        """
+        :param sessions: a dict of session number -> the context for
+          that session's journal.
+        """
+        self.sessions = sessions
+
+    @staticmethod
+    def load_goals(snapshot, user):
+        """Returns a dict of (module number, goal type) -> the user's
+        JournalGoals for that module's goal setting block.
+        """
+        goal_blocks = find_goal_blocks(snapshot)
+        by_block = {}
+        for r in GoalSettingResponse.objects.filter(
+                user=user,
+                goal_setting_block__id__in=goal_blocks.values()
+        ).select_related('option').order_by('pk'):
+            by_block.setdefault(r.goal_setting_block_id, []).append(
+                JournalGoal(unicode(r.option), r.other_text, r.text))
+
+        return dict(
+            (key, by_block.get(block_id, []))
+            for key, block_id in goal_blocks.items())
+
+    @staticmethod
+    def load_quiz_responses(quiz_index, user):
+        """Returns a dict of (module number, css class) -> the user's
+        JournalResponses for the journal's quizzes, in quiz order.
+        """
+        quiz_ids = set()
+        for session_num, classes in SESSION_QUIZZES.items():
+            for css_class in classes:
+                quiz_ids.update(
+                    quiz_index.get_quiz_ids(css_class, session_num))
+
+        responses = list(Response.objects.filter(
+            submission__user=user,
+            question__quiz__id__in=quiz_ids).select_related('question'))
+        answers = {}
+        for answer in Answer.objects.filter(question__id__in=set(
+                r.question_id for r in responses)):
+            answers.setdefault(answer.question_id, []).append(answer)
+
+        by_quiz = {}
+        for r in responses:
+            answer = find_answer(answers.get(r.question_id, []), r)
+            by_quiz.setdefault(r.question.quiz_id, []).append(
+                JournalResponse(
+                    unicode(r.question), r.value,
+                    unicode(answer) if answer else None))
+
+        by_class = {}
+        for session_num, classes in SESSION_QUIZZES.items():
+            for css_class in classes:
+                by_class[(session_num, css_class)] = [
+                    r for quiz_id in quiz_index.get_quiz_ids(
+                        css_class, session_num)
+                    for r in by_quiz.get(quiz_id, [])]
+        return by_class
+
+    @classmethod
+    def build(cls, snapshot, user):
+        goals = cls.load_goals(snapshot, user)
+        quizzes = cls.load_quiz_responses(get_css_class_quiz_index(), user)
+        supporters = list(Supporter.objects.filter(user=user))
+
+        sessions = {}
+        for session_num in SESSION_TITLES.keys():
+            ctx = {'session_title': SESSION_TITLES[session_num]}
+            for name, goal_type in SESSION_GOALS[session_num]:
+                ctx[name] = goals.get((session_num, goal_type), [])
+
+            if session_num > 1:
+                ctx['i_am_worth_it_responses'] = \
+                    quizzes[(session_num, 'i-am-worth-it-quiz')]
+
+            if session_num == 2:
+                reflection = quizzes[(2, 'post-video-quiz')]
+                ctx.update({
+                    'reflection_big_issues': [
+                        r for r in reflection if r.value == '1'],
+                    'reflection_issues': [
+                        r for r in reflection if r.value in ('1', '2')],
+                    'rate_my_risk_response': (
+                        quizzes[(2, 'rate-my-risk')] or [None])[0],
+                })
+            elif session_num == 3:
+                ctx['supporters'] = supporters
+            elif session_num == 4:
+                safety_plan = quizzes[(4, 'safety-plan-quiz')]
+                ctx.update({
+                    'mylength': len(safety_plan),
+                    'safety_plan_quiz_responses': safety_plan,
+                })
+            sessions[session_num] = ctx
+
+        return cls(sessions)
+
+    @classmethod
+    def load(cls, snapshot, user):
+        key = 'worth2.journal.%d.%s.%s.%s.%s' % (
+            user.id, get_journal_version(user.id), snapshot.version,
+            get_catalog_version(), get_report_content_version())
+        journal = cache.get(key)
+        if journal is None:
+            journal = cls.build(snapshot, user)
+            cache.set(key, journal)
+        return journal
+
+    def get_session(self, session_num):
+        """Returns the context for this session's journal, or None if
+        there's no such session.
+
+        :rtype: dict
+        """
+        ctx = self.sessions.get(session_num)
+        if ctx is None:
+            return None
+        return dict(ctx)
+
+
+def get_journal_snapshot(user, snapshot):
+    """Returns the user's journals, built from the snapshot's
+    hierarchy.
+
+    :rtype: JournalSnapshot
+    """
+    return JournalSnapshot.load(snapshot, user)
@@ -0,0 +1,73 @@
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from worth2.main.auth import generate_password, generate_random_username
+from worth2.main.models import Participant
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare authenticating a participant with a hashed ' + \
+        'password and with ParticipantBackend. Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sign-ins', type=int, default=100,
+            help='The number of sign-ins to time with each backend.')
+
+    def time_sign_ins(self, count, **credentials):
+        started = time.time()
+        for i in xrange(count):
+            user = authenticate(**credentials)
+            if user is None:
+                raise CommandError('The participant wasn\'t authenticated.')
+        return (time.time() - started) / count * 1000
+
+    @staticmethod
+    def unused_study_id():
+        """Returns a study ID that no participant has, in the format of
+        an enrollment at location 99 on Jan 1 2015.
+        """
+        prefix = '15010199'
+        taken = set(Participant.objects.filter(
+            study_id__startswith=prefix).values_list('study_id', flat=True))
+        for hour in xrange(24):
+            for minute in xrange(60):
+                study_id = '%s%02d%02d' % (prefix, hour, minute)
+                if study_id not in taken:
+                    return study_id
+        raise CommandError('No unused study ID was found.')
+
+    def benchmark(self, count):
+        user = User(username=generate_random_username(), is_active=False)
+        password = generate_password(user.username)
+        user.set_password(password)
+        user.save()
+        Participant.objects.create(
+            user=user, study_id=self.unused_study_id())
+
+        hashed = self.time_sign_ins(
+            count, username=user.username, password=password)
+        hmac_only = self.time_sign_ins(
+            count, participant_username=user.username,
+            participant_password=password)
+
+        self.stdout.write(
+            '%d sign-ins: hashed password %.2fms, '
+            'ParticipantBackend %.2fms per sign-in' % (
+                count, hashed, hmac_only))
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(options.get('sign_ins'))
+                raise Rollback()
+        except Rollback:
+            pass
@@ -0,0 +1,100 @@
+from datetime import timedelta
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from pagetree.models import Hierarchy, UserPageVisit
+
+from worth2.main.reports import ParticipantReport, ParticipantReportData
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-participant and batch time spent ' + \
+        'computations on generated participants. Nothing is saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--participants', type=int, nargs='+', default=[1000, 10000],
+            help='The participant counts to benchmark.')
+        parser.add_argument(
+            '--hierarchy', default='main',
+            help='The name of the hierarchy to visit.')
+
+    def create_participants(self, count, sections):
+        """Create inactive users that have visited the sections.
+
+        The time between visits cycles through 3, 11 and 40 minutes,
+        so both sides of the capping rule are exercised.
+        """
+        start = timezone.now() - timedelta(days=30)
+        first_id = (User.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0) + 1
+        User.objects.bulk_create([
+            User(id=first_id + i, username='benchmark-%d' % i,
+                 is_active=False)
+            for i in xrange(count)])
+
+        UserPageVisit.objects.bulk_create([
+            UserPageVisit(user_id=user_id, section=section, status='complete')
+            for user_id in xrange(first_id, first_id + count)
+            for section in sections])
+
+        # first_visit is set automatically on creation, so it's moved
+        # back afterwards, one section at a time.
+        visit_time = start
+        for j, section in enumerate(sections):
+            visit_time += timedelta(minutes=(3, 11, 40)[j % 3])
+            UserPageVisit.objects.filter(
+                user__id__gte=first_id, section=section).update(
+                first_visit=visit_time)
+
+        return list(User.objects.filter(id__gte=first_id).order_by('id'))
+
+    def benchmark(self, hierarchy, count):
+        report = ParticipantReport(hierarchy)
+        modules = report.modules()
+        users = self.create_participants(
+            count, hierarchy.get_root().get_descendants())
+
+        started = time.time()
+        per_user = [[report.time_spent(user, module) for module in modules]
+                    for user in users]
+        per_user_seconds = time.time() - started
+
+        started = time.time()
+        batch = []
+        for i in xrange(0, len(users), report.chunk_size):
+            chunk = users[i:i + report.chunk_size]
+            data = ParticipantReportData(report, chunk)
+            batch += [[data.time_spent(user, module) for module in modules]
+                      for user in chunk]
+        batch_seconds = time.time() - started
+
+        if per_user != batch:
+            raise CommandError(
+                'The batch results differ from the per-participant ones.')
+
+        self.stdout.write(
+            '%d participants: per-participant %.2fs, batch %.2fs' % (
+                count, per_user_seconds, batch_seconds))
+
+    def handle(self, *args, **options):
+        hierarchy = Hierarchy.objects.filter(
+            name=options.get('hierarchy')).first()
+        if hierarchy is None:
+            raise CommandError(
+                'Hierarchy "%s" not found.' % options.get('hierarchy'))
+
+        for count in options.get('participants'):
+            try:
+                with transaction.atomic():
+                    self.benchmark(hierarchy, count)
+                    raise Rollback()
+            except Rollback:
+                pass
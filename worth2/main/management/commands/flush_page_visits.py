@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from worth2.main.visits import flush_pending_visits
+
+
+class Command(BaseCommand):
+    help = 'Save the page visit times that were queued to be saved ' + \
+        'later. Run this every few minutes.'
+
+    def handle(self, *args, **options):
+        count = flush_pending_visits()
+        self.stdout.write('Updated %d page visits.' % count)
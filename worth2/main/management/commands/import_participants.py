@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from worth2.main.enrollment import ParticipantImport
+
+
+class Command(BaseCommand):
+    help = 'Create participants from a CSV of study IDs, with an ' + \
+        'optional cohort ID in the second column.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument(
+            '--created-by', required=True,
+            help='The username of the facilitator enrolling these ' +
+            'participants.')
+
+    def handle(self, *args, **options):
+        created_by = User.objects.filter(
+            username=options.get('created_by')).first()
+        if created_by is None:
+            raise CommandError(
+                'User "%s" not found.' % options.get('created_by'))
+
+        with open(options.get('csv_file'), 'rU') as f:
+            participant_import = ParticipantImport.from_csv(f)
+
+        if not participant_import.rows:
+            raise CommandError('No study IDs were found.')
+        if not participant_import.is_valid():
+            self.invalid(participant_import)
+
+        participants = participant_import.save(created_by)
+        if participants is None:
+            self.invalid(participant_import)
+        self.stdout.write('Created %d participants.' % participants.count())
+
+    def invalid(self, participant_import):
+        for row in participant_import.errors:
+            self.stderr.write('Line %d (%s): %s' % (
+                row['line'], row['study_id'], ' '.join(row['errors'])))
+        raise CommandError(
+            '%d rows are invalid, so no participants were created.' %
+            len(participant_import.errors))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from worth2.main.models import ReportJob
+from worth2.main.reports import run_report_job
+
+
+class Command(BaseCommand):
+    help = 'Build the CSV artifacts for any pending report jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true', default=False,
+            help='Keep polling for new jobs instead of exiting.')
+        parser.add_argument(
+            '--interval', type=int, default=10,
+            help='Seconds to wait between polls when looping.')
+
+    def process_pending_jobs(self):
+        for job in ReportJob.objects.pending():
+            # Claim the job, unless another worker got to it first.
+            claimed = ReportJob.objects.filter(
+                pk=job.pk, status='pending').update(
+                status='running', updated_at=timezone.now())
+            if not claimed:
+                continue
+
+            self.stdout.write('Building %s' % job)
+            try:
+                job = run_report_job(job)
+            except Exception as e:
+                self.stderr.write('Report job %d failed: %s' % (job.pk, e))
+            else:
+                if job.is_complete():
+                    self.stdout.write('Wrote %d rows to %s' % (
+                        job.rows_written, job.filename))
+                else:
+                    self.stderr.write(
+                        'Report job %d was abandoned: %s' % (
+                            job.pk, job.error))
+
+    def handle(self, *args, **options):
+        self.process_pending_jobs()
+        while options.get('loop'):
+            time.sleep(options.get('interval'))
+            self.process_pending_jobs()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from pagetree.models import UserPageVisit
+
+from worth2.main.models import ProgressSummary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the progress summaries of all the users who have ' + \
+        'visited pages.'
+
+    def handle(self, *args, **options):
+        # Existing summaries are rebuilt too, in case their visits were
+        # removed without sending signals.
+        user_ids = set(UserPageVisit.objects.values_list(
+            'user_id', flat=True).distinct())
+        user_ids.update(ProgressSummary.objects.values_list(
+            'user_id', flat=True))
+
+        for user_id in sorted(user_ids):
+            with transaction.atomic():
+                ProgressSummary.objects.rebuild(user_id)
+
+        self.stdout.write('Rebuilt %d progress summaries.' % len(user_ids))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from pagetree.models import Hierarchy
+
+from worth2.main.reports import ParticipantReport, ParticipantReportRowStore
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized values report rows, or check them ' + \
+        'for drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hierarchy', default='main',
+            help='The name of the hierarchy to build rows for.')
+        parser.add_argument(
+            '--check', action='store_true', default=False,
+            help='Compare the stored rows to freshly computed ones ' +
+            'instead of rebuilding them.')
+
+    def handle(self, *args, **options):
+        hierarchy = Hierarchy.objects.filter(
+            name=options.get('hierarchy')).first()
+        if hierarchy is None:
+            raise CommandError(
+                'Hierarchy "%s" not found.' % options.get('hierarchy'))
+
+        report = ParticipantReport(hierarchy)
+        store = ParticipantReportRowStore(
+            report, report.value_columns([hierarchy]))
+
+        if not options.get('check'):
+            count = store.rebuild()
+            self.stdout.write('Rebuilt %d report rows.' % count)
+            return
+
+        stale = len(store.stale_users())
+        drifted = store.drift()
+        self.stdout.write('%d report rows are stale or missing.' % stale)
+        if drifted:
+            raise CommandError(
+                '%d report rows have drifted, for users: %s' % (
+                    len(drifted), ', '.join(str(i) for i in drifted)))
+        self.stdout.write('No drift found.')
@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from worth2.main.auth import get_user_role
+
+
+class UserRoleMiddleware(object):
+    """Attaches the user's UserRole to each request, as request.role.
+
+    The role is resolved the first time it's used, so this has to come
+    after any middleware that sets request.user, like
+    AuthenticationMiddleware and ImpersonateMiddleware.
+    """
+
+    def process_request(self, request):
+        request.role = SimpleLazyObject(lambda: get_user_role(request.user))
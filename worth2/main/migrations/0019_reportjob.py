@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagetree', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0018_auto_20150410_1355'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('report_type', models.CharField(default=b'keys', max_length=255, choices=[(b'facilitators', b'Facilitator Key'), (b'locations', b'Location Key'), (b'keys', b'Intervention Key'), (b'values', b'Intervention Values')])),
+                ('data_version', models.CharField(max_length=255, db_index=True)),
+                ('status', models.CharField(default=b'pending', max_length=255, db_index=True, choices=[(b'pending', b'Pending'), (b'running', b'Running'), (b'complete', b'Complete'), (b'failed', b'Failed')])),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('rows_total', models.PositiveIntegerField(null=True, blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('filename', models.CharField(max_length=255, blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(null=True, blank=True)),
+                ('hierarchy', models.ForeignKey(to='pagetree.Hierarchy')),
+                ('requested_by', models.ForeignKey(blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pagetree', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0019_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipantReportRow',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('columns_version', models.CharField(max_length=255, blank=True)),
+                ('values', models.TextField(blank=True)),
+                ('is_stale', models.BooleanField(default=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('hierarchy', models.ForeignKey(to='pagetree.Hierarchy')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='participantreportrow',
+            unique_together=set([('user', 'hierarchy')]),
+        ),
+    ]
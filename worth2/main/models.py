@@ -1,18 +1,23 @@
+from datetime import timedelta
 import re
 from django import forms
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.shortcuts import get_object_or_404
 from django.template.defaultfilters import slugify
+from django.utils import timezone
 from ordered_model.models import OrderedModel
-from pagetree.models import Section, UserPageVisit
+from pagetree.models import Hierarchy, Section, UserPageVisit
 from pagetree.generic.models import BasePageBlock
 
-from worth2.main.auth import user_is_participant
+from worth2.main.auth import get_user_role, user_is_participant
+from worth2.main.catalog import get_content_catalog
 from worth2.main.generic.models import BaseUserProfile
+from worth2.main.hierarchy import get_hierarchy_snapshot
 from worth2.main.utils import (
     get_module_number_from_section, get_verbose_section_name
 )
@@ -30,6 +35,158 @@ class InactiveUserProfile(BaseUserProfile):
     def is_participant(self):
         return (not self.user.is_active)
 
+    def progress_summary(self):
+        return ProgressSummary.objects.for_user(self.user)
+
+    def last_access_hierarchy(self):
+        return self.progress_summary().last_visit
+
+    def last_location(self):
+        """Returns the last location this user accessed.
+
+        If the user hasn't accessed any sections, this function returns
+        None.
+
+        :rtype: Section
+        """
+        return self.progress_summary().last_section
+
+    def percent_complete_hierarchy(self):
+        pages = get_hierarchy_snapshot().page_count
+        visits = self.progress_summary().visit_count
+
+        if pages:
+            return int(visits / float(pages) * 100)
+        else:
+            return 0
+
+
+class ProgressSummaryManager(models.Manager):
+    def for_user(self, user):
+        """Returns the user's summary, building it if it's missing.
+
+        :rtype: ProgressSummary
+        """
+        try:
+            return self.select_related(
+                'last_section', 'highest_section').get(user=user)
+        except ProgressSummary.DoesNotExist:
+            return self.rebuild(user.id)
+
+    def rebuild(self, user_id):
+        """Recompute the user's summary from their UserPageVisits.
+
+        :rtype: ProgressSummary
+        """
+        visits = UserPageVisit.objects.filter(user__id=user_id)
+        last = visits.select_related('section').order_by(
+            '-last_visit').first()
+        pages = visits.filter(section__depth__gte=2)
+        highest = pages.select_related('section').order_by(
+            '-section__path').first()
+
+        values = {
+            'last_section': last.section if last else None,
+            'last_visit': last.last_visit if last else None,
+            'highest_section': highest.section if highest else None,
+            'visit_count': pages.count(),
+        }
+        if self.filter(user__id=user_id).update(**values):
+            return self.get(user__id=user_id)
+
+        try:
+            with transaction.atomic():
+                return self.create(user_id=user_id, **values)
+        except IntegrityError:
+            # Another request built the summary first, maybe without
+            # the visits this one saw, so it's computed again.
+            return self.rebuild(user_id)
+
+    def record_visit(self, visit, created):
+        """Update the user's summary with a UserPageVisit that was
+        just saved.
+
+        Each change is a conditional update, so concurrent visits by
+        the same user can't undo each other.
+        """
+        with transaction.atomic():
+            if not self.filter(user__id=visit.user_id).exists():
+                # The summary was never built, so build it from all
+                # the visits, including this one.
+                self.rebuild(visit.user_id)
+                return
+
+            summary = self.filter(user__id=visit.user_id)
+            if created and visit.section.depth >= 2:
+                summary.update(visit_count=models.F('visit_count') + 1)
+
+            summary.filter(
+                models.Q(last_visit__isnull=True) |
+                models.Q(last_visit__lte=visit.last_visit)).update(
+                last_section=visit.section_id,
+                last_visit=visit.last_visit)
+
+            if visit.section.depth >= 2:
+                summary.filter(
+                    models.Q(highest_section__isnull=True) |
+                    models.Q(highest_section__path__lt=visit.section.path)
+                ).update(highest_section=visit.section_id)
+
+    def record_deleted_visit(self, visit):
+        """Recompute the user's summary after one of their visits was
+        deleted.
+
+        Summaries that don't exist are left alone, since the user may
+        be being deleted too.
+        """
+        with transaction.atomic():
+            if self.filter(user__id=visit.user_id).exists():
+                self.rebuild(visit.user_id)
+
+
+class ProgressSummary(models.Model):
+    """Where a user is in the intervention, kept up to date as they
+    visit pages.
+
+    This is denormalized from the user's UserPageVisits by the signal
+    handlers in worth2.main.signals, so the profile methods above don't
+    have to scan them. The rebuild_progress_summaries command
+    recomputes them all.
+    """
+
+    user = models.OneToOneField(User, related_name='progress_summary')
+
+    # The section the user visited most recently, and when
+    last_section = models.ForeignKey(
+        Section, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+    last_visit = models.DateTimeField(null=True, blank=True)
+
+    # The farthest section below the root that the user has visited,
+    # in pagetree order. Its module is the highest module accessed.
+    highest_section = models.ForeignKey(
+        Section, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+
+    # The number of sections below the root that the user has
+    # visited, to compare with the hierarchy's page_count
+    visit_count = models.PositiveIntegerField(default=0)
+
+    objects = ProgressSummaryManager()
+
+    class Meta:
+        verbose_name_plural = 'progress summaries'
+
+    def __unicode__(self):
+        return unicode('Progress summary for %s' % self.user.username)
+
+    def highest_module(self):
+        """Returns the module number of the highest section, or -1.
+
+        :rtype: int
+        """
+        return get_module_number_from_section(self.highest_section)
+
 
 class Avatar(OrderedModel):
     """An image that the participant can choose for their profile."""
@@ -100,25 +257,39 @@ class AvatarSelectorBlock(BasePageBlock):
 
     def unlocked(self, user):
         if user_is_participant(user):
-            return user.profile.participant.avatar is not None
+            return get_user_role(user).avatar is not None
         else:
             return True
 
+    @classmethod
+    def bulk_unlocked(cls, user, block_ids):
+        """Returns the ids of these blocks that are unlocked for the user.
+
+        They're all unlocked or all locked, depending on the user's
+        avatar.
+        """
+        if user_is_participant(user) and \
+                get_user_role(user).participant.avatar_id is None:
+            return []
+        return block_ids
+
     def submit(self, user, request_data):
         if user_is_participant(user):
             avatar_id = request_data.get('avatar-id')
             avatar = get_object_or_404(Avatar, pk=avatar_id)
-            user.profile.participant.avatar = avatar
-            user.profile.participant.save()
+            participant = get_user_role(user).participant
+            participant.avatar = avatar
+            participant.save()
 
     def clear_user_submissions(self, user):
         if user_is_participant(user):
-            user.profile.participant.avatar = None
-            user.profile.participant.save()
+            participant = get_user_role(user).participant
+            participant.avatar = None
+            participant.save()
 
     def avatars(self):
-        """Returns a queryset of all the available avatars in WORTH."""
-        return Avatar.objects.all()
+        """Returns a list of all the available avatars in WORTH."""
+        return get_content_catalog().get_avatars()
 
     @staticmethod
     def add_form():
@@ -214,6 +385,24 @@ class ParticipantManager(models.Manager):
         return sorted(ids)
 
 
+def get_next_module(highest_module):
+    """Returns the module that comes after the highest module a
+    participant has accessed.
+
+    :rtype: int
+    """
+    if highest_module >= 5:
+        return 5
+    elif highest_module >= 1:
+        return highest_module + 1
+    else:
+        # If we can't find a valid "highest module" that this user
+        # has been in, that means there isn't one - this is a new
+        # user, and the "Next Module" that they need to complete is
+        # the first module, so return 1.
+        return 1
+
+
 class Participant(InactiveUserProfile):
     """ A Participant is a worth-specific inactive user profile.
     """
@@ -256,33 +445,14 @@ class Participant(InactiveUserProfile):
 
         :rtype: int
         """
-        # This is the UserPageVisit that is the farthest along in
-        # the intervention for this participant.
-        farthest_session_access = UserPageVisit.objects.filter(
-            user=self.user,
-            section__depth__gte=2).order_by('-section__path').first()
-        if farthest_session_access:
-            return get_module_number_from_section(
-                farthest_session_access.section.get_module())
-        else:
-            return -1
+        return self.progress_summary().highest_module()
 
     def next_module(self):
         """Get the next module that the participant needs to complete.
 
         :rtype: int
         """
-        highest_module = self.highest_module_accessed()
-        if highest_module >= 5:
-            return 5
-        elif highest_module >= 1:
-            return highest_module + 1
-        else:
-            # If we can't find a valid "highest module" that this user
-            # has been in, that means there isn't one - this is a new
-            # user, and the "Next Module" that they need to complete is
-            # the first module, so return 1.
-            return 1
+        return get_next_module(self.highest_module_accessed())
 
     def next_module_section(self):
         """Get the next module as a section.
@@ -291,7 +461,7 @@ class Participant(InactiveUserProfile):
         """
         module_num = self.next_module()
         slug = 'session-%d' % module_num
-        return Section.objects.get(slug=slug)
+        return get_hierarchy_snapshot().get_section_by_slug(slug)
 
     def next_module_verbose(self):
         return get_verbose_section_name(self.next_module_section())
@@ -431,6 +601,46 @@ class VideoBlockForm(forms.ModelForm):
         fields = '__all__'
 
 
+class WatchedVideoManager(models.Manager):
+    def insert_missing(self, user, video_ids):
+        existing = set(self.filter(
+            user=user, video_id__in=video_ids).values_list(
+            'video_id', flat=True))
+        new_ids = set(video_ids) - existing
+        self.bulk_create([
+            WatchedVideo(user=user, video_id=video_id)
+            for video_id in new_ids])
+        return new_ids
+
+    def record(self, user, video_ids):
+        """Record that the user watched these videos.
+
+        Videos that were already recorded are left alone, so this is
+        safe to repeat. The new ones are inserted with one bulk_create.
+
+        :returns: the ids of the videos that were newly recorded.
+        :rtype: set
+        """
+        try:
+            with transaction.atomic():
+                return self.insert_missing(user, video_ids)
+        except IntegrityError:
+            # Another request recorded some of these videos first.
+            return self.insert_missing(user, video_ids)
+
+    def watched_video_ids(self, user, videoblock_ids):
+        """Returns the video ids of these VideoBlocks that the user
+        has watched.
+
+        :rtype: list
+        """
+        return list(self.filter(
+            user=user,
+            video_id__in=VideoBlock.objects.filter(
+                pk__in=videoblock_ids).values('video_id'),
+        ).values_list('video_id', flat=True))
+
+
 class WatchedVideo(models.Model):
     """This model records which users have viewed which videos."""
 
@@ -444,3 +654,158 @@ class WatchedVideo(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = WatchedVideoManager()
+
+
+class ReportJobManager(models.Manager):
+    # A running job records its progress as it goes. One that hasn't
+    # in this long is assumed to have died along with its worker.
+    stale_after = timedelta(minutes=30)
+
+    def request_job(self, report_type, hierarchy, data_version, user=None):
+        """Find or create the job for this report and data version.
+
+        If a job for the same report, hierarchy and data version is
+        already pending, running or complete, that job is returned
+        instead of queueing a new one. Stale running jobs are marked as
+        failed first, so they aren't returned.
+
+        :rtype: (ReportJob, bool)
+        """
+        self.fail_stale_jobs()
+        job = self.filter(
+            report_type=report_type,
+            hierarchy=hierarchy,
+            data_version=data_version,
+        ).exclude(status='failed').order_by('-created_at').first()
+
+        if job is not None:
+            return job, False
+
+        job = self.create(report_type=report_type,
+                          hierarchy=hierarchy,
+                          data_version=data_version,
+                          requested_by=user)
+        return job, True
+
+    def pending(self):
+        return self.filter(status='pending').order_by('created_at')
+
+    def fail_stale_jobs(self):
+        """Mark running jobs that have stopped making progress as failed.
+
+        :returns: the number of jobs marked
+        :rtype: int
+        """
+        return self.filter(
+            status='running',
+            updated_at__lt=timezone.now() - self.stale_after,
+        ).update(status='failed', error='The job stopped making progress.',
+                 updated_at=timezone.now())
+
+
+class ReportJob(models.Model):
+    """A CSV report that's built in the background.
+
+    Jobs are queued by the report view and built by the
+    process_report_jobs management command. The finished CSV is
+    written to settings.REPORT_JOB_ROOT on the local filesystem.
+    """
+
+    REPORT_TYPES = (
+        ('facilitators', 'Facilitator Key'),
+        ('locations', 'Location Key'),
+        ('keys', 'Intervention Key'),
+        ('values', 'Intervention Values'),
+    )
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('complete', 'Complete'),
+        ('failed', 'Failed'),
+    )
+
+    report_type = models.CharField(max_length=255, choices=REPORT_TYPES,
+                                   default='keys')
+    hierarchy = models.ForeignKey(Hierarchy)
+
+    # A fingerprint of the data this report was built from. See
+    # worth2.main.reports.report_data_version.
+    data_version = models.CharField(max_length=255, db_index=True)
+
+    status = models.CharField(max_length=255, choices=STATUS_CHOICES,
+                              default='pending', db_index=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    rows_total = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    # The artifact's filename, relative to settings.REPORT_JOB_ROOT
+    filename = models.CharField(max_length=255, blank=True)
+
+    requested_by = models.ForeignKey(User, null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ReportJobManager()
+
+    def __unicode__(self):
+        return unicode('%s report (%s)' % (
+            self.get_report_type_display(), self.get_status_display()))
+
+    @staticmethod
+    def storage():
+        return FileSystemStorage(location=settings.REPORT_JOB_ROOT)
+
+    def download_filename(self):
+        return 'worth2_%s.csv' % self.report_type
+
+    def is_complete(self):
+        return self.status == 'complete'
+
+    def progress(self):
+        """Returns the percentage of rows written, or None if unknown.
+
+        :rtype: int
+        """
+        if self.is_complete():
+            return 100
+        if not self.rows_total:
+            return None
+        return min(int(self.rows_written / float(self.rows_total) * 100), 99)
+
+    def open_artifact(self):
+        return self.storage().open(self.filename, 'rb')
+
+
+class ParticipantReportRow(models.Model):
+    """A participant's precomputed row in the values report.
+
+    Rows are marked stale by the signal handlers in worth2.main.signals
+    whenever the participant's report data changes, and are recomputed
+    the next time the values report is built. See
+    worth2.main.reports.ParticipantReportRowStore.
+    """
+
+    user = models.ForeignKey(User)
+    hierarchy = models.ForeignKey(Hierarchy)
+
+    # A fingerprint of the report's columns and sections when this row
+    # was computed. Adding, removing or moving blocks or sections makes
+    # every stored row out of date.
+    columns_version = models.CharField(max_length=255, blank=True)
+
+    # The row's values, JSON-encoded
+    values = models.TextField(blank=True)
+
+    is_stale = models.BooleanField(default=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'hierarchy')
+
+    def __unicode__(self):
+        return unicode('Report row for %s' % self.user.username)
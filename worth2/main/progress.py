@@ -0,0 +1,189 @@
+"""Which sections of a hierarchy a user has unlocked and submitted.
+
+pagetree answers these questions one block at a time, with each
+block's unlocked() running its own queries. UserProgress works them out
+for every section of a hierarchy at once: the blocks are grouped by
+type, and each type's unlocked blocks are found with one query.
+
+Block models can provide a ``bulk_unlocked(user, block_ids)`` class
+method that returns the ids of the blocks that are unlocked for the
+user. Blocks without one fall back to their own unlocked() method.
+
+The results are cached under a per-user version stamp, which the
+signal handlers in worth2.main.signals bump whenever the user submits
+or resets a block.
+"""
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+from pagetree.generic.models import BasePageBlock
+from pagetree.models import UserPageVisit
+from quizblock.models import Submission
+
+
+def quiz_bulk_unlocked(user, block_ids):
+    return Submission.objects.filter(
+        user=user, quiz__id__in=block_ids).values_list('quiz_id', flat=True)
+
+
+# bulk_unlocked functions for block models that aren't part of WORTH,
+# by (app label, model).
+BULK_UNLOCKED = {
+    ('quizblock', 'quiz'): quiz_bulk_unlocked,
+}
+
+
+def user_progress_version_key(user_id):
+    return 'worth2.progress.%d.version' % user_id
+
+
+def get_user_progress_version(user_id):
+    key = user_progress_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_progress_version(user_id):
+    cache.set(user_progress_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def get_unlocked_blocks(user, entries):
+    """Find out which of these blocks are unlocked for the user.
+
+    :param entries: a list of BlockEntry
+    :returns: the set of (app label, model, object id) of the
+      unlocked blocks
+    :rtype: set
+    """
+    by_type = {}
+    for entry in entries:
+        by_type.setdefault((entry.app_label, entry.model), set()).add(
+            entry.object_id)
+
+    unlocked = set()
+    for (app_label, model), block_ids in by_type.items():
+        model_class = apps.get_model(app_label, model)
+        bulk_unlocked = BULK_UNLOCKED.get((app_label, model)) or \
+            getattr(model_class, 'bulk_unlocked', None)
+
+        if bulk_unlocked is not None:
+            unlocked_ids = bulk_unlocked(user, block_ids)
+        elif not hasattr(model_class, 'unlocked') or \
+                model_class.unlocked == BasePageBlock.unlocked:
+            # The block is always unlocked.
+            unlocked_ids = block_ids
+        else:
+            unlocked_ids = [
+                block.pk for block in
+                model_class.objects.filter(pk__in=block_ids)
+                if block.unlocked(user)]
+
+        unlocked.update(
+            (app_label, model, block_id) for block_id in unlocked_ids)
+    return unlocked
+
+
+class UserProgress(object):
+    """A user's progress through a hierarchy.
+
+    A section is unlocked when all its blocks are unlocked, and
+    submitted when all its blocks that need a submit are unlocked,
+    just like Section.unlocked() and Section.submitted().
+    """
+
+    def __init__(self, snapshot, locked_ids, unsubmitted_ids, visits):
+        """
+        :param locked_ids: the ids of the sections that aren't unlocked.
+        :param unsubmitted_ids: the ids of the sections that aren't
+          submitted.
+        :param visits: a dict of section id -> UserPageVisit status.
+        """
+        self.snapshot = snapshot
+        self.locked_ids = locked_ids
+        self.unsubmitted_ids = unsubmitted_ids
+        self.visits = visits
+
+    @staticmethod
+    def build_states(snapshot, user):
+        """Returns the ids of the locked and unsubmitted sections.
+
+        :rtype: (frozenset, frozenset)
+        """
+        indexes = snapshot.get_all_block_indexes()
+        unlocked = get_unlocked_blocks(user, [
+            entry for index in indexes.values() for entry in index.entries])
+
+        locked_ids = set()
+        unsubmitted_ids = set()
+        for section_id, index in indexes.items():
+            for entry in index.entries:
+                key = (entry.app_label, entry.model, entry.object_id)
+                if key in unlocked:
+                    continue
+                locked_ids.add(section_id)
+                if entry.needs_submit:
+                    unsubmitted_ids.add(section_id)
+        return frozenset(locked_ids), frozenset(unsubmitted_ids)
+
+    @classmethod
+    def load(cls, snapshot, user):
+        key = 'worth2.progress.%d.%s.%s' % (
+            user.id, get_user_progress_version(user.id), snapshot.version)
+        states = cache.get(key)
+        if states is None:
+            states = cls.build_states(snapshot, user)
+            cache.set(key, states)
+
+        # Visits change on every page view, so they're always loaded
+        # fresh.
+        visits = dict(UserPageVisit.objects.filter(
+            user=user, section__hierarchy=snapshot.hierarchy).values_list(
+            'section_id', 'status'))
+
+        locked_ids, unsubmitted_ids = states
+        return cls(snapshot, locked_ids, unsubmitted_ids, visits)
+
+    def is_unlocked(self, section_id):
+        return section_id not in self.locked_ids
+
+    def is_submitted(self, section_id):
+        return section_id not in self.unsubmitted_ids
+
+    def is_visited(self, section_id):
+        return section_id in self.visits
+
+    def is_complete(self, section_id):
+        return self.visits.get(section_id) == 'complete'
+
+    def get_toc(self, section):
+        """The section's table of contents, with this user's progress.
+
+        Returns an empty list if the section doesn't show a table of
+        contents.
+
+        :rtype: list of dicts
+        """
+        if not section.show_toc:
+            return []
+
+        return [{
+            'section': child,
+            'url': self.snapshot.get_absolute_url(child.id),
+            'has_children': has_children,
+            'closing': range(closing),
+            'visited': self.is_visited(child.id),
+            'unlocked': self.is_unlocked(child.id),
+        } for child, has_children, closing in self.snapshot.get_toc(
+            section.id, deep=section.deep_toc)]
+
+
+def get_user_progress(user, snapshot):
+    """Returns the user's progress through the snapshot's hierarchy.
+
+    :rtype: UserProgress
+    """
+    return UserProgress.load(snapshot, user)
@@ -1,12 +1,243 @@
+from collections import defaultdict
+import calendar
 from datetime import timedelta
+import hashlib
+import json
+import tempfile
+import uuid
 
 from django.contrib.auth.models import User
 from django.core.cache import cache
-from pagetree.models import UserPageVisit
-from pagetree.reports import PagetreeReport, StandaloneReportColumn
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.encoding import smart_str
+from pagetree.models import PageBlock, Section, UserPageVisit
+from pagetree.reports import PagetreeReport
+from quizblock.models import QuestionColumn, Response, Submission
+import numpy
+import unicodecsv
 
-from worth2.main.models import Encounter
-from worth2.ssnm.models import SsnmReport
+from worth2.goals.models import GoalCheckInResponse, GoalSettingResponse
+from worth2.main.catalog import get_catalog_version, get_content_catalog
+from worth2.main.generic.reports import BulkStandaloneReportColumn
+from worth2.main.hierarchy import (
+    get_hierarchy_snapshot_by_id, get_pagetree_version, prefetch_blocks
+)
+from worth2.main.models import (
+    Encounter, Location, Participant, ParticipantReportRow, ReportJob
+)
+from worth2.ssnm.models import Supporter, SsnmReport
+
+
+class ParticipantReportData(object):
+    """In-memory indexes over the report's data sources for some users.
+
+    Each data source is loaded with one query for the whole chunk of
+    users, so building this costs a fixed number of queries no matter
+    how many users or columns are in the report. The report columns
+    then read their values from these indexes.
+    """
+
+    def __init__(self, report, users):
+        self.report = report
+        user_ids = [user.id for user in users]
+
+        self.visits = self.load_visits(user_ids)
+        self.encounters = report.encounter_index(user_ids)
+        self.goal_setting_responses = self.load_goal_setting_responses(
+            user_ids)
+        self.goal_checkin_responses = self.load_goal_checkin_responses(
+            user_ids)
+        self.supporters = self.load_supporters(user_ids)
+        self.quiz_responses = self.load_quiz_responses(user_ids)
+
+        # Computed from the visits the first time it's needed
+        self._time_spent = None
+
+    @staticmethod
+    def load_visits(user_ids):
+        """Returns a dict of user id -> [(section id, first visit)].
+
+        Only completed visits are included, ordered by first visit.
+        """
+        visits = defaultdict(list)
+        qs = UserPageVisit.objects.filter(
+            user__id__in=user_ids, status='complete').order_by(
+            'first_visit', 'id').values_list(
+            'user_id', 'section_id', 'first_visit')
+        for user_id, section_id, first_visit in qs:
+            visits[user_id].append((section_id, first_visit))
+        return visits
+
+    @staticmethod
+    def load_goal_setting_responses(user_ids):
+        """Returns a dict of (user, block, form id) -> GoalSettingResponse.
+
+        When there's more than one response for a key, the most
+        recently updated one wins.
+        """
+        responses = {}
+        qs = GoalSettingResponse.objects.filter(
+            user__id__in=user_ids).order_by('updated_at', 'id')
+        for r in qs:
+            key = (r.user_id, r.goal_setting_block_id, r.form_id)
+            responses[key] = r
+        return responses
+
+    @staticmethod
+    def load_goal_checkin_responses(user_ids):
+        """Returns a dict of (user, block, form id) -> GoalCheckInResponse.
+
+        The key refers to the goal setting response that was checked
+        in on. The most recently updated check-in wins.
+        """
+        responses = {}
+        qs = GoalCheckInResponse.objects.filter(
+            goal_setting_response__user__id__in=user_ids).select_related(
+            'goal_setting_response').order_by('updated_at', 'id')
+        for r in qs:
+            setting_response = r.goal_setting_response
+            key = (setting_response.user_id,
+                   setting_response.goal_setting_block_id,
+                   setting_response.form_id)
+            responses[key] = r
+        return responses
+
+    @staticmethod
+    def load_supporters(user_ids):
+        """Returns a dict of user id -> [Supporter]."""
+        supporters = defaultdict(list)
+        qs = Supporter.objects.filter(
+            user__id__in=user_ids).order_by('created_at', 'id')
+        for supporter in qs:
+            supporters[supporter.user_id].append(supporter)
+        return supporters
+
+    @staticmethod
+    def load_quiz_responses(user_ids):
+        """Returns a dict of (user id, quiz id) -> [response value].
+
+        Only the responses in each user's latest submission to each
+        quiz are included, ordered by question.
+        """
+        latest = {}
+        qs = Submission.objects.filter(
+            user__id__in=user_ids).order_by('submitted', 'id').values_list(
+            'id', 'user_id', 'quiz_id')
+        for submission_id, user_id, quiz_id in qs:
+            latest[(user_id, quiz_id)] = submission_id
+
+        responses = dict((submission_id, [])
+                         for submission_id in latest.values())
+        qs = Response.objects.filter(
+            submission__user__id__in=user_ids).order_by(
+            'question', 'id').values_list('submission_id', 'value')
+        for submission_id, value in qs:
+            if submission_id in responses:
+                responses[submission_id].append(value)
+
+        return dict((key, responses[submission_id])
+                    for key, submission_id in latest.items())
+
+    def completed_section_ids(self, user):
+        return [section_id for section_id, first_visit
+                in self.visits.get(user.id, [])]
+
+    def percent_complete(self, user, section):
+        section_ids = set(self.report.get_section_ids(section))
+        count = len(section_ids)
+        if count == 0:
+            return 0
+
+        visits = [section_id for section_id in
+                  self.completed_section_ids(user)
+                  if section_id in section_ids]
+        return len(visits) / float(count) * 100
+
+    def modules_completed(self, user):
+        complete = 0
+        for module in self.report.modules():
+            if self.percent_complete(user, module) == 100:
+                complete += 1
+            else:
+                break
+        return complete
+
+    def load_time_spent(self):
+        """Returns a dict of (user id, module id) -> timedelta.
+
+        The time spent in every module, for every user in this data,
+        is summed up in one pass by ParticipantReport.sum_grouped_intervals.
+        """
+        section_modules = self.report.section_modules()
+
+        keys = []
+        key_idx = {}
+        groups = []
+        visit_times = []
+        for user_id, visits in self.visits.items():
+            for section_id, first_visit in visits:
+                module_id = section_modules.get(section_id)
+                if module_id is None:
+                    continue
+                key = (user_id, module_id)
+                if key not in key_idx:
+                    key_idx[key] = len(keys)
+                    keys.append(key)
+                groups.append(key_idx[key])
+                visit_times.append(first_visit)
+
+        totals = self.report.sum_grouped_intervals(
+            groups, visit_times, len(keys))
+        return dict(zip(keys, totals))
+
+    def time_spent(self, user, module):
+        if self._time_spent is None:
+            self._time_spent = self.load_time_spent()
+        return self.report.format_timedelta(
+            self._time_spent.get((user.id, module.id), timedelta(0)))
+
+    def encounter_id(self, participant, module_idx, module, encounter_idx):
+        return self.report.indexed_encounter_id(
+            self.encounters, participant, module_idx, module, encounter_idx)
+
+    def goal_setting_response(self, user, block_id, form_id):
+        return self.goal_setting_responses.get((user.id, block_id, form_id))
+
+    def goal_checkin_response(self, user, block_id, form_id):
+        return self.goal_checkin_responses.get((user.id, block_id, form_id))
+
+    def user_supporters(self, user):
+        return self.supporters.get(user.id, [])
+
+    def question_value(self, column, user):
+        """Answers a quizblock QuestionColumn, mirroring its user_value."""
+        question = column.question
+        responses = self.quiz_responses.get((user.id, question.quiz_id))
+        if responses is None:
+            return None
+
+        value = ''
+        if len(responses) > 0:
+            if question.is_single_choice():
+                value = column._answer_cache[responses[0]]
+            elif question.is_multiple_choice():
+                if column.answer.value in responses:
+                    value = column.answer.id
+            else:  # short or long text
+                value = responses[0]
+
+        return smart_str(value)
+
+    def user_value(self, column, user):
+        if hasattr(column, 'bulk_user_value'):
+            return column.bulk_user_value(user, self)
+        elif isinstance(column, QuestionColumn):
+            return self.question_value(column, user)
+        else:
+            return column.user_value(user)
 
 
 class ParticipantReport(PagetreeReport):
@@ -14,24 +245,25 @@ class ParticipantReport(PagetreeReport):
     five_minutes = timedelta(minutes=5)
     fifteen_minutes = timedelta(minutes=15)
 
-    @classmethod
-    def get_descendants(cls, section):
-        key = 'hierarchy_%s_section_%s' % (section.hierarchy.id, section.id)
-        descendants = cache.get(key)
-        if descendants is None:
-            descendants = section.get_descendants()
-            cache.set(key, descendants)
-        return descendants
+    # The number of users whose data is preloaded at a time when
+    # building the values report.
+    chunk_size = 500
 
     @classmethod
     def get_descendant_ids(cls, section):
-        key = 'hierarchy_%s_sectionids_%s' % (section.hierarchy.id, section.id)
-        ids = cache.get(key)
-        if ids is None:
-            descendants = cls.get_descendants(section)
-            ids = [s.id for s in descendants]
-            cache.set(key, ids)
-        return ids
+        snapshot = get_hierarchy_snapshot_by_id(section.hierarchy_id)
+        return list(snapshot.get_descendant_ids(section.id))
+
+    @classmethod
+    def get_section_ids(cls, section):
+        """Returns the ids of this section and its descendants.
+
+        The root section itself is left out, since it's never visited.
+        """
+        section_ids = cls.get_descendant_ids(section)
+        if not section.is_root():
+            section_ids.insert(0, section.id)
+        return section_ids
 
     @classmethod
     def format_timedelta(cls, delta):
@@ -39,37 +271,145 @@ class ParticipantReport(PagetreeReport):
         minutes, seconds = divmod(remainder, 60)
         return '%02d:%02d:%02d' % (hours, minutes, seconds)
 
+    @classmethod
+    def sum_intervals(cls, visit_times):
+        """Sum up the time between a sorted list of visit times.
+
+        :rtype: timedelta
+        """
+        time_spent = timedelta(0)
+        prev = None
+        for visit_time in visit_times:
+            if prev:
+                interval = (visit_time - prev)
+                if interval > cls.fifteen_minutes:
+                    # record 5 minutes for any interval longer than 15 minutes
+                    time_spent += min(interval, cls.five_minutes)
+                else:
+                    time_spent += interval
+            prev = visit_time
+        return time_spent
+
+    @classmethod
+    def sum_grouped_intervals(cls, groups, visit_times, group_count):
+        """sum_intervals for many groups of visits at once.
+
+        The capping rule is applied to every interval with NumPy,
+        instead of walking each group's visits in Python.
+
+        :param groups: the group index of each visit, from 0 to
+          group_count - 1.
+        :param visit_times: the time of each visit. They don't need to
+          be sorted.
+        :rtype: list of timedelta, one per group
+        """
+        totals = numpy.zeros(group_count, dtype=numpy.int64)
+        if len(visit_times) > 1:
+            groups = numpy.array(groups, dtype=numpy.int64)
+            times = numpy.array(
+                [calendar.timegm(t.utctimetuple()) * 1000000 + t.microsecond
+                 for t in visit_times], dtype=numpy.int64)
+
+            # Sort by group, then by time within each group
+            order = numpy.lexsort((times, groups))
+            groups = groups[order]
+            times = times[order]
+
+            five_minutes = int(cls.five_minutes.total_seconds() * 1000000)
+            fifteen_minutes = int(
+                cls.fifteen_minutes.total_seconds() * 1000000)
+
+            intervals = numpy.diff(times)
+            intervals = numpy.where(
+                intervals > fifteen_minutes,
+                numpy.minimum(intervals, five_minutes),
+                intervals)
+            # Intervals that span two groups don't count.
+            intervals[groups[1:] != groups[:-1]] = 0
+
+            numpy.add.at(totals, groups[1:], intervals)
+
+        return [timedelta(microseconds=int(total)) for total in totals]
+
+    @classmethod
+    def format_encounter_id(cls, participant, module_idx, facilitator_id,
+                            created_at, encounter_idx, location_id):
+        return "%s-%d-%05d-%s-%d-%02d" % (
+            participant.cohort_id,  # Cohort ID #: 3 digits
+            module_idx + 1,  # Module #, 1 digit
+            facilitator_id,  # Facilitator (5 digits)
+            created_at.strftime("%y%m%d%I%M"),  # YYMMDDHHMM
+            encounter_idx,
+            location_id  # Location (2 digits)
+        )
+
     def __init__(self, hierarchy):
         self.hierarchy = hierarchy
+        self._modules = None
+        self._section_modules = None
         super(ParticipantReport, self).__init__()
 
+    def modules(self):
+        if self._modules is None:
+            snapshot = get_hierarchy_snapshot_by_id(self.hierarchy.id)
+            self._modules = snapshot.get_modules()
+        return self._modules
+
+    def section_modules(self):
+        """Returns a dict of section id -> the id of its module."""
+        if self._section_modules is None:
+            self._section_modules = {}
+            for module in self.modules():
+                for section_id in self.get_section_ids(module):
+                    self._section_modules[section_id] = module.id
+        return self._section_modules
+
+    def encounter_index(self, user_ids):
+        """Index these users' encounters by participant and module.
+
+        Returns a dict of (participant id, module id) ->
+        [(facilitator id, created_at, location id)], ordered by when
+        the encounters were created. This is built with one query.
+        """
+        section_modules = self.section_modules()
+        index = defaultdict(list)
+        qs = Encounter.objects.filter(
+            participant__user__id__in=user_ids).order_by(
+            'created_at', 'id').values_list(
+            'participant_id', 'section_id', 'facilitator_id', 'created_at',
+            'location_id')
+        for participant_id, section_id, facilitator_id, created_at, \
+                location_id in qs:
+            module_id = section_modules.get(section_id)
+            if module_id is not None:
+                index[(participant_id, module_id)].append(
+                    (facilitator_id, created_at, location_id))
+        return index
+
+    def indexed_encounter_id(self, index, participant, module_idx, module,
+                             encounter_idx):
+        """Look up an encounter id in an index from encounter_index()."""
+        encounters = index.get((participant.id, module.id), [])
+        if len(encounters) <= encounter_idx:
+            return None
+
+        facilitator_id, created_at, location_id = encounters[encounter_idx]
+        return self.format_encounter_id(
+            participant, module_idx, facilitator_id, created_at,
+            encounter_idx, location_id)
+
     def users(self):
         users = User.objects.filter(is_active=False,
                                     userpagevisit__isnull=False).distinct()
         return users.order_by('id')
 
     def encounter_id(self, participant, module_idx, module, encounter_idx):
-        section_ids = self.get_descendant_ids(module)
-        section_ids.append(module.id)
-        encounters = Encounter.objects.filter(participant=participant,
-                                              section__id__in=section_ids)
-        if encounters.count() <= encounter_idx:
-            return None
-        else:
-            encounter = encounters.order_by('created_at')[encounter_idx]
-            return "%s-%d-%05d-%s-%d-%02d" % (
-                participant.cohort_id,  # Cohort ID #: 3 digits
-                module_idx + 1,  # Module #, 1 digit
-                encounter.facilitator.id,  # Facilitator (5 digits)
-                encounter.created_at.strftime("%y%m%d%I%M"),  # YYMMDDHHMM
-                encounter_idx,
-                encounter.location.id  # Location (2 digits)
-            )
+        index = self.encounter_index([participant.user_id])
+        return self.indexed_encounter_id(
+            index, participant, module_idx, module, encounter_idx)
 
     def percent_complete(self, user, section):
-        section_ids = self.get_descendant_ids(section)
-        if not section.is_root():
-            section_ids.insert(0, section.id)
+        section_ids = self.get_section_ids(section)
 
         count = len(section_ids)
         if count == 0:
@@ -83,7 +423,7 @@ class ParticipantReport(PagetreeReport):
     def modules_completed(self, user):
         complete = 0
 
-        for module in self.hierarchy.get_root().get_children():
+        for module in self.modules():
             if self.percent_complete(user, module) == 100:
                 complete += 1
             else:
@@ -91,70 +431,89 @@ class ParticipantReport(PagetreeReport):
         return complete
 
     def time_spent(self, user, section):
-        section_ids = self.get_descendant_ids(section)
-        section_ids.insert(0, section.id)
+        section_ids = self.get_section_ids(section)
 
         visits = UserPageVisit.objects.filter(user=user,
                                               status='complete',
                                               section__in=section_ids)
 
-        time_spent = timedelta(0)
-        prev = None
-        for page in visits.order_by('first_visit'):
-            if prev:
-                interval = (page.first_visit - prev)
-                if interval > self.fifteen_minutes:
-                    # record 5 minutes for any interval longer than 15 minutes
-                    time_spent += min(interval, self.five_minutes)
-                else:
-                    time_spent += interval
-            prev = page.first_visit
-
-        return self.format_timedelta(time_spent)
+        visit_times = [page.first_visit
+                       for page in visits.order_by('first_visit')]
+        return self.format_timedelta(self.sum_intervals(visit_times))
 
     def per_module_columns(self, module_idx, module):
         return [
-            StandaloneReportColumn(
+            BulkStandaloneReportColumn(
                 '%s_time_spent' % module_idx, 'profile', 'string',
                 '%s Time Spent' % module.label,
-                lambda x: self.time_spent(x, module)),
-            StandaloneReportColumn(
+                lambda x: self.time_spent(x, module),
+                lambda x, data: data.time_spent(x, module)),
+            BulkStandaloneReportColumn(
                 '%s_encounter_id' % module_idx, 'profile', 'string',
                 '%s Encounter Id' % module.label,
                 lambda x: self.encounter_id(x.profile.participant, module_idx,
-                                            module, 0)),
-            StandaloneReportColumn(
+                                            module, 0),
+                lambda x, data: data.encounter_id(
+                    x.profile.participant, module_idx, module, 0)),
+            BulkStandaloneReportColumn(
                 '%s_first_makeup_id' % module_idx, 'profile', 'string',
                 '%s First Makeup Id' % module.label,
                 lambda x: self.encounter_id(x.profile.participant, module_idx,
-                                            module, 1)),
-            StandaloneReportColumn(
+                                            module, 1),
+                lambda x, data: data.encounter_id(
+                    x.profile.participant, module_idx, module, 1)),
+            BulkStandaloneReportColumn(
                 '%s_second_makeup_id' % module_idx, 'profile', 'string',
                 '%s Second Makeup Id' % module.label,
                 lambda x: self.encounter_id(x.profile.participant, module_idx,
-                                            module, 2))
+                                            module, 2),
+                lambda x, data: data.encounter_id(
+                    x.profile.participant, module_idx, module, 2))
         ]
 
     def standalone_columns(self):
         base_columns = [
-            StandaloneReportColumn(
+            BulkStandaloneReportColumn(
                 'study_id', 'profile', 'string', 'Randomized Study Id',
-                lambda x: x.profile.participant.study_id),
-            StandaloneReportColumn(
+                lambda x: x.profile.participant.study_id,
+                lambda x, data: x.profile.participant.study_id),
+            BulkStandaloneReportColumn(
                 'cohort_id', 'profile', 'string', 'Assigned Cohort Id',
-                lambda x: x.profile.participant.cohort_id),
-            StandaloneReportColumn(
+                lambda x: x.profile.participant.cohort_id,
+                lambda x, data: x.profile.participant.cohort_id),
+            BulkStandaloneReportColumn(
                 'modules_completed', 'profile', 'count', 'modules completed',
-                lambda x: self.modules_completed(x)),
+                lambda x: self.modules_completed(x),
+                lambda x, data: data.modules_completed(x)),
         ]
 
-        for idx, module in enumerate(self.hierarchy.get_root().get_children()):
+        for idx, module in enumerate(self.modules()):
             base_columns += self.per_module_columns(idx + 1, module)
 
         return base_columns
 
+    def reportable_blocks(self, hierarchies):
+        """Yields the reportable blocks in these hierarchies, in page
+        order, like PagetreeReport's column builders find them.
+
+        Each hierarchy's blocks are loaded together, instead of with a
+        query for each section and then for each pageblock.
+        """
+        for hierarchy in hierarchies:
+            pageblocks = defaultdict(list)
+            for p in prefetch_blocks(PageBlock.objects.filter(
+                    section__hierarchy=hierarchy,
+                    content_type__in=self.types).order_by('ordinality')):
+                pageblocks[p.section_id].append(p)
+
+            for section in hierarchy.get_root().get_descendants():
+                for p in pageblocks[section.id]:
+                    yield p.block()
+
     def metadata_columns(self, hierarchies):
-        columns = super(ParticipantReport, self).metadata_columns(hierarchies)
+        columns = self.standalone_columns()
+        for block in self.reportable_blocks(hierarchies):
+            columns += block.report_metadata()
 
         # not associated with hierarchy, but vary with metadata/values
         ssnm = SsnmReport()
@@ -162,9 +521,347 @@ class ParticipantReport(PagetreeReport):
         return columns
 
     def value_columns(self, hierarchies):
-        columns = super(ParticipantReport, self).value_columns(hierarchies)
+        columns = self.standalone_columns()
+        for block in self.reportable_blocks(hierarchies):
+            columns += block.report_values()
 
         # not associated with hierarchy, but vary with metadata/values
         ssnm = SsnmReport()
         columns += ssnm.report_values()
         return columns
+
+    def user_chunks(self, user_ids=None):
+        """Yield lists of report users, chunk_size users at a time.
+
+        :param user_ids: only include these users, instead of all the
+          report's users.
+        """
+        users = self.users().select_related('profile__participant')
+        if user_ids is None:
+            user_ids = list(self.users().values_list('id', flat=True))
+        for i in xrange(0, len(user_ids), self.chunk_size):
+            chunk_ids = user_ids[i:i + self.chunk_size]
+            yield list(users.filter(id__in=chunk_ids))
+
+    def computed_rows(self, columns, users):
+        """Yield (user, row) for each user, computed from bulk-loaded data.
+
+        The rows are the same as the ones PagetreeReport.values()
+        produces, but instead of running queries for each cell, the
+        users' data is preloaded into a ParticipantReportData.
+        """
+        data = ParticipantReportData(self, users)
+        for user in users:
+            yield user, [data.user_value(column, user) for column in columns]
+
+    def values(self, hierarchies, progress=None):
+        """All system results, read from the materialized report rows.
+
+        Any rows that are missing or stale are recomputed first.
+
+        :param progress: called after each chunk of rows is recomputed.
+        """
+        columns = self.value_columns(hierarchies)
+
+        yield self.value_headers(columns)
+
+        store = ParticipantReportRowStore(self, columns)
+        store.refresh(progress)
+        for row in store.rows():
+            yield row
+
+
+class ParticipantReportRowStore(object):
+    """The values report's rows, materialized in ParticipantReportRow.
+
+    The signal handlers in worth2.main.signals mark a participant's row
+    as stale whenever their report data changes. refresh() recomputes
+    just the stale and missing rows, so building the values report is
+    mostly a single scan of the stored rows.
+    """
+
+    def __init__(self, report, columns):
+        self.report = report
+        self.columns = columns
+        # The rows' progress and time values depend on where each
+        # section is in the tree, which the headers don't show.
+        snapshot = get_hierarchy_snapshot_by_id(report.hierarchy.id)
+        structure = [(section.id, section.path)
+                     for section in snapshot.sections]
+        self.columns_version = hashlib.sha1(
+            repr((report.value_headers(columns), structure))).hexdigest()
+
+    def stored_rows(self):
+        return ParticipantReportRow.objects.filter(
+            hierarchy=self.report.hierarchy)
+
+    def fresh_user_ids(self):
+        return set(self.stored_rows().filter(
+            is_stale=False, columns_version=self.columns_version,
+        ).values_list('user_id', flat=True))
+
+    def stale_users(self):
+        """Returns the report users whose rows need to be recomputed."""
+        fresh_ids = self.fresh_user_ids()
+        return [user_id for user_id in
+                self.report.users().values_list('id', flat=True)
+                if user_id not in fresh_ids]
+
+    @staticmethod
+    def encode(row):
+        return json.dumps(row)
+
+    @staticmethod
+    def decode(values):
+        return json.loads(values)
+
+    @transaction.atomic
+    def claim(self, users):
+        """Clear the stale flag on these users' rows, creating them first
+        if needed.
+
+        This happens before their data is loaded, so that any change
+        made while the rows are being computed marks them stale again.
+        """
+        user_ids = [user.id for user in users]
+        rows = self.stored_rows().filter(user__id__in=user_ids)
+        missing_ids = self.missing_user_ids(user_ids)
+        try:
+            with transaction.atomic():
+                ParticipantReportRow.objects.bulk_create([
+                    ParticipantReportRow(user_id=user_id,
+                                         hierarchy=self.report.hierarchy,
+                                         is_stale=False)
+                    for user_id in missing_ids])
+        except IntegrityError:
+            # A concurrent refresh created some of these rows first.
+            for user_id in missing_ids:
+                ParticipantReportRow.objects.get_or_create(
+                    user_id=user_id, hierarchy=self.report.hierarchy)
+        rows.update(is_stale=False)
+
+    def missing_user_ids(self, user_ids):
+        """Returns which of these users have no stored row."""
+        existing = set(self.stored_rows().filter(
+            user__id__in=user_ids).values_list('user_id', flat=True))
+        return [user_id for user_id in user_ids if user_id not in existing]
+
+    def update(self, users):
+        self.claim(users)
+        rows = self.stored_rows()
+        with transaction.atomic():
+            for user, row in self.report.computed_rows(self.columns, users):
+                rows.filter(user=user).update(
+                    values=self.encode(row),
+                    columns_version=self.columns_version,
+                    updated_at=timezone.now())
+
+    def refresh(self, progress=None):
+        """Recompute the rows that are stale or missing.
+
+        :param progress: called after each chunk of users' rows is
+          recomputed.
+        :returns: the number of rows recomputed
+        :rtype: int
+        """
+        user_ids = self.stale_users()
+        for users in self.report.user_chunks(user_ids):
+            self.update(users)
+            if progress is not None:
+                progress()
+        return len(user_ids)
+
+    def rebuild(self):
+        """Throw away every stored row and compute them all again.
+
+        :returns: the number of rows computed
+        :rtype: int
+        """
+        self.stored_rows().delete()
+        return self.refresh()
+
+    def rows(self):
+        """Yield each report user's stored row, in user id order."""
+        qs = self.stored_rows().filter(
+            user__in=self.report.users()).order_by('user_id').values_list(
+            'values', flat=True)
+        for values in qs.iterator():
+            yield self.decode(values)
+
+    def drift(self):
+        """Compare the fresh stored rows to freshly computed ones.
+
+        Rows that are marked stale are expected to be out of date, so
+        they're left out.
+
+        :returns: the ids of users whose stored rows are wrong
+        :rtype: list
+        """
+        fresh = dict(self.stored_rows().filter(
+            is_stale=False, columns_version=self.columns_version,
+        ).values_list('user_id', 'values'))
+
+        drifted = []
+        for users in self.report.user_chunks(sorted(fresh.keys())):
+            for user, row in self.report.computed_rows(self.columns, users):
+                expected = self.decode(self.encode(row))
+                if self.decode(fresh[user.id]) != expected:
+                    drifted.append(user.id)
+        return drifted
+
+
+def facilitator_rows():
+    rows = [['Facilitator ID', 'Facilitator Name']]
+    for user in User.objects.filter(is_active=True, is_superuser=False):
+        rows.append([user.id, user.username, user.get_full_name()])
+    return rows
+
+
+def location_rows():
+    rows = [['Location ID', 'Location Name']]
+    for location in get_content_catalog().get_locations():
+        rows.append([location.id, location.name])
+    return rows
+
+
+def report_rows(report_type, hierarchy, progress=None):
+    """Returns an iterable of CSV rows for the given report type.
+
+    :param progress: called now and then while the values report
+      recomputes its stored rows, before any of them are returned.
+    """
+    hierarchies = [hierarchy]
+    report = ParticipantReport(hierarchy)
+
+    if report_type == 'facilitators':
+        return facilitator_rows()
+    elif report_type == 'locations':
+        return location_rows()
+    elif report_type == 'values':
+        return report.values(hierarchies, progress)
+    else:
+        return report.metadata(hierarchies)
+
+
+def report_rows_total(report_type, hierarchy):
+    """Returns the number of rows the report will have, if it's cheap to
+    find out. Otherwise, returns None.
+    """
+    if report_type == 'values':
+        return ParticipantReport(hierarchy).users().count() + 1
+    return None
+
+
+REPORT_CONTENT_VERSION_KEY = 'worth2.reports.content_version'
+
+
+def get_report_content_version():
+    """Returns the current stamp of the report content that the
+    pagetree and catalog versions don't cover: facilitators, and quiz
+    questions and answers.
+
+    :rtype: str
+    """
+    version = cache.get(REPORT_CONTENT_VERSION_KEY)
+    if version is None:
+        cache.add(REPORT_CONTENT_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(REPORT_CONTENT_VERSION_KEY)
+    return version
+
+
+def bump_report_content_version():
+    cache.set(REPORT_CONTENT_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+# Each of these is summarized by its row count, highest id and, when
+# it has one, its latest modification time. Along with the content
+# version stamps, they make up the report's data version. Edits that
+# don't touch a timestamp, like renaming a location or relabelling a
+# section, are only caught by the stamps.
+REPORT_DATA_SOURCES = (
+    (User, 'last_login'),
+    (Participant, 'updated_at'),
+    (Location, None),
+    (Section, None),
+    (PageBlock, None),
+    (UserPageVisit, 'last_visit'),
+    (Encounter, 'updated_at'),
+    (GoalSettingResponse, 'updated_at'),
+    (GoalCheckInResponse, 'updated_at'),
+    (Supporter, 'updated_at'),
+    (Submission, 'submitted'),
+    (Response, None),
+)
+
+
+def report_data_version(hierarchy):
+    """Returns a fingerprint of the data that the reports are built from.
+
+    This changes whenever any report data source gains, loses, or
+    modifies a row, so a report built for one data version can be
+    served again until then.
+
+    :rtype: str
+    """
+    digest = hashlib.sha1(str(hierarchy.pk))
+    digest.update(get_pagetree_version())
+    digest.update(get_catalog_version())
+    digest.update(get_report_content_version())
+    for model, timestamp_field in REPORT_DATA_SOURCES:
+        aggregates = {'count': Count('pk'), 'max_id': Max('pk')}
+        if timestamp_field:
+            aggregates['modified'] = Max(timestamp_field)
+        summary = model.objects.aggregate(**aggregates)
+        digest.update(repr(sorted(summary.items())))
+    return digest.hexdigest()
+
+
+def run_report_job(job):
+    """Build the CSV artifact for a ReportJob.
+
+    The job's progress is recorded as the rows are written. If the
+    report can't be built, the job is marked as failed and the error
+    is saved on it.
+
+    A job that stopped making progress for long enough may have been
+    marked as failed, and queued again, by ReportJobManager. If so,
+    it's abandoned when it finishes, and left as failed.
+    """
+    # How many rows to write between progress updates
+    progress_interval = 100
+
+    job.status = 'running'
+    job.rows_written = 0
+    job.rows_total = report_rows_total(job.report_type, job.hierarchy)
+    job.save()
+    running = ReportJob.objects.filter(pk=job.pk, status='running')
+
+    def heartbeat():
+        running.update(updated_at=timezone.now())
+
+    try:
+        with tempfile.TemporaryFile() as f:
+            writer = unicodecsv.writer(f)
+            for row in report_rows(job.report_type, job.hierarchy,
+                                   heartbeat):
+                writer.writerow(row)
+                job.rows_written += 1
+                if job.rows_written % progress_interval == 0:
+                    running.update(rows_written=job.rows_written,
+                                   updated_at=timezone.now())
+
+            f.seek(0)
+            name = 'worth2_%s_%d.csv' % (job.report_type, job.pk)
+            job.filename = ReportJob.storage().save(name, File(f))
+    except Exception as e:
+        running.update(status='failed', error=unicode(e),
+                       updated_at=timezone.now())
+        raise
+
+    now = timezone.now()
+    finished = running.update(
+        status='complete', rows_written=job.rows_written,
+        filename=job.filename, completed_at=now, updated_at=now)
+    if not finished:
+        ReportJob.storage().delete(job.filename)
+    return ReportJob.objects.get(pk=job.pk)
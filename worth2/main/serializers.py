@@ -1,7 +1,7 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
 
-from worth2.main.auth import generate_random_username, generate_password
+from worth2.main.auth import generate_random_username
 from worth2.main.models import Participant, WatchedVideo
 
 
@@ -12,11 +12,11 @@ class ParticipantSerializer(serializers.HyperlinkedModelSerializer):
 
     def create(self, validated_data):
         # Create an inactive User for the participant
-        username = generate_random_username()
-        password = generate_password(username)
-        participant_user = User.objects.create(
-            username=username, is_active=False)
-        participant_user.set_password(password)
+        # Participants sign in through ParticipantBackend, which
+        # doesn't need a password hash.
+        participant_user = User(
+            username=generate_random_username(), is_active=False)
+        participant_user.set_unusable_password()
         participant_user.save()
         validated_data['user'] = participant_user
         validated_data['created_by'] = self.context['request'].user
@@ -28,3 +28,12 @@ class WatchedVideoSerializer(serializers.ModelSerializer):
     class Meta:
         model = WatchedVideo
         fields = ('video_id',)
+
+
+class WatchedVideoBatchSerializer(serializers.Serializer):
+    video_ids = serializers.ListField(
+        child=serializers.CharField(max_length=255))
+
+
+class ParticipantImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
@@ -0,0 +1,254 @@
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db import connection
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from pagetree.models import (
+    Hierarchy, PageBlock, Section, UserPageVisit, Version
+)
+from quizblock.models import Answer, Question, Response, Submission
+
+from worth2.goals.models import (
+    GoalCheckInOption, GoalCheckInResponse, GoalOption, GoalSettingResponse
+)
+from worth2.goals.signals import goal_responses_saved
+from worth2.main.catalog import bump_catalog_version
+from worth2.main.hierarchy import bump_pagetree_version
+from worth2.main.journal import bump_journal_version
+from worth2.main.models import (
+    Avatar, Encounter, Location, Participant, ParticipantReportRow,
+    ProgressSummary
+)
+from worth2.main.progress import bump_user_progress_version
+from worth2.main.reports import bump_report_content_version
+from worth2.main.visits import end_visit_window, start_visit_window
+from worth2.selftalk.models import (
+    Refutation, RefutationResponse, Statement, StatementBlock,
+    StatementResponse
+)
+from worth2.selftalk.signals import selftalk_responses_saved
+from worth2.ssnm.models import Supporter
+
+
+# Bumps that were made before their change was committed, by thread.
+_pending_bumps = threading.local()
+
+
+def bump_after_commit(bump, *args):
+    """Call bump(*args) now, and again once the request is finished.
+
+    Deletions, and saves made inside transaction.atomic(), send their
+    signals before the change is committed. A value rebuilt in between
+    would be cached under the new version with the old data, so if
+    there's a transaction in progress, the bump is repeated after it's
+    been committed. Requests aren't atomic, so by the time a request is
+    finished, its transactions have been.
+    """
+    bump(*args)
+    if connection.in_atomic_block:
+        if not hasattr(_pending_bumps, 'bumps'):
+            _pending_bumps.bumps = set()
+        _pending_bumps.bumps.add((bump, args))
+
+
+@receiver(request_finished)
+def bump_pending_versions(sender, **kwargs):
+    bumps = getattr(_pending_bumps, 'bumps', None)
+    _pending_bumps.bumps = set()
+    for bump, args in bumps or ():
+        bump(*args)
+
+
+def mark_report_rows_stale(user_ids):
+    """Mark these users' materialized report rows as out of date.
+
+    :param user_ids: a list of user ids, or a values('user_id')
+      queryset to match them with.
+    """
+    ParticipantReportRow.objects.filter(
+        user__id__in=user_ids).update(is_stale=True)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=UserPageVisit)
+@receiver(post_delete, sender=UserPageVisit)
+@receiver(post_save, sender=GoalSettingResponse)
+@receiver(post_delete, sender=GoalSettingResponse)
+@receiver(post_save, sender=Supporter)
+@receiver(post_delete, sender=Supporter)
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+def user_report_data_changed(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        mark_report_rows_stale([instance.user_id])
+
+
+@receiver(post_save, sender=Encounter)
+@receiver(post_delete, sender=Encounter)
+def encounter_changed(sender, instance, **kwargs):
+    mark_report_rows_stale(Participant.objects.filter(
+        pk=instance.participant_id).values('user_id'))
+
+
+@receiver(post_save, sender=GoalCheckInResponse)
+@receiver(post_delete, sender=GoalCheckInResponse)
+def goal_checkin_response_changed(sender, instance, **kwargs):
+    mark_report_rows_stale(GoalSettingResponse.objects.filter(
+        pk=instance.goal_setting_response_id).values('user_id'))
+
+
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+def quiz_response_changed(sender, instance, **kwargs):
+    mark_report_rows_stale(Submission.objects.filter(
+        pk=instance.submission_id).values('user_id'))
+
+
+# Facilitators' names and the quiz questions' text end up in the
+# reports.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def report_content_changed(sender, instance, update_fields=None, **kwargs):
+    # Every sign-in saves the user's last_login, which isn't reported.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_report_content_version()
+
+
+@receiver(post_save, sender=UserPageVisit)
+def user_page_visit_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        ProgressSummary.objects.record_visit(instance, created)
+
+
+@receiver(post_delete, sender=UserPageVisit)
+def user_page_visit_deleted(sender, instance, **kwargs):
+    ProgressSummary.objects.record_deleted_visit(instance)
+
+
+@receiver(post_save, sender=UserPageVisit)
+def user_page_visit_window_started(sender, instance, raw=False, **kwargs):
+    if not raw:
+        start_visit_window(instance)
+
+
+@receiver(post_delete, sender=UserPageVisit)
+def user_page_visit_window_ended(sender, instance, **kwargs):
+    end_visit_window(instance)
+
+
+# Moving or reordering sections doesn't save them, so pagetree's edit
+# views also bump the version once they're done. See worth2.urls.
+@receiver(post_save, sender=Hierarchy)
+@receiver(post_delete, sender=Hierarchy)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=PageBlock)
+@receiver(post_delete, sender=PageBlock)
+@receiver(post_save, sender=Version)
+def pagetree_content_changed(sender, instance, **kwargs):
+    bump_pagetree_version()
+
+
+# A statement block's statements are saved after the block itself.
+@receiver(m2m_changed, sender=StatementBlock.statements.through)
+def statement_block_statements_changed(sender, **kwargs):
+    bump_pagetree_version()
+
+
+# The admin edits these in a transaction, so its views bump the
+# version again once they're done. See worth2.main.admin.
+@receiver(post_save, sender=GoalOption)
+@receiver(post_delete, sender=GoalOption)
+@receiver(post_save, sender=GoalCheckInOption)
+@receiver(post_delete, sender=GoalCheckInOption)
+@receiver(post_save, sender=Statement)
+@receiver(post_delete, sender=Statement)
+@receiver(post_save, sender=Refutation)
+@receiver(post_delete, sender=Refutation)
+@receiver(post_save, sender=Avatar)
+@receiver(post_delete, sender=Avatar)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def catalog_changed(sender, instance, **kwargs):
+    bump_catalog_version()
+
+
+# Submitting or resetting a block changes what the user has unlocked.
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+@receiver(post_save, sender=GoalSettingResponse)
+@receiver(post_delete, sender=GoalSettingResponse)
+@receiver(post_save, sender=StatementResponse)
+@receiver(post_delete, sender=StatementResponse)
+@receiver(post_save, sender=RefutationResponse)
+@receiver(post_delete, sender=RefutationResponse)
+def user_progress_changed(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        bump_after_commit(bump_user_progress_version, instance.user_id)
+
+
+@receiver(post_save, sender=GoalCheckInResponse)
+@receiver(post_delete, sender=GoalCheckInResponse)
+def goal_checkin_progress_changed(sender, instance, **kwargs):
+    user_ids = GoalSettingResponse.objects.filter(
+        pk=instance.goal_setting_response_id).values_list(
+        'user_id', flat=True)
+    for user_id in user_ids:
+        bump_after_commit(bump_user_progress_version, user_id)
+
+
+@receiver(post_save, sender=GoalSettingResponse)
+@receiver(post_delete, sender=GoalSettingResponse)
+@receiver(post_save, sender=Submission)
+@receiver(post_delete, sender=Submission)
+@receiver(post_save, sender=Supporter)
+@receiver(post_delete, sender=Supporter)
+def journal_changed(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        bump_after_commit(bump_journal_version, instance.user_id)
+
+
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+def journal_response_changed(sender, instance, **kwargs):
+    user_ids = Submission.objects.filter(
+        pk=instance.submission_id).values_list('user_id', flat=True)
+    for user_id in user_ids:
+        bump_after_commit(bump_journal_version, user_id)
+
+
+# Goal formsets are saved with bulk writes, which don't send post_save.
+@receiver(goal_responses_saved)
+def goal_responses_saved_handler(sender, user, **kwargs):
+    mark_report_rows_stale([user.pk])
+    bump_after_commit(bump_user_progress_version, user.pk)
+    bump_after_commit(bump_journal_version, user.pk)
+
+
+@receiver(selftalk_responses_saved)
+def selftalk_responses_saved_handler(sender, user, **kwargs):
+    bump_after_commit(bump_user_progress_version, user.pk)
+
+
+def connect_pageblock_signals():
+    """Bump the pagetree version when any pageblock's content changes.
+
+    This is called when the app is ready, since the pageblock models
+    are only known from settings.PAGEBLOCKS.
+    """
+    for label in settings.PAGEBLOCKS:
+        model = apps.get_model(label)
+        post_save.connect(pagetree_content_changed, sender=model)
+        post_delete.connect(pagetree_content_changed, sender=model)
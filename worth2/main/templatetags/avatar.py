@@ -1,29 +1,41 @@
 from django import template
+from django.templatetags.static import static
 
-from worth2.main.models import Avatar
+from worth2.main.auth import get_user_role
+from worth2.main.catalog import get_content_catalog
 
 register = template.Library()
 
 
+# The admins' avatar url, once it's been built.
+_admin_avatar_url = []
+
+
+def get_admin_avatar_url():
+    if not _admin_avatar_url:
+        _admin_avatar_url.append(static('admin-avatar.png'))
+    return _admin_avatar_url[0]
+
+
 @register.simple_tag
 def avatar_url(user):
     """Returns the url for the current user's avatar.
 
     Admins are given a default avatar, and participants are given their
-    chosen avatar.
+    chosen avatar. The urls are cached in the content catalog, which
+    is rebuilt when an Avatar changes.
     """
     url = ''
     if user.is_staff or user.is_superuser:
         # Provide a default url for admins, for testing purposes
-        t = template.Template('{% load static %}{% static url %}')
-        url = t.render(template.Context({'url': 'admin-avatar.png'}))
-    elif hasattr(user, 'profile') and user.profile.is_participant():
-        if user.profile.participant.avatar:
+        url = get_admin_avatar_url()
+    elif get_user_role(user).is_participant:
+        catalog = get_content_catalog()
+        avatar_id = get_user_role(user).participant.avatar_id
+        if avatar_id:
             # This will be the complete s3 url
-            url = user.profile.participant.avatar.image.url
+            url = catalog.get_avatar_url(avatar_id)
         else:
-            default_avatar = Avatar.objects.filter(is_default=True).first()
-            if default_avatar:
-                url = default_avatar.image.url
+            url = catalog.get_default_avatar_url()
 
     return url
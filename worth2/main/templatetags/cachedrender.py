@@ -0,0 +1,139 @@
+"""Like pagetree's render tags, but with the output of blocks that
+don't depend on the user cached.
+
+{% cachedrender block %}, {% cachedrenderjs block %} and
+{% cachedrendercss block %} work just like {% render %},
+{% renderjs %} and {% rendercss %}. For the block types in
+CACHED_BLOCK_TYPES, the rendered fragments are cached under the
+current pagetree version, which the signal handlers in
+worth2.main.signals bump whenever a section, pageblock or one of these
+blocks is edited. A cached block doesn't even need its content object
+loaded.
+
+The first of these tags on a page fetches the fragments of every block
+in the context's pageblocks with one cache lookup.
+"""
+from django import template
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from pagetree.templatetags.render import (
+    RenderCSSNode, RenderJSNode, RenderNode
+)
+
+from worth2.main.hierarchy import get_pagetree_version
+
+register = template.Library()
+
+
+# The blocks whose output is the same for every user, by
+# (app label, model).
+CACHED_BLOCK_TYPES = frozenset([
+    ('pageblocks', 'textblock'),
+    ('pageblocks', 'htmlblock'),
+    ('pageblocks', 'pullquoteblock'),
+    ('pageblocks', 'imagepullquoteblock'),
+    ('main', 'simpleimageblock'),
+    ('main', 'videoblock'),
+])
+
+
+def is_cached_block(pageblock):
+    content_type = ContentType.objects.get_for_id(pageblock.content_type_id)
+    return (content_type.app_label, content_type.model) in \
+        CACHED_BLOCK_TYPES
+
+
+# The kinds of fragment each cached block has
+FRAGMENT_KINDS = ('html', 'js', 'css')
+
+# Where a template render keeps the fragments it's fetched
+RENDER_CONTEXT_KEY = 'worth2.cachedrender.fragments'
+
+
+def fragment_key(pageblock, kind):
+    return 'worth2.pageblock.%d.%s.%s' % (
+        pageblock.pk, kind, get_pagetree_version())
+
+
+def get_fragments(pageblocks):
+    """Returns the cached fragments of these pageblocks, with one cache
+    lookup.
+
+    :returns: a dict of (pageblock id, kind) -> fragment
+    """
+    keys = dict(
+        (fragment_key(pageblock, kind), (pageblock.pk, kind))
+        for pageblock in pageblocks if is_cached_block(pageblock)
+        for kind in FRAGMENT_KINDS)
+    return dict(
+        (keys[key], fragment)
+        for key, fragment in cache.get_many(keys.keys()).items())
+
+
+class CachedRenderMixin(object):
+    # Which fragment this node renders: html, js or css.
+    kind = None
+
+    def get_fragments(self, context, pageblock):
+        """Returns this render's fetched fragments, fetching the ones
+        for the page's pageblocks the first time.
+
+        :returns: (a set of the fetched pageblock ids, a dict of
+          (pageblock id, kind) -> fragment)
+        """
+        fetched = context.render_context.get(RENDER_CONTEXT_KEY)
+        if fetched is None:
+            fetched = (set(), {})
+            context.render_context[RENDER_CONTEXT_KEY] = fetched
+
+        block_ids, fragments = fetched
+        if pageblock.pk not in block_ids:
+            pageblocks = context.get('pageblocks') or []
+            if pageblock not in pageblocks:
+                pageblocks = [pageblock]
+            block_ids.update(p.pk for p in pageblocks)
+            fragments.update(get_fragments(pageblocks))
+        return fetched
+
+    def render(self, context):
+        pageblock = context[self.block]
+        if not is_cached_block(pageblock):
+            return super(CachedRenderMixin, self).render(context)
+
+        block_ids, fragments = self.get_fragments(context, pageblock)
+        fragment = fragments.get((pageblock.pk, self.kind))
+        if fragment is None:
+            fragment = super(CachedRenderMixin, self).render(context)
+            cache.set(fragment_key(pageblock, self.kind), fragment)
+            fragments[(pageblock.pk, self.kind)] = fragment
+        return fragment
+
+
+class CachedRenderNode(CachedRenderMixin, RenderNode):
+    kind = 'html'
+
+
+class CachedRenderJSNode(CachedRenderMixin, RenderJSNode):
+    kind = 'js'
+
+
+class CachedRenderCSSNode(CachedRenderMixin, RenderCSSNode):
+    kind = 'css'
+
+
+@register.tag('cachedrender')
+def cachedrender(parser, token):
+    block = token.split_contents()[1:][0]
+    return CachedRenderNode(block)
+
+
+@register.tag('cachedrenderjs')
+def cachedrenderjs(parser, token):
+    block = token.split_contents()[1:][0]
+    return CachedRenderJSNode(block)
+
+
+@register.tag('cachedrendercss')
+def cachedrendercss(parser, token):
+    block = token.split_contents()[1:][0]
+    return CachedRenderCSSNode(block)
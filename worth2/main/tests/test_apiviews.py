@@ -1,3 +1,4 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.urlresolvers import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -57,6 +58,34 @@ class ParticipantViewSetTest(
         self.assertEqual(participant.study_id, study_id)
         self.assertEqual(participant.created_by, self.u)
 
+    def test_import(self):
+        csv_file = SimpleUploadedFile(
+            'cohort.csv', 'study_id\n150426781012\n160022672101,123\n')
+        response = self.client.post(
+            '/api/participants/import/', {'file': csv_file})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            sorted(p['study_id'] for p in response.data),
+            ['150426781012', '160022672101'])
+
+        participant = Participant.objects.get(study_id='160022672101')
+        self.assertEqual(participant.cohort_id, '123')
+        self.assertEqual(participant.created_by, self.u)
+
+    def test_import_invalid(self):
+        csv_file = SimpleUploadedFile(
+            'cohort.csv', '150426781012\n15042672101\n')
+        response = self.client.post(
+            '/api/participants/import/', {'file': csv_file})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['rows'][0]['line'], 2)
+        self.assertEqual(Participant.objects.count(), 0)
+
+        response = self.client.post(
+            '/api/participants/import/',
+            {'file': SimpleUploadedFile('cohort.csv', '\n')})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_study_id(self):
         p = ParticipantFactory(study_id='150426781012')
         study_id = '160022672101'
@@ -192,3 +221,28 @@ class WatchedVideoViewSetTest(
         r = self.client.get('/api/watched_videos/')
         self.assertEqual(r.status_code, 200)
         self.assertEqual(len(r.data), 3)
+
+    def test_create_again(self):
+        WatchedVideoFactory(user=self.u, video_id='abc')
+        r = self.client.post('/api/watched_videos/', {'video_id': 'abc'})
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(WatchedVideo.objects.filter(user=self.u).count(), 1)
+
+    def test_batch(self):
+        WatchedVideoFactory(user=self.u, video_id='abc')
+        WatchedVideoFactory(video_id='ghi')
+
+        r = self.client.post('/api/watched_videos/batch/', {
+            'video_ids': ['abc', 'def', 'ghi'],
+        }, format='json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(sorted(r.data['video_ids']), ['abc', 'def', 'ghi'])
+        self.assertEqual(
+            sorted(WatchedVideo.objects.filter(user=self.u).values_list(
+                'video_id', flat=True)),
+            ['abc', 'def', 'ghi'])
+
+    def test_batch_invalid(self):
+        r = self.client.post('/api/watched_videos/batch/', {},
+                             format='json')
+        self.assertEqual(r.status_code, 400)
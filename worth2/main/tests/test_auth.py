@@ -0,0 +1,112 @@
+from StringIO import StringIO
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management import call_command
+from django.test import TestCase
+
+from worth2.main.auth import (
+    generate_password, get_user_role, user_is_facilitator,
+    user_is_participant
+)
+from worth2.main.management.commands.benchmark_participant_sign_in \
+    import Command
+from worth2.main.tests.factories import (
+    AvatarFactory, InactiveUserFactory, ParticipantFactory, UserFactory
+)
+from worth2.main.tests.mixins import LoggedInParticipantTestMixin
+
+
+class ParticipantBackendTest(TestCase):
+    def setUp(self):
+        self.user = ParticipantFactory().user
+        self.user.set_unusable_password()
+        self.user.save()
+
+    def authenticate(self, user, password=None):
+        if password is None:
+            password = generate_password(user.username)
+        return authenticate(participant_username=user.username,
+                            participant_password=password)
+
+    def test_authenticate(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate(self.user)
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.backend, 'worth2.main.auth.ParticipantBackend')
+
+    def test_wrong_password(self):
+        self.assertIsNone(self.authenticate(self.user, 'password'))
+
+    def test_not_participant(self):
+        self.assertIsNone(self.authenticate(InactiveUserFactory()))
+        self.assertIsNone(self.authenticate(UserFactory()))
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertIsNone(self.authenticate(self.user))
+
+    def test_password_login(self):
+        # Participants can't sign in with the usual username and
+        # password backends.
+        self.assertIsNone(authenticate(
+            username=self.user.username,
+            password=generate_password(self.user.username)))
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_participant_sign_in', sign_ins=2,
+                     stdout=out)
+        self.assertIn('2 sign-ins', out.getvalue())
+
+    def test_benchmark_study_id_taken(self):
+        ParticipantFactory(study_id='150101990000')
+        call_command('benchmark_participant_sign_in', sign_ins=1,
+                     stdout=StringIO())
+        self.assertEqual(Command.unused_study_id(), '150101990001')
+
+
+class UserRoleTest(TestCase):
+    def test_participant(self):
+        participant = ParticipantFactory(avatar=AvatarFactory())
+        user = User.objects.get(pk=participant.user.pk)
+
+        with self.assertNumQueries(1):
+            role = get_user_role(user)
+            self.assertTrue(user_is_participant(user))
+            self.assertFalse(user_is_facilitator(user))
+            self.assertEqual(role.participant, participant)
+            self.assertEqual(role.avatar, participant.avatar)
+            self.assertEqual(
+                user.profile.participant.avatar.pk, participant.avatar.pk)
+            self.assertEqual(user.profile.participant.study_id,
+                             participant.study_id)
+            self.assertTrue(user.profile.is_participant())
+        self.assertIs(get_user_role(user), role)
+
+    def test_facilitator(self):
+        user = UserFactory()
+        with self.assertNumQueries(1):
+            role = get_user_role(user)
+            self.assertTrue(role.is_facilitator)
+            self.assertFalse(role.is_participant)
+            self.assertFalse(hasattr(user, 'profile'))
+        self.assertIsNone(role.avatar)
+
+    def test_anonymous(self):
+        with self.assertNumQueries(0):
+            role = get_user_role(AnonymousUser())
+        self.assertFalse(role.is_facilitator)
+        self.assertFalse(role.is_participant)
+        self.assertFalse(get_user_role(None).is_participant)
+
+
+class UserRoleMiddlewareTest(LoggedInParticipantTestMixin, TestCase):
+    def test_request_role(self):
+        response = self.client.get('/pages/')
+        role = response.wsgi_request.role
+        self.assertTrue(role.is_participant)
+        self.assertEqual(role.participant, self.participant)
+        self.assertIs(
+            role.participant,
+            get_user_role(response.wsgi_request.user).participant)
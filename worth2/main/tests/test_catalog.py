@@ -0,0 +1,144 @@
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_delete, post_save
+from django.test import TestCase
+
+from worth2.goals.tests.factories import (
+    GoalCheckInOptionFactory, GoalOptionFactory
+)
+from worth2.main.catalog import (
+    get_catalog_version, get_content_catalog, get_form_class
+)
+from worth2.main.models import Location
+from worth2.main.tests.factories import AvatarFactory, LocationFactory
+from worth2.main.tests.mixins import LoggedInSuperuserTestMixin
+from worth2.selftalk.tests.factories import (
+    RefutationFactory, StatementFactory
+)
+
+
+class ContentCatalogTest(TestCase):
+    def setUp(self):
+        self.services = GoalOptionFactory(goal_type='services')
+        self.risk = GoalOptionFactory(goal_type='risk reduction')
+        self.checkin_option = GoalCheckInOptionFactory()
+        self.statement = StatementFactory()
+        self.refutation = RefutationFactory(statement=self.statement)
+        self.avatar = AvatarFactory()
+        self.location = LocationFactory()
+
+    def test_catalog(self):
+        catalog = get_content_catalog()
+        self.assertEqual(catalog.get_goal_options('services'),
+                         [self.services])
+        self.assertEqual(catalog.get_goal_options('risk reduction'),
+                         [self.risk])
+        self.assertEqual(catalog.get_goal_options('social support'), [])
+        self.assertEqual(catalog.get_goal_check_in_options(),
+                         [self.checkin_option])
+        self.assertEqual(catalog.get_statement(self.statement.pk),
+                         self.statement)
+        self.assertEqual(catalog.get_refutations(self.statement.pk),
+                         [self.refutation])
+        self.assertEqual(catalog.get_refutations(0), [])
+        self.assertEqual(catalog.get_refutation(self.refutation.pk),
+                         self.refutation)
+        self.assertEqual(catalog.get_avatars(), [self.avatar])
+        self.assertIsNone(catalog.get_default_avatar())
+        self.assertEqual(catalog.get_locations(), [self.location])
+
+    def test_cached(self):
+        catalog = get_content_catalog()
+        with self.assertNumQueries(0):
+            self.assertIs(get_content_catalog(), catalog)
+
+        refutation = RefutationFactory(statement=self.statement)
+        catalog = get_content_catalog()
+        self.assertEqual(catalog.get_refutations(self.statement.pk),
+                         [self.refutation, refutation])
+
+        self.services.delete()
+        self.assertEqual(get_content_catalog().get_goal_options('services'),
+                         [])
+
+        self.avatar.is_default = True
+        self.avatar.save()
+        self.assertEqual(get_content_catalog().get_default_avatar(),
+                         self.avatar)
+
+        location = LocationFactory()
+        self.assertEqual(get_content_catalog().get_locations(),
+                         [self.location, location])
+
+    def test_get_form_class(self):
+        built = []
+
+        def build(catalog):
+            built.append(catalog)
+            return type('TestForm', (object,), {})
+
+        form_class = get_form_class(('test',), build)
+        with self.assertNumQueries(0):
+            self.assertIs(get_form_class(('test',), build), form_class)
+        self.assertEqual(len(built), 1)
+
+        GoalCheckInOptionFactory()
+        self.assertIsNot(get_form_class(('test',), build), form_class)
+        self.assertEqual(len(built), 2)
+        self.assertEqual(len(built[1].get_goal_check_in_options()), 2)
+
+    def test_avatar_urls(self):
+        catalog = get_content_catalog()
+        self.assertEqual(catalog.get_avatar_url(self.avatar.pk),
+                         self.avatar.image.url)
+        self.assertEqual(catalog.get_avatar_url(0), '')
+        self.assertEqual(catalog.get_default_avatar_url(), '')
+
+        default_avatar = AvatarFactory(is_default=True)
+        catalog = get_content_catalog()
+        self.assertEqual(catalog.get_default_avatar_url(),
+                         default_avatar.image.url)
+
+
+class BumpsCatalogVersionAdminTest(LoggedInSuperuserTestMixin, TestCase):
+    def test_bumped_after_save(self):
+        versions = []
+
+        def saved(sender, **kwargs):
+            # The save hasn't been committed yet
+            versions.append(get_catalog_version())
+
+        post_save.connect(saved, sender=Location)
+        try:
+            response = self.client.post(
+                reverse('admin:main_location_add'), {'name': 'Harlem'})
+        finally:
+            post_save.disconnect(saved, sender=Location)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(versions), 1)
+        self.assertNotEqual(get_catalog_version(), versions[0])
+
+    def test_bumped_after_delete(self):
+        location = LocationFactory()
+        versions = []
+
+        def deleted(sender, **kwargs):
+            versions.append(get_catalog_version())
+
+        post_delete.connect(deleted, sender=Location)
+        try:
+            self.client.post(
+                reverse('admin:main_location_delete', args=(location.pk,)),
+                {'post': 'yes'})
+        finally:
+            post_delete.disconnect(deleted, sender=Location)
+
+        self.assertFalse(Location.objects.exists())
+        self.assertEqual(len(versions), 1)
+        self.assertNotEqual(get_catalog_version(), versions[0])
+
+    def test_not_bumped_when_viewed(self):
+        version = get_catalog_version()
+        self.client.get(reverse('admin:main_location_add'))
+        self.client.get(reverse('admin:main_location_changelist'))
+        self.assertEqual(get_catalog_version(), version)
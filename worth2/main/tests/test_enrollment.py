@@ -0,0 +1,132 @@
+from StringIO import StringIO
+from tempfile import NamedTemporaryFile
+
+from django.contrib.auth import authenticate
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from worth2.main.auth import generate_password, generate_random_usernames
+from worth2.main.enrollment import ParticipantImport
+from worth2.main.models import Participant
+from worth2.main.tests.factories import ParticipantFactory, UserFactory
+
+
+class ParticipantImportTest(TestCase):
+    def setUp(self):
+        self.facilitator = UserFactory()
+
+    def test_from_csv(self):
+        participant_import = ParticipantImport.from_csv(StringIO(
+            'Study ID,Cohort ID\n'
+            '150426781012,123\n'
+            '\n'
+            ' 160022672101 \n'))
+        self.assertEqual(
+            [(row.line, row.study_id, row.cohort_id)
+             for row in participant_import.rows],
+            [(2, '150426781012', '123'), (4, '160022672101', None)])
+
+    def test_is_valid(self):
+        ParticipantFactory(study_id='160022672101')
+        participant_import = ParticipantImport.from_csv(StringIO(
+            '150426781012,123\n'
+            '15042672101\n'
+            '160022672101\n'
+            '150426781012,12\n'))
+        self.assertFalse(participant_import.is_valid())
+
+        errors = participant_import.errors
+        self.assertEqual([row['line'] for row in errors], [2, 3, 4])
+        self.assertEqual(len(errors[0]['errors']), 1)
+        self.assertIn('That study ID isn\'t valid.', errors[0]['errors'][0])
+        self.assertEqual(
+            errors[1]['errors'],
+            ['A participant with this study ID already exists.'])
+        self.assertEqual(
+            errors[2]['errors'],
+            ['That cohort ID isn\'t valid. (It needs to be 3 digits)',
+             'This study ID is repeated on line 1.'])
+
+    def test_save(self):
+        study_ids = ['1504267810%02d' % i for i in range(20)]
+        participant_import = ParticipantImport.from_csv(
+            StringIO('\n'.join(study_ids)))
+        self.assertTrue(participant_import.is_valid())
+
+        with self.assertNumQueries(9):
+            participants = list(participant_import.save(self.facilitator))
+
+        self.assertEqual(sorted(p.study_id for p in participants),
+                         study_ids)
+        participant = Participant.objects.get(study_id=study_ids[0])
+        self.assertEqual(participant.created_by, self.facilitator)
+        self.assertIsNone(participant.cohort_id)
+        self.assertFalse(participant.user.is_active)
+        self.assertTrue(participant.user.profile.is_participant())
+        self.assertFalse(participant.user.has_usable_password())
+        self.assertEqual(
+            authenticate(participant_username=participant.user.username,
+                         participant_password=generate_password(
+                             participant.user.username)),
+            participant.user)
+
+    def test_save_study_id_taken(self):
+        participant_import = ParticipantImport.from_csv(StringIO(
+            '150426781012\n160022672101\n'))
+        self.assertTrue(participant_import.is_valid())
+
+        # Another facilitator enrolls one of them first.
+        ParticipantFactory(study_id='160022672101')
+        self.assertIsNone(participant_import.save(self.facilitator))
+
+        self.assertEqual(
+            participant_import.errors, [{
+                'line': 2,
+                'study_id': '160022672101',
+                'errors': ['A participant with this study ID already '
+                           'exists.'],
+            }])
+        self.assertFalse(Participant.objects.filter(
+            study_id='150426781012').exists())
+        self.assertEqual(Participant.objects.count(), 1)
+
+    def test_generate_random_usernames(self):
+        usernames = generate_random_usernames(50)
+        self.assertEqual(len(set(usernames)), 50)
+        for username in usernames:
+            self.assertRegexpMatches(username, r'^participant_\d{7}$')
+
+
+class ImportParticipantsCommandTest(TestCase):
+    def setUp(self):
+        self.facilitator = UserFactory(username='facilitator')
+
+    def call_command(self, csv_text, *args):
+        out = StringIO()
+        with NamedTemporaryFile(suffix='.csv') as f:
+            f.write(csv_text)
+            f.flush()
+            call_command('import_participants', f.name,
+                         *(args or ('--created-by=facilitator',)),
+                         stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_import(self):
+        out = self.call_command('150426781012\n160022672101,123\n')
+        self.assertIn('Created 2 participants.', out)
+        self.assertEqual(
+            Participant.objects.get(study_id='160022672101').cohort_id,
+            '123')
+
+    def test_invalid(self):
+        with self.assertRaises(CommandError):
+            self.call_command('150426781012\n15042672101\n')
+        self.assertEqual(Participant.objects.count(), 0)
+
+    def test_created_by(self):
+        with self.assertRaises(CommandError):
+            self.call_command('150426781012\n', '--verbosity=1')
+        with self.assertRaises(CommandError):
+            self.call_command('150426781012\n', '--created-by=nobody')
+        self.assertEqual(Participant.objects.count(), 0)
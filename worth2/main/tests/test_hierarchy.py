@@ -0,0 +1,212 @@
+from django.test import TestCase
+from pagetree.helpers import get_hierarchy
+from pagetree.models import PageBlock, Section
+
+from worth2.goals.tests.factories import GoalSettingBlockFactory
+from worth2.main.hierarchy import (
+    get_css_class_quiz_index, get_hierarchy_snapshot,
+    get_hierarchy_snapshot_by_id, get_section_block_index,
+    get_section_pageblocks
+)
+
+
+class HierarchyTestMixin(object):
+    def setUp(self):
+        self.hierarchy = get_hierarchy('main', '/pages/')
+        root = self.hierarchy.get_root()
+        root.add_child_section_from_dict({
+            'label': 'Session 1',
+            'slug': 'session-1',
+            'children': [{
+                'label': 'Intro',
+                'slug': 'intro',
+                'pageblocks': [{
+                    'block_type': 'Text Block',
+                    'body': 'Welcome',
+                }],
+                'children': [{'label': 'Deep', 'slug': 'deep'}],
+            }, {
+                'label': 'Outro',
+                'slug': 'outro',
+            }],
+        })
+        root.add_child_section_from_dict({
+            'label': 'Session 2',
+            'slug': 'session-2',
+        })
+        root.add_child_section_from_dict({
+            'label': 'Resources',
+            'slug': 'resources',
+        })
+
+
+class HierarchySnapshotTest(HierarchyTestMixin, TestCase):
+    def test_lookups(self):
+        snapshot = get_hierarchy_snapshot()
+        root = self.hierarchy.get_root()
+        session_1 = Section.objects.get(slug='session-1')
+        deep = Section.objects.get(slug='deep')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_hierarchy_snapshot(), snapshot)
+            self.assertEqual(
+                get_hierarchy_snapshot_by_id(self.hierarchy.id), snapshot)
+
+            self.assertEqual(snapshot.page_count, 6)
+            self.assertEqual(
+                [s.slug for s in snapshot.get_modules()],
+                ['session-1', 'session-2', 'resources'])
+            self.assertEqual(
+                [s.slug for s in snapshot.get_children(session_1.id)],
+                ['intro', 'outro'])
+            self.assertEqual(
+                snapshot.get_section_by_slug('outro').label, 'Outro')
+            self.assertEqual(snapshot.get_module(deep.id), session_1)
+            self.assertIsNone(snapshot.get_module(root.id))
+
+            self.assertEqual(snapshot.get_module_number(deep.id), 1)
+            self.assertEqual(snapshot.get_module_number(root.id), -1)
+            self.assertEqual(snapshot.get_module_number(
+                snapshot.get_section_by_slug('session-2').id), 2)
+            self.assertEqual(snapshot.get_module_number(
+                snapshot.get_section_by_slug('resources').id), -1)
+
+            self.assertEqual(snapshot.get_next(deep.id).slug, 'outro')
+            self.assertIsNone(snapshot.get_previous(session_1.id))
+            self.assertIsNone(snapshot.get_next(
+                snapshot.get_section_by_slug('resources').id))
+
+        self.assertEqual(snapshot.get_next(deep.id), deep.get_next())
+        self.assertEqual(snapshot.get_previous(deep.id), deep.get_previous())
+        self.assertEqual(
+            list(snapshot.get_descendant_ids(session_1.id)),
+            [s.id for s in session_1.get_descendants()])
+        self.assertEqual(
+            list(snapshot.get_descendant_ids(root.id)),
+            [s.id for s in root.get_descendants()])
+
+        with self.assertRaises(Section.DoesNotExist):
+            snapshot.get_section_by_slug('session-3')
+
+    def test_descendant_ids_are_immutable(self):
+        snapshot = get_hierarchy_snapshot()
+        session_1 = Section.objects.get(slug='session-1')
+        ids = snapshot.get_descendant_ids(session_1.id)
+        with self.assertRaises(AttributeError):
+            ids.append(session_1.id)
+
+    def test_rebuilt_on_edit(self):
+        snapshot = get_hierarchy_snapshot()
+        session_2 = Section.objects.get(slug='session-2')
+        session_2.append_child('Goals', 'goals')
+
+        new_snapshot = get_hierarchy_snapshot()
+        self.assertNotEqual(new_snapshot.version, snapshot.version)
+        self.assertEqual(new_snapshot.page_count, 7)
+        self.assertEqual(new_snapshot.get_module_number(
+            new_snapshot.get_section_by_slug('goals').id), 2)
+
+
+class SectionBlockIndexTest(HierarchyTestMixin, TestCase):
+    def setUp(self):
+        super(SectionBlockIndexTest, self).setUp()
+        intro = Section.objects.get(slug='intro')
+        for goal_type in ('services', 'risk reduction'):
+            intro.append_pageblock(
+                '', '', GoalSettingBlockFactory(goal_type=goal_type))
+
+    def test_lookups(self):
+        intro = Section.objects.get(slug='intro')
+        index = get_section_block_index(intro)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_section_block_index(intro), index)
+            self.assertEqual(len(index.entries), 3)
+            self.assertTrue(index.has_responses())
+            self.assertIsNone(
+                index.get_first_block('selftalk', 'statementblock'))
+
+        with self.assertNumQueries(1):
+            pageblock = index.get_first_block('goals', 'goalsettingblock')
+        self.assertEqual(pageblock.block().goal_type, 'services')
+
+        pageblock = index.get_first_block(
+            'goals', 'goalsettingblock',
+            lambda b: b.block().goal_type == 'risk reduction')
+        self.assertEqual(pageblock.block().goal_type, 'risk reduction')
+
+        self.assertFalse(get_section_block_index(
+            Section.objects.get(slug='deep')).has_responses())
+
+    def test_rebuilt_on_edit(self):
+        deep = Section.objects.get(slug='deep')
+        self.assertEqual(len(get_section_block_index(deep).entries), 0)
+
+        deep.append_pageblock('', '', GoalSettingBlockFactory())
+        self.assertTrue(get_section_block_index(deep).has_responses())
+
+    def test_get_section_pageblocks(self):
+        intro = Section.objects.get(slug='intro')
+        # The text block and the goal setting blocks.
+        with self.assertNumQueries(3):
+            pageblocks = get_section_pageblocks(intro)
+        with self.assertNumQueries(0):
+            blocks = [p.block() for p in pageblocks]
+        self.assertEqual(
+            [b.__class__.__name__ for b in blocks],
+            ['TextBlock', 'GoalSettingBlock', 'GoalSettingBlock'])
+        self.assertEqual(blocks[2].goal_type, 'risk reduction')
+
+
+class CssClassQuizIndexTest(HierarchyTestMixin, TestCase):
+    def setUp(self):
+        super(CssClassQuizIndexTest, self).setUp()
+        self.add_quiz('deep', 'i-am-worth-it-quiz extra')
+        self.add_quiz('outro', 'rate-my-risk')
+        self.add_quiz('session-2', 'i-am-worth-it-quiz')
+
+    def add_quiz(self, slug, css_extra):
+        Section.objects.get(slug=slug).add_pageblock_from_dict({
+            'block_type': 'Quiz',
+            'description': '',
+            'rhetorical': False,
+            'allow_redo': True,
+            'show_submit_state': True,
+            'css_extra': css_extra,
+            'questions': [],
+        })
+
+    def quiz_ids(self, slug):
+        return tuple(
+            Section.objects.get(slug=slug).pageblock_set.values_list(
+                'object_id', flat=True))
+
+    def test_lookups(self):
+        index = get_css_class_quiz_index()
+        deep_ids = self.quiz_ids('deep')
+        session_2_ids = self.quiz_ids('session-2')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_css_class_quiz_index(), index)
+            self.assertEqual(
+                index.get_quiz_ids('i-am-worth-it-quiz', 1), deep_ids)
+            self.assertEqual(
+                index.get_quiz_ids('i-am-worth-it-quiz', 2), session_2_ids)
+            self.assertEqual(index.get_quiz_ids('extra', 1), deep_ids)
+            self.assertEqual(index.get_quiz_ids('rate-my-risk', 2), ())
+            self.assertEqual(index.get_quiz_ids('quiz', 1), ())
+            self.assertEqual(
+                index.get_quiz_ids('i-am-worth-it-quiz'),
+                deep_ids + session_2_ids)
+
+    def test_rebuilt_on_edit(self):
+        index = get_css_class_quiz_index()
+        pageblock = PageBlock.objects.get(css_extra='rate-my-risk')
+        pageblock.css_extra = 'safety-plan-quiz'
+        pageblock.save()
+
+        new_index = get_css_class_quiz_index()
+        self.assertNotEqual(new_index, index)
+        self.assertEqual(new_index.get_quiz_ids('rate-my-risk', 1), ())
+        self.assertEqual(new_index.get_quiz_ids('safety-plan-quiz', 1),
+                         self.quiz_ids('outro'))
@@ -0,0 +1,189 @@
+from django.core.signals import request_finished
+from django.test import TestCase
+from pagetree.helpers import get_hierarchy
+from pagetree.models import Section
+from quizblock.models import Answer, Response, Submission
+
+from worth2.goals.models import GoalSettingResponse
+from worth2.goals.tests.factories import (
+    GoalSettingBlockFactory, GoalSettingResponseFactory
+)
+from worth2.main.hierarchy import get_hierarchy_snapshot
+from worth2.main.journal import get_journal_snapshot, get_journal_version
+from worth2.main.tests.factories import ParticipantFactory
+from worth2.ssnm.tests.factories import SupporterFactory
+
+
+class JournalSnapshotTest(TestCase):
+    def setUp(self):
+        self.user = ParticipantFactory().user
+
+        root = get_hierarchy('main', '/pages/').get_root()
+        for i in range(1, 6):
+            root.add_child_section_from_dict({
+                'label': 'Session %d' % i,
+                'slug': 'session-%d' % i,
+                'children': [{
+                    'label': 'I am WORTH it',
+                    'slug': 'i-am-worth-it-%d' % i,
+                    'pageblocks': [{
+                        'block_type': 'Quiz',
+                        'description': '',
+                        'rhetorical': False,
+                        'allow_redo': True,
+                        'show_submit_state': True,
+                        'css_extra': 'i-am-worth-it-quiz',
+                        'questions': [{
+                            'text': 'I am',
+                            'question_type': 'single choice',
+                            'explanation': '',
+                            'intro_text': '',
+                            'answers': [{
+                                'value': '1',
+                                'label': 'Strong',
+                                'correct': False,
+                            }, {
+                                'value': '2',
+                                'label': 'Smart',
+                                'correct': False,
+                            }],
+                        }],
+                    }],
+                }],
+            })
+
+        self.services_block = GoalSettingBlockFactory(goal_type='services')
+        Section.objects.get(slug='i-am-worth-it-1').append_pageblock(
+            '', '', self.services_block)
+        self.risk_block = GoalSettingBlockFactory(goal_type='risk reduction')
+        Section.objects.get(slug='session-2').append_pageblock(
+            '', '', self.risk_block)
+
+    def submit_quiz(self, session_num, value):
+        quiz = Section.objects.get(
+            slug='i-am-worth-it-%d' % session_num).pageblock_set.first(
+        ).block()
+        submission = Submission.objects.create(quiz=quiz, user=self.user)
+        Response.objects.create(
+            submission=submission, question=quiz.question_set.first(),
+            value=value)
+
+    def test_matches_queries(self):
+        GoalSettingResponseFactory(
+            user=self.user, goal_setting_block=self.services_block)
+        GoalSettingResponseFactory(
+            user=self.user, goal_setting_block=self.risk_block)
+        GoalSettingResponseFactory(goal_setting_block=self.risk_block)
+        self.submit_quiz(2, '2')
+        self.submit_quiz(3, '1')
+        SupporterFactory(user=self.user)
+
+        journal = get_journal_snapshot(self.user, get_hierarchy_snapshot())
+
+        session_1 = journal.get_session(1)
+        self.assertEqual(
+            [r.text for r in session_1['goals_services_responses']],
+            [r.text for r in GoalSettingResponse.objects.find_by_module(
+                self.user, 'services', 1)])
+        self.assertNotIn('i_am_worth_it_responses', session_1)
+
+        session_2 = journal.get_session(2)
+        self.assertEqual(len(session_2['goals_risk_responses']), 1)
+        self.assertEqual(
+            session_2['goals_risk_responses'][0].option,
+            unicode(GoalSettingResponse.objects.find_by_module(
+                self.user, 'risk reduction', 2).first().option))
+        self.assertEqual(session_2['goals_services_responses'], [])
+        self.assertEqual(
+            [(r.question, r.value, r.answer)
+             for r in session_2['i_am_worth_it_responses']],
+            [('I am', '2', 'Smart')])
+        self.assertIsNone(session_2['rate_my_risk_response'])
+
+        self.assertEqual(
+            [r.answer for r in
+             journal.get_session(3)['i_am_worth_it_responses']],
+            ['Strong'])
+        self.assertEqual(len(journal.get_session(3)['supporters']), 1)
+        self.assertEqual(journal.get_session(4)['mylength'], 0)
+        self.assertIsNone(journal.get_session(6))
+
+    def test_cached(self):
+        snapshot = get_hierarchy_snapshot()
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(journal.get_session(2)['i_am_worth_it_responses'],
+                         [])
+
+        with self.assertNumQueries(0):
+            get_journal_snapshot(self.user, snapshot)
+
+        self.submit_quiz(2, '1')
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(
+            [r.answer for r in
+             journal.get_session(2)['i_am_worth_it_responses']],
+            ['Strong'])
+
+        Response.objects.filter(submission__user=self.user).update(
+            value='2')
+        Response.objects.filter(submission__user=self.user).first().save()
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(
+            [r.answer for r in
+             journal.get_session(2)['i_am_worth_it_responses']],
+            ['Smart'])
+
+        GoalSettingResponseFactory(
+            user=self.user, goal_setting_block=self.risk_block)
+        supporter = SupporterFactory(user=self.user)
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(len(journal.get_session(2)['goals_risk_responses']),
+                         1)
+        self.assertEqual(len(journal.get_session(3)['supporters']), 1)
+
+        supporter.delete()
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(journal.get_session(3)['supporters'], [])
+
+    def test_goal_option_renamed(self):
+        snapshot = get_hierarchy_snapshot()
+        response = GoalSettingResponseFactory(
+            user=self.user, goal_setting_block=self.risk_block)
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(
+            journal.get_session(2)['goals_risk_responses'][0].option,
+            unicode(response.option))
+
+        response.option.text = 'Renamed'
+        response.option.save()
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(
+            journal.get_session(2)['goals_risk_responses'][0].option,
+            'Renamed')
+
+    def test_answer_relabelled(self):
+        snapshot = get_hierarchy_snapshot()
+        self.submit_quiz(2, '1')
+        get_journal_snapshot(self.user, snapshot)
+
+        Answer.objects.filter(value='1').update(label='Brave')
+        Answer.objects.filter(value='1').first().save()
+        journal = get_journal_snapshot(self.user, snapshot)
+        self.assertEqual(
+            [r.answer for r in
+             journal.get_session(2)['i_am_worth_it_responses']],
+            ['Brave'])
+
+    def test_bumped_after_commit(self):
+        supporter = SupporterFactory(user=self.user)
+        # Deletions send their signals before they're committed
+        supporter.delete()
+        version = get_journal_version(self.user.id)
+
+        request_finished.send(sender=self.__class__)
+        self.assertNotEqual(get_journal_version(self.user.id), version)
+
+        # Once they've been repeated, they're forgotten
+        version = get_journal_version(self.user.id)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(get_journal_version(self.user.id), version)
@@ -1,11 +1,16 @@
 from datetime import datetime
+from StringIO import StringIO
 
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db.models.signals import pre_save
 from django.test import TestCase
 from pagetree.tests.factories import ModuleFactory
 from pagetree.models import Hierarchy, Section
 
-from worth2.main.models import Participant
+from worth2.main.generic.models import BaseUserProfile
+from worth2.main.hierarchy import get_hierarchy_snapshot
+from worth2.main.models import Participant, ProgressSummary, WatchedVideo
 from worth2.main.tests.factories import (
     AvatarFactory, EncounterFactory, LocationFactory, ParticipantFactory,
     VideoBlockFactory, WatchedVideoFactory, UserPageVisitFactory
@@ -152,6 +157,112 @@ class ParticipantTest(TestCase):
         self.assertEqual(s, None)
 
 
+class ProgressSummaryTest(TestCase):
+    def setUp(self):
+        self.participant = ParticipantFactory()
+        self.user = self.participant.user
+        ModuleFactory('main', 'main')
+        self.section1 = Section.objects.get(slug='one')
+        self.section2 = Section.objects.get(slug='two')
+
+    def assertMatchesRebuild(self):
+        summary = ProgressSummary.objects.get(user=self.user)
+        rebuilt = ProgressSummary.objects.rebuild(self.user.id)
+        for field in ('last_section', 'last_visit', 'highest_section',
+                      'visit_count'):
+            self.assertEqual(getattr(summary, field),
+                             getattr(rebuilt, field), field)
+
+    def test_updated_on_visit(self):
+        self.assertEqual(self.participant.percent_complete(), 0)
+        self.assertIsNone(self.participant.last_location())
+
+        upv1 = UserPageVisitFactory(user=self.user, section=self.section1)
+        UserPageVisitFactory(user=self.user, section=self.section2)
+        self.assertMatchesRebuild()
+
+        summary = ProgressSummary.objects.get(user=self.user)
+        self.assertEqual(summary.visit_count, 2)
+        self.assertEqual(summary.last_section, self.section2)
+        self.assertEqual(summary.highest_section, self.section2)
+
+        upv1.status = 'complete'
+        upv1.save()
+        self.assertMatchesRebuild()
+        summary = ProgressSummary.objects.get(user=self.user)
+        self.assertEqual(summary.visit_count, 2)
+        self.assertEqual(summary.last_section, self.section1)
+        self.assertEqual(summary.last_visit, upv1.last_visit)
+        self.assertEqual(summary.highest_section, self.section2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.participant.last_location(), self.section1)
+        self.assertEqual(self.participant.last_access_hierarchy(),
+                         upv1.last_visit)
+
+        upv1.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.participant.last_location(), self.section2)
+
+    def test_percent_complete(self):
+        # The root isn't one of the hierarchy's pages
+        UserPageVisitFactory(user=self.user, section=self.section1.get_root())
+        self.assertEqual(self.participant.percent_complete(), 0)
+
+        UserPageVisitFactory(user=self.user, section=self.section1)
+        self.assertMatchesRebuild()
+        expected = int(100 / float(get_hierarchy_snapshot().page_count))
+        self.assertEqual(self.participant.percent_complete(), expected)
+        self.assertEqual(BaseUserProfile.percent_complete_hierarchy(
+            self.participant), expected)
+
+    def test_built_when_missing(self):
+        UserPageVisitFactory(user=self.user, section=self.section1)
+        ProgressSummary.objects.all().delete()
+
+        self.assertEqual(self.participant.last_location(), self.section1)
+        self.assertEqual(
+            ProgressSummary.objects.get(user=self.user).visit_count, 1)
+
+        UserPageVisitFactory(user=self.user, section=self.section2)
+        self.assertEqual(
+            ProgressSummary.objects.get(user=self.user).visit_count, 2)
+
+    def test_first_visits_race(self):
+        UserPageVisitFactory(user=self.user, section=self.section1)
+        ProgressSummary.objects.all().delete()
+
+        # Another request creates the summary, without this visit, just
+        # before this one does.
+        def create_first(sender, instance, **kwargs):
+            pre_save.disconnect(create_first, sender=ProgressSummary)
+            ProgressSummary.objects.bulk_create([
+                ProgressSummary(user_id=instance.user_id, visit_count=0)])
+        pre_save.connect(create_first, sender=ProgressSummary)
+        try:
+            UserPageVisitFactory(user=self.user, section=self.section2)
+        finally:
+            pre_save.disconnect(create_first, sender=ProgressSummary)
+
+        summary = ProgressSummary.objects.get(user=self.user)
+        self.assertEqual(summary.visit_count, 2)
+        self.assertEqual(summary.last_section, self.section2)
+
+    def test_rebuild_command(self):
+        UserPageVisitFactory(user=self.user, section=self.section1)
+        UserPageVisitFactory(user=self.user, section=self.section2)
+        ProgressSummary.objects.filter(user=self.user).update(
+            visit_count=0, last_section=None, highest_section=None)
+
+        out = StringIO()
+        call_command('rebuild_progress_summaries', stdout=out)
+        self.assertIn('Rebuilt 1 progress summaries.', out.getvalue())
+
+        summary = ProgressSummary.objects.get(user=self.user)
+        self.assertEqual(summary.visit_count, 2)
+        self.assertEqual(summary.highest_section, self.section2)
+
+
 class ParticipantManagerTest(TestCase):
     def test_cohort_ids_empty(self):
         self.assertEqual(Participant.objects.cohort_ids(), [])
@@ -202,6 +313,26 @@ class WatchedVideoTest(TestCase):
     def test_is_valid_from_factory(self):
         self.watched_video.full_clean()
 
+    def test_record(self):
+        user = self.watched_video.user
+        with self.assertNumQueries(4):
+            new_ids = WatchedVideo.objects.record(
+                user, [self.watched_video.video_id, 'abc', 'def', 'abc'])
+        self.assertEqual(new_ids, set(['abc', 'def']))
+
+        self.assertEqual(WatchedVideo.objects.record(user, ['abc']), set())
+        self.assertEqual(
+            sorted(user.watched_videos.values_list('video_id', flat=True)),
+            sorted(['abc', 'def', self.watched_video.video_id]))
+
+    def test_watched_video_ids(self):
+        block = VideoBlockFactory(video_id=self.watched_video.video_id)
+        other_block = VideoBlockFactory()
+        self.assertEqual(
+            WatchedVideo.objects.watched_video_ids(
+                self.watched_video.user, [block.pk, other_block.pk]),
+            [self.watched_video.video_id])
+
 
 class UserPageVisitFactoryTest(TestCase):
     def setUp(self):
@@ -0,0 +1,154 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from pagetree.helpers import get_hierarchy
+from pagetree.models import Section, UserPageVisit
+from quizblock.models import Submission
+
+from worth2.goals.tests.factories import (
+    GoalCheckInBlockFactory, GoalCheckInResponseFactory,
+    GoalSettingBlockFactory, GoalSettingResponseFactory
+)
+from worth2.main.hierarchy import get_hierarchy_snapshot
+from worth2.main.models import AvatarSelectorBlock
+from worth2.main.progress import get_user_progress
+from worth2.main.tests.factories import AvatarFactory, ParticipantFactory
+from worth2.selftalk.tests.factories import (
+    InternalRefutationBlockFactory, RefutationResponseFactory,
+    StatementResponseFactory
+)
+
+
+class UserProgressTest(TestCase):
+    def setUp(self):
+        self.participant = ParticipantFactory()
+        self.user = self.participant.user
+
+        hierarchy = get_hierarchy('main', '/pages/')
+        hierarchy.get_root().add_child_section_from_dict({
+            'label': 'Session 1',
+            'slug': 'session-1',
+            'show_toc': True,
+            'children': [{
+                'label': 'Quiz',
+                'slug': 'quiz',
+                'pageblocks': [{
+                    'block_type': 'Quiz',
+                    'description': '',
+                    'rhetorical': False,
+                    'allow_redo': True,
+                    'show_submit_state': True,
+                    'questions': [],
+                }, {
+                    'block_type': 'Text Block',
+                    'body': 'Some text',
+                }],
+            }, {
+                'label': 'Goals',
+                'slug': 'goals',
+            }, {
+                'label': 'Check in',
+                'slug': 'check-in',
+            }, {
+                'label': 'Self talk',
+                'slug': 'self-talk',
+            }, {
+                'label': 'Avatar',
+                'slug': 'avatar',
+            }],
+        })
+
+        self.quiz = Section.objects.get(slug='quiz').pageblock_set.first(
+        ).block()
+        self.goalsettingblock = GoalSettingBlockFactory()
+        Section.objects.get(slug='goals').append_pageblock(
+            '', '', self.goalsettingblock)
+        Section.objects.get(slug='check-in').append_pageblock(
+            '', '', GoalCheckInBlockFactory(
+                goal_setting_block=self.goalsettingblock))
+        self.refutationblock = InternalRefutationBlockFactory()
+        self_talk = Section.objects.get(slug='self-talk')
+        self_talk.append_pageblock(
+            '', '', self.refutationblock.statement_block)
+        self_talk.append_pageblock('', '', self.refutationblock)
+        Section.objects.get(slug='avatar').append_pageblock(
+            '', '', AvatarSelectorBlock.objects.create())
+
+    def assertMatchesPagetree(self, progress):
+        for section in Section.objects.filter(hierarchy__name='main'):
+            self.assertEqual(progress.is_unlocked(section.id),
+                             section.unlocked(self.user),
+                             section.slug)
+            self.assertEqual(progress.is_submitted(section.id),
+                             section.submitted(self.user),
+                             section.slug)
+
+    def test_matches_pagetree(self):
+        snapshot = get_hierarchy_snapshot()
+        progress = get_user_progress(self.user, snapshot)
+        self.assertMatchesPagetree(progress)
+        self.assertFalse(progress.is_unlocked(
+            Section.objects.get(slug='quiz').id))
+        self.assertTrue(progress.is_unlocked(
+            Section.objects.get(slug='check-in').id))
+
+        Submission.objects.create(quiz=self.quiz, user=self.user)
+        response = GoalSettingResponseFactory(
+            user=self.user, goal_setting_block=self.goalsettingblock)
+        StatementResponseFactory(
+            user=self.user,
+            statement_block=self.refutationblock.statement_block)
+        self.participant.avatar = AvatarFactory()
+        self.participant.save()
+        self.user = User.objects.get(pk=self.user.pk)
+
+        progress = get_user_progress(self.user, snapshot)
+        self.assertMatchesPagetree(progress)
+        self.assertFalse(progress.is_unlocked(
+            Section.objects.get(slug='check-in').id))
+        self.assertFalse(progress.is_unlocked(
+            Section.objects.get(slug='self-talk').id))
+
+        GoalCheckInResponseFactory(goal_setting_response=response)
+        RefutationResponseFactory(
+            user=self.user, refutation_block=self.refutationblock)
+
+        progress = get_user_progress(self.user, snapshot)
+        self.assertMatchesPagetree(progress)
+        for section in Section.objects.filter(hierarchy__name='main'):
+            self.assertTrue(progress.is_submitted(section.id), section.slug)
+
+    def test_cached(self):
+        snapshot = get_hierarchy_snapshot()
+        get_user_progress(self.user, snapshot)
+
+        # Only the visits are loaded again.
+        with self.assertNumQueries(1):
+            progress = get_user_progress(self.user, snapshot)
+        quiz_page = Section.objects.get(slug='quiz')
+        self.assertFalse(progress.is_submitted(quiz_page.id))
+
+        Submission.objects.create(quiz=self.quiz, user=self.user)
+        progress = get_user_progress(self.user, snapshot)
+        self.assertTrue(progress.is_submitted(quiz_page.id))
+
+        Submission.objects.filter(user=self.user).delete()
+        progress = get_user_progress(self.user, snapshot)
+        self.assertFalse(progress.is_submitted(quiz_page.id))
+
+    def test_toc(self):
+        UserPageVisit.objects.create(
+            user=self.user, section=Section.objects.get(slug='quiz'),
+            status='complete')
+        progress = get_user_progress(self.user, get_hierarchy_snapshot())
+
+        toc = progress.get_toc(Section.objects.get(slug='session-1'))
+        self.assertEqual(
+            [entry['section'].slug for entry in toc],
+            ['quiz', 'goals', 'check-in', 'self-talk', 'avatar'])
+        self.assertEqual(toc[0]['url'], '/pages/session-1/quiz/')
+        self.assertTrue(toc[0]['visited'])
+        self.assertFalse(toc[0]['unlocked'])
+        self.assertFalse(toc[1]['visited'])
+
+        self.assertEqual(
+            progress.get_toc(Section.objects.get(slug='quiz')), [])
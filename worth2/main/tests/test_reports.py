@@ -1,16 +1,35 @@
+from StringIO import StringIO
 import datetime
 
 from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse
-from django.test.testcases import TransactionTestCase
+from django.utils import timezone
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test.testcases import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from pagetree.helpers import get_hierarchy
 from pagetree.models import Hierarchy, Section, UserPageVisit
+from pagetree.reports import PagetreeReport
 from pagetree.tests.factories import ModuleFactory
+from quizblock.models import Question, Quiz, Response, Submission
 
-from worth2.main.reports import ParticipantReport
+from worth2.goals.tests.factories import (
+    GoalCheckInBlockFactory, GoalCheckInResponseFactory,
+    GoalSettingBlockFactory, GoalSettingResponseFactory
+)
+from worth2.main.models import ParticipantReportRow, ReportJob
+from worth2.main.reports import (
+    ParticipantReport, ParticipantReportData, ParticipantReportRowStore,
+    get_report_content_version, report_data_version, run_report_job
+)
 from worth2.main.tests.factories import (
     EncounterFactory, ParticipantFactory, UserFactory, LocationFactory
 )
+from worth2.ssnm.models import SsnmReport
+from worth2.ssnm.tests.factories import SupporterFactory
 
 
 class ParticipantReportTest(TransactionTestCase):
@@ -84,6 +103,32 @@ class ParticipantReportTest(TransactionTestCase):
 
         self.assertIsNone(report.encounter_id(the_participant, 0, module, 2))
 
+    def test_encounter_index(self):
+        report = ParticipantReport(self.hierarchy)
+        the_participant = self.participant.profile.participant
+        module_one = Section.objects.get(slug='one')
+        module_two = Section.objects.get(slug='two')
+        report.section_modules()
+
+        e1 = EncounterFactory(participant=the_participant,
+                              section=Section.objects.get(slug='introduction'))
+        e2 = EncounterFactory(participant=the_participant, section=module_two)
+        e3 = EncounterFactory(participant=the_participant, section=module_one)
+        EncounterFactory(participant=self.participant2.profile.participant,
+                         section=module_one)
+
+        with self.assertNumQueries(1):
+            index = report.encounter_index([self.participant.id])
+
+        self.assertEquals(len(index), 2)
+        self.assertEquals(
+            index[(the_participant.id, module_one.id)],
+            [(e.facilitator_id, e.created_at, e.location_id)
+             for e in (e1, e3)])
+        self.assertEquals(
+            index[(the_participant.id, module_two.id)],
+            [(e2.facilitator_id, e2.created_at, e2.location_id)])
+
     def test_percent_complete(self):
         report = ParticipantReport(self.hierarchy)
         root = self.hierarchy.get_root()
@@ -292,39 +337,443 @@ class ParticipantReportTest(TransactionTestCase):
         self.client.login(username=self.staff.username, password="test")
         data = {'report-type': 'keys'}
         response = self.client.post(self.report_url, data)
-        self.assertEquals(response.status_code, 200)
+        self.assertRedirects(response, self.report_url)
+
+        job = ReportJob.objects.get()
+        self.assertEquals(job.report_type, 'keys')
+        self.assertEquals(job.status, 'pending')
+        self.assertEquals(job.requested_by, self.staff)
 
     def test_post_values(self):
         self.client.login(username=self.staff.username, password="test")
         data = {'report-type': 'values'}
         response = self.client.post(self.report_url, data)
-        self.assertEquals(response.status_code, 200)
+        self.assertRedirects(response, self.report_url)
+
+        job = ReportJob.objects.get()
+        self.assertEquals(job.report_type, 'values')
+
+        # Asking again for the same data returns the queued job
+        self.client.post(self.report_url, data)
+        self.assertEquals(ReportJob.objects.count(), 1)
+
+        run_report_job(job)
+        self.client.post(self.report_url, data)
+        self.assertEquals(ReportJob.objects.count(), 1)
+
+        # Once the data changes, a new job is queued
+        UserPageVisit.objects.create(
+            user=self.participant, section=Section.objects.get(slug='one'),
+            status="complete")
+        self.client.post(self.report_url, data)
+        self.assertEquals(ReportJob.objects.count(), 2)
 
     def test_post_facilitators(self):
         self.client.login(username=self.staff.username, password="test")
         data = {'report-type': 'facilitators'}
         response = self.client.post(self.report_url, data)
-        self.assertEquals(response.status_code, 200)
-
-        self.assertEquals(response.streaming_content.next(),
-                          'Facilitator ID,Facilitator Name\r\n')
+        self.assertEquals(response.status_code, 302)
 
-        val = 'f1,Facilitator One\r\n'
-        self.assertTrue(val in response.streaming_content.next())
+        job = run_report_job(ReportJob.objects.get())
+        self.assertEquals(job.status, 'complete')
+        self.assertEquals(job.rows_written, 2)
 
-        with self.assertRaises(StopIteration):
-            response.streaming_content.next()
+        lines = job.open_artifact().readlines()
+        self.assertEquals(lines[0], 'Facilitator ID,Facilitator Name\r\n')
+        self.assertTrue('f1,Facilitator One\r\n' in lines[1])
+        self.assertEquals(len(lines), 2)
 
     def test_post_locations(self):
         self.client.login(username=self.staff.username, password="test")
         data = {'report-type': 'locations'}
         response = self.client.post(self.report_url, data)
+        self.assertEquals(response.status_code, 302)
+
+        job = run_report_job(ReportJob.objects.get())
+        lines = job.open_artifact().readlines()
+        self.assertEquals(lines[0], 'Location ID,Location Name\r\n')
+        self.assertTrue('Butler\r\n' in lines[1])
+        self.assertEquals(len(lines), 2)
+
+    def test_download(self):
+        job = ReportJob.objects.create(
+            report_type='locations', hierarchy=self.hierarchy,
+            data_version=report_data_version(self.hierarchy))
+        url = reverse('report-job-download', args=[job.pk])
+
+        self.client.login(username=self.staff.username, password="test")
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, 404)
+
+        run_report_job(job)
+        response = self.client.get(self.report_url)
+        self.assertContains(response, url)
+
+        response = self.client.get(url)
         self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Disposition'],
+                          'attachment; filename="worth2_locations.csv"')
+        self.assertTrue(
+            'Butler' in ''.join(response.streaming_content))
 
-        self.assertEquals(response.streaming_content.next(),
-                          'Location ID,Location Name\r\n')
-        val = 'Butler\r\n'
-        self.assertTrue(val in response.streaming_content.next())
+    def test_process_report_jobs(self):
+        job = ReportJob.objects.create(
+            report_type='values', hierarchy=self.hierarchy,
+            data_version=report_data_version(self.hierarchy))
 
-        with self.assertRaises(StopIteration):
-            response.streaming_content.next()
+        call_command('process_report_jobs', stdout=StringIO())
+
+        job = ReportJob.objects.get(pk=job.pk)
+        self.assertEquals(job.status, 'complete')
+        self.assertEquals(job.progress(), 100)
+        self.assertEquals(job.rows_total, 1)
+        self.assertEquals(job.open_artifact().read(), ''.join(
+            '%s\r\n' % ','.join(row) for row in
+            ParticipantReport(self.hierarchy).values([self.hierarchy])))
+
+
+class ParticipantReportRowStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ModuleFactory('main', '/pages/')
+        self.hierarchy = Hierarchy.objects.get(name='main')
+        self.report = ParticipantReport(self.hierarchy)
+        self.hierarchies = [self.hierarchy]
+
+    def get_store(self):
+        return ParticipantReportRowStore(
+            self.report, self.report.value_columns(self.hierarchies))
+
+    def test_columns_version_follows_sections(self):
+        version = self.get_store().columns_version
+        self.assertEquals(self.get_store().columns_version, version)
+
+        # An empty section doesn't change the headers, but it does
+        # change the progress values.
+        Section.objects.get(slug='two').add_child_section_from_dict(
+            {'label': 'Five', 'slug': 'five'})
+        self.assertNotEquals(self.get_store().columns_version, version)
+
+    def test_claim_rows_created_concurrently(self):
+        users = [UserFactory(), UserFactory()]
+
+        class RacingStore(ParticipantReportRowStore):
+            def missing_user_ids(self, user_ids):
+                # Another refresh creates the first user's row right
+                # after it's found missing.
+                missing = super(RacingStore, self).missing_user_ids(
+                    user_ids)
+                ParticipantReportRow.objects.create(
+                    user=users[0], hierarchy=self.report.hierarchy)
+                return missing
+
+        RacingStore(self.report, []).claim(users)
+        rows = ParticipantReportRow.objects.filter(hierarchy=self.hierarchy)
+        self.assertEquals(
+            sorted(rows.values_list('user_id', flat=True)),
+            sorted(user.id for user in users))
+        self.assertFalse(rows.filter(is_stale=True).exists())
+
+    def test_refresh_reports_progress(self):
+        section = Section.objects.get(slug='one')
+        for i in range(2):
+            UserPageVisit.objects.create(
+                user=ParticipantFactory().user, section=section,
+                status='complete')
+        self.report.chunk_size = 1
+
+        chunks = []
+        self.assertEquals(
+            self.get_store().refresh(lambda: chunks.append(1)), 2)
+        self.assertEquals(len(chunks), 2)
+
+
+class ReportDataVersionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        ModuleFactory('main', '/pages/')
+        self.hierarchy = Hierarchy.objects.get(name='main')
+
+    def assertVersionChanges(self, change):
+        version = report_data_version(self.hierarchy)
+        self.assertEquals(report_data_version(self.hierarchy), version)
+        change()
+        self.assertNotEquals(report_data_version(self.hierarchy), version)
+
+    def test_location_renamed(self):
+        location = LocationFactory()
+
+        def rename():
+            location.name = 'Renamed'
+            location.save()
+        self.assertVersionChanges(rename)
+
+    def test_facilitator_renamed(self):
+        facilitator = UserFactory()
+
+        def rename():
+            facilitator.first_name = 'Renamed'
+            facilitator.save()
+        self.assertVersionChanges(rename)
+
+    def test_facilitator_signed_in(self):
+        facilitator = UserFactory()
+        version = get_report_content_version()
+        facilitator.last_login = timezone.now()
+        facilitator.save(update_fields=['last_login'])
+        # Sign-ins don't change any reported names, and the User data
+        # source already covers last_login.
+        self.assertEquals(get_report_content_version(), version)
+
+    def test_section_relabelled(self):
+        section = Section.objects.get(slug='one')
+
+        def relabel():
+            section.label = 'Relabelled'
+            section.save()
+        self.assertVersionChanges(relabel)
+
+    def test_question_edited(self):
+        question = Question.objects.create(
+            quiz=Quiz.objects.create(), text='Question',
+            question_type='single choice')
+
+        def edit():
+            question.text = 'Edited'
+            question.save()
+        self.assertVersionChanges(edit)
+
+
+class ReportJobManagerTest(TestCase):
+    def setUp(self):
+        self.hierarchy = get_hierarchy('main', '/pages/')
+
+    def test_request_job_fails_stale_running_job(self):
+        job, created = ReportJob.objects.request_job(
+            'keys', self.hierarchy, 'version')
+        self.assertTrue(created)
+        ReportJob.objects.filter(pk=job.pk).update(status='running')
+
+        # A job that's still making progress is returned
+        self.assertEquals(ReportJob.objects.request_job(
+            'keys', self.hierarchy, 'version'), (job, False))
+
+        ReportJob.objects.filter(pk=job.pk).update(
+            updated_at=timezone.now() - ReportJob.objects.stale_after)
+        new_job, created = ReportJob.objects.request_job(
+            'keys', self.hierarchy, 'version')
+        self.assertTrue(created)
+        self.assertNotEquals(new_job, job)
+        self.assertEquals(ReportJob.objects.get(pk=job.pk).status, 'failed')
+
+    def test_run_abandoned_job(self):
+        job, created = ReportJob.objects.request_job(
+            'locations', self.hierarchy, 'version')
+
+        def fail_stale_job(sender, instance, **kwargs):
+            # The job is found to be stale while it's still running
+            ReportJob.objects.filter(pk=instance.pk).update(
+                status='failed', error='Stale')
+
+        post_save.connect(fail_stale_job, sender=ReportJob)
+        try:
+            job = run_report_job(job)
+        finally:
+            post_save.disconnect(fail_stale_job, sender=ReportJob)
+
+        self.assertEquals(job.status, 'failed')
+        self.assertEquals(job.error, 'Stale')
+        self.assertFalse(job.is_complete())
+
+
+class ParticipantReportBulkValuesTest(TransactionTestCase):
+    reset_sequences = True
+
+    def setUp(self):
+        super(ParticipantReportBulkValuesTest, self).setUp()
+        cache.clear()
+
+        ModuleFactory('main', '/pages/')
+        self.hierarchy = Hierarchy.objects.get(name='main')
+
+        section_one = Section.objects.get(slug='one')
+        child_one = Section.objects.get(slug='introduction')
+        section_two = Section.objects.get(slug='two')
+
+        self.goalsettingblock = GoalSettingBlockFactory(goal_amount=2)
+        child_one.append_pageblock('', '', self.goalsettingblock)
+        self.goalcheckinblock = GoalCheckInBlockFactory(
+            goal_setting_block=self.goalsettingblock)
+        section_two.append_pageblock('', '', self.goalcheckinblock)
+
+        section_two.add_pageblock_from_dict({
+            'block_type': 'Quiz',
+            'description': 'Test Quiz',
+            'rhetorical': False,
+            'allow_redo': True,
+            'show_submit_state': True,
+            'questions': [{
+                'text': 'Single choice question',
+                'question_type': 'single choice',
+                'explanation': '',
+                'intro_text': '',
+                'answers': [
+                    {'value': '1', 'label': 'Yes', 'correct': False},
+                    {'value': '0', 'label': 'No', 'correct': False},
+                ],
+            }, {
+                'text': 'Multiple choice question',
+                'question_type': 'multiple choice',
+                'explanation': '',
+                'intro_text': '',
+                'answers': [
+                    {'value': 'a', 'label': 'A', 'correct': False},
+                    {'value': 'b', 'label': 'B', 'correct': False},
+                ],
+            }],
+        })
+        self.quiz = section_two.pageblock_set.last().block()
+
+        now = datetime.datetime.now()
+        self.users = []
+        for i in range(4):
+            p = ParticipantFactory(cohort_id='%03d' % i)
+            user = p.user
+            self.users.append(user)
+
+            for j, section in enumerate([section_one, child_one,
+                                         section_two][:i + 1]):
+                visit = UserPageVisit.objects.create(
+                    user=user, section=section, status='complete')
+                visit.first_visit = now + datetime.timedelta(minutes=j * 7)
+                visit.save()
+
+            for j in range(i):
+                EncounterFactory(participant=p, section=section_one)
+                SupporterFactory(user=user, closeness='C')
+
+            if i > 0:
+                response = GoalSettingResponseFactory(
+                    user=user, goal_setting_block=self.goalsettingblock,
+                    form_id=i % 2)
+                GoalCheckInResponseFactory(goal_setting_response=response)
+
+            if i > 1:
+                submission = Submission.objects.create(
+                    quiz=self.quiz, user=user)
+                for question in self.quiz.question_set.all():
+                    Response.objects.create(
+                        submission=submission, question=question,
+                        value=question.answer_set.first().value)
+
+    def test_values_match_per_cell_report(self):
+        report = ParticipantReport(self.hierarchy)
+        hierarchies = Hierarchy.objects.filter(name='main')
+
+        expected = list(PagetreeReport.values(report, hierarchies))
+        report.chunk_size = 3
+        actual = list(report.values(hierarchies))
+
+        self.assertEquals(len(actual), 5)
+        self.assertEquals(actual, expected)
+
+        # The columns are found in the same order, too.
+        self.assertEqual(
+            [c.identifier() for c in report.value_columns(hierarchies)],
+            [c.identifier() for c in
+             PagetreeReport.value_columns(report, hierarchies) +
+             SsnmReport().report_values()])
+        self.assertEqual(
+            [c.metadata() for c in report.metadata_columns(hierarchies)],
+            [c.metadata() for c in
+             PagetreeReport.metadata_columns(report, hierarchies) +
+             SsnmReport().report_metadata()])
+
+    def test_values_query_count_is_constant(self):
+        report = ParticipantReport(self.hierarchy)
+        hierarchies = Hierarchy.objects.filter(name='main')
+        columns = report.value_columns(hierarchies)
+
+        users = next(report.user_chunks())
+        # warm up the report's section caches
+        list(report.values(hierarchies))
+
+        with CaptureQueriesContext(connection) as few:
+            data = ParticipantReportData(report, users[:1])
+            [data.user_value(column, users[0]) for column in columns]
+
+        with CaptureQueriesContext(connection) as many:
+            data = ParticipantReportData(report, users)
+            for user in users:
+                [data.user_value(column, user) for column in columns]
+
+        self.assertEquals(len(few), len(many))
+
+    def test_stored_rows_follow_data_changes(self):
+        report = ParticipantReport(self.hierarchy)
+        hierarchies = Hierarchy.objects.filter(name='main')
+        list(report.values(hierarchies))
+
+        rows = ParticipantReportRow.objects.filter(hierarchy=self.hierarchy)
+        self.assertEquals(rows.count(), 4)
+        self.assertEquals(rows.filter(is_stale=True).count(), 0)
+
+        user = self.users[1]
+        SupporterFactory(user=user, closeness='VC')
+        Submission.objects.create(quiz=self.quiz, user=self.users[2])
+        self.assertEquals(
+            set(rows.filter(is_stale=True).values_list('user_id', flat=True)),
+            set([user.id, self.users[2].id]))
+
+        store = ParticipantReportRowStore(
+            report, report.value_columns(hierarchies))
+        self.assertEquals(store.refresh(), 2)
+        self.assertEquals(store.refresh(), 0)
+        self.assertEquals(list(report.values(hierarchies)),
+                          list(PagetreeReport.values(report, hierarchies)))
+
+    def test_rebuild_report_rows(self):
+        call_command('rebuild_report_rows', stdout=StringIO())
+        rows = ParticipantReportRow.objects.filter(hierarchy=self.hierarchy)
+        self.assertEquals(rows.count(), 4)
+
+        call_command('rebuild_report_rows', check=True, stdout=StringIO())
+
+        # Change a stored row behind the signal handlers' backs
+        rows.filter(user=self.users[0]).update(values='[]')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_report_rows', check=True,
+                         stdout=StringIO())
+
+    def test_sum_grouped_intervals(self):
+        start = datetime.datetime(2015, 5, 1, 12, 0, 0, 250)
+        minutes = [
+            [0, 3, 14, 30, 31, 100],
+            [],
+            [5],
+            [20, 0, 16, 35.5],
+        ]
+        groups = []
+        visit_times = []
+        for idx, group in enumerate(minutes):
+            for m in group:
+                groups.append(idx)
+                visit_times.append(start + datetime.timedelta(minutes=m))
+
+        totals = ParticipantReport.sum_grouped_intervals(
+            groups, visit_times, len(minutes))
+
+        self.assertEquals(totals, [
+            ParticipantReport.sum_intervals(sorted(
+                start + datetime.timedelta(minutes=m) for m in group))
+            for group in minutes])
+        self.assertEquals(
+            ParticipantReport.sum_grouped_intervals([], [], 2),
+            [datetime.timedelta(0), datetime.timedelta(0)])
+
+    def test_benchmark_time_spent(self):
+        out = StringIO()
+        call_command('benchmark_time_spent', participants=[3], stdout=out)
+        self.assertTrue(out.getvalue().startswith('3 participants:'))
+        self.assertEquals(UserPageVisit.objects.filter(
+            user__username__startswith='benchmark-').count(), 0)
@@ -0,0 +1,131 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase
+from django.test.utils import override_settings
+from pagetree.helpers import get_hierarchy
+from pagetree.models import PageBlock, Section
+
+from worth2.main.templatetags import cachedrender
+from worth2.main.templatetags.avatar import avatar_url
+from worth2.main.tests.factories import (
+    AvatarFactory, ParticipantFactory, UserFactory
+)
+
+
+class AvatarUrlTest(TestCase):
+    def setUp(self):
+        self.avatar = AvatarFactory()
+        self.default_avatar = AvatarFactory(is_default=True)
+        self.participant = ParticipantFactory()
+
+    def get_user(self):
+        # A fresh user, like the one on each request.
+        return User.objects.get(pk=self.participant.user.pk)
+
+    @override_settings(STATIC_URL='/media/')
+    def test_admin(self):
+        user = UserFactory(is_staff=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(avatar_url(user), '/media/admin-avatar.png')
+
+    def test_participant(self):
+        self.assertEqual(avatar_url(self.get_user()),
+                         self.default_avatar.image.url)
+
+        self.participant.avatar = self.avatar
+        self.participant.save()
+        user = self.get_user()
+        # Only the user's role is loaded.
+        with self.assertNumQueries(1):
+            self.assertEqual(avatar_url(user), self.avatar.image.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(avatar_url(user), self.avatar.image.url)
+
+    def test_avatar_changed(self):
+        user = self.get_user()
+        avatar_url(user)
+        self.default_avatar.is_default = False
+        self.default_avatar.save()
+        self.assertEqual(avatar_url(user), '')
+
+    def test_facilitator(self):
+        self.assertEqual(avatar_url(UserFactory()), '')
+
+
+class CachedRenderTest(TestCase):
+    def setUp(self):
+        root = get_hierarchy('main', '/pages/').get_root()
+        root.add_child_section_from_dict({
+            'label': 'Page',
+            'slug': 'page',
+            'pageblocks': [{
+                'block_type': 'Text Block',
+                'body': 'Some text',
+            }, {
+                'block_type': 'Text Block',
+                'body': 'More text',
+            }, {
+                'block_type': 'Quiz',
+                'description': 'A quiz',
+                'rhetorical': False,
+                'allow_redo': True,
+                'show_submit_state': True,
+                'questions': [],
+            }],
+        })
+        self.text_block, self.more_text_block, self.quiz_block = \
+            Section.objects.get(slug='page').pageblock_set.all()
+
+    def render(self, block):
+        # A fresh PageBlock, like on each request.
+        block = PageBlock.objects.get(pk=block.pk)
+        return Template(
+            '{% load cachedrender %}{% cachedrender block %}'
+            '{% cachedrenderjs block %}{% cachedrendercss block %}'
+        ).render(Context({'block': block}))
+
+    def test_cached(self):
+        self.assertIn('Some text', self.render(self.text_block))
+        with self.assertNumQueries(1):
+            self.assertIn('Some text', self.render(self.text_block))
+
+        text = self.text_block.block()
+        text.body = 'Other text'
+        text.save()
+        self.assertIn('Other text', self.render(self.text_block))
+
+    def test_not_cached(self):
+        self.assertIn('A quiz', self.render(self.quiz_block))
+        quiz = self.quiz_block.block()
+        quiz.description = 'Changed'
+        quiz.save()
+        self.assertIn('Changed', self.render(self.quiz_block))
+
+    def test_fetched_together(self):
+        template = Template(
+            '{% load cachedrender %}{% for block in pageblocks %}'
+            '{% cachedrender block %}{% cachedrenderjs block %}'
+            '{% endfor %}')
+
+        def render():
+            pageblocks = list(PageBlock.objects.filter(
+                pk__in=[self.text_block.pk, self.more_text_block.pk]))
+            return template.render(Context({'pageblocks': pageblocks}))
+
+        render()
+        lookups = []
+
+        class RecordingCache(object):
+            def __getattr__(self, name):
+                lookups.append(name)
+                return getattr(cache, name)
+
+        cachedrender.cache = RecordingCache()
+        try:
+            output = render()
+        finally:
+            cachedrender.cache = cache
+        self.assertIn('Some text', output)
+        self.assertIn('More text', output)
+        self.assertEqual(lookups, ['get_many'])
@@ -1,7 +1,10 @@
 from django.test import TestCase
 from pagetree.helpers import get_hierarchy
 
+from worth2.main.models import InactiveUserProfile, Location, Participant
+from worth2.main.tests.factories import LocationFactory, UserFactory
 from worth2.main.utils import (
+    apply_changes, bulk_insert_child_rows, bulk_update,
     get_first_block_in_module, get_module_number,
     get_module_number_from_section, get_verbose_section_name
 )
@@ -81,3 +84,48 @@ class UtilsTest(TestCase):
         self.assertEqual(
             get_verbose_section_name(goalsettingblock.section).lower(),
             'Goal Setting Block page [Session 2]'.lower())
+
+
+class BulkUpdateTest(TestCase):
+    def test_bulk_update(self):
+        locations = [LocationFactory(name='Location %d' % i)
+                     for i in range(3)]
+        self.assertFalse(apply_changes(
+            locations[0], {'name': 'Location 0'}))
+        self.assertTrue(apply_changes(locations[0], {'name': 'First'}))
+        self.assertTrue(apply_changes(locations[2], {'name': 'Third'}))
+
+        with self.assertNumQueries(1):
+            count = bulk_update([locations[0], locations[2]], ['name'])
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            list(Location.objects.order_by('pk').values_list(
+                'name', flat=True)),
+            ['First', 'Location 1', 'Third'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(bulk_update([], ['name']), 0)
+
+
+class BulkInsertChildRowsTest(TestCase):
+    def test_bulk_insert_child_rows(self):
+        users = [UserFactory(is_active=False) for i in range(3)]
+        profiles = [InactiveUserProfile.objects.create(user=user)
+                    for user in users]
+
+        with self.assertNumQueries(1):
+            bulk_insert_child_rows([
+                Participant(inactiveuserprofile_ptr_id=profile.pk,
+                            user_id=profile.user_id,
+                            study_id='1504267810%02d' % i)
+                for i, profile in enumerate(profiles)])
+
+        participants = Participant.objects.order_by('pk')
+        self.assertEqual(
+            [(p.pk, p.user, p.study_id) for p in participants],
+            [(profile.pk, profile.user, '1504267810%02d' % i)
+             for i, profile in enumerate(profiles)])
+        self.assertIsNone(participants[0].cohort_id)
+
+        with self.assertNumQueries(0):
+            bulk_insert_child_rows([])
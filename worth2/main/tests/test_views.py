@@ -1,12 +1,21 @@
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from pageblocks.models import TextBlock
 
 from pagetree.helpers import get_hierarchy
-from pagetree.models import Hierarchy, Section, UserPageVisit
+from pagetree.models import Hierarchy, Section, UserPageVisit, Version
 
+from worth2.main import views
 from worth2.main.auth import generate_password
+from worth2.main.hierarchy import get_hierarchy_snapshot, get_pagetree_version
 from worth2.main.tests.factories import (
-    AvatarFactory, LocationFactory, ParticipantFactory, WorthModuleFactory
+    AvatarFactory, LocationFactory, ParticipantFactory, VideoBlockFactory,
+    WatchedVideoFactory, WorthModuleFactory
 )
 from worth2.main.tests.mixins import (
     LoggedInFacilitatorTestMixin, LoggedInParticipantTestMixin,
@@ -60,6 +69,72 @@ class AvatarSelectorBlockTest(LoggedInParticipantTestMixin, TestCase):
         self.assertContains(r, participant.avatar.image.url)
 
 
+class VideoBlockTest(LoggedInParticipantTestMixin, TestCase):
+    def setUp(self):
+        super(VideoBlockTest, self).setUp()
+
+        root = get_hierarchy('main', '/pages/').get_root()
+        root.add_child_section_from_dict({
+            'label': 'Video Section',
+            'slug': 'video-section',
+            'children': [],
+        })
+        Section.objects.get(slug='video-section').append_pageblock(
+            '', '', VideoBlockFactory(video_id='abc'))
+        self.url = '/pages/video-section/'
+
+    def test_get(self):
+        r = self.client.get(self.url)
+        self.assertEqual(r.context['watched_video_ids'], '[]')
+
+        WatchedVideoFactory(user=self.u, video_id='abc')
+        WatchedVideoFactory(user=self.u, video_id='def')
+        r = self.client.get(self.url)
+        self.assertEqual(r.context['watched_video_ids'], '["abc"]')
+        self.assertContains(
+            r, 'data-watched-video-ids="[&quot;abc&quot;]"')
+
+
+class PageBlocksTest(LoggedInParticipantTestMixin, TestCase):
+    def setUp(self):
+        super(PageBlocksTest, self).setUp()
+        # Earlier tests' visit windows and version stamps would change
+        # which writes the page view makes.
+        cache.clear()
+
+        root = get_hierarchy('main', '/pages/').get_root()
+        root.add_child_section_from_dict({
+            'label': 'Text Section',
+            'slug': 'text-section',
+            'pageblocks': [{
+                'block_type': 'Text Block',
+                'body': 'Some text',
+            }, {
+                'block_type': 'Pull Quote Block',
+                'body': 'A quote',
+            }],
+        })
+        self.section = Section.objects.get(slug='text-section')
+        self.url = '/pages/text-section/'
+
+    def count_queries(self):
+        self.client.get(self.url)
+        # Nothing is rendered from the cache.
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            r = self.client.get(self.url)
+        self.assertContains(r, 'Some text')
+        return len(queries)
+
+    def test_query_count(self):
+        count = self.count_queries()
+
+        for i in range(4):
+            self.section.append_pageblock(
+                '', '', TextBlock.objects.create(body='More text'))
+        self.assertEqual(self.count_queries(), count)
+
+
 class BasicTest(TestCase):
     def test_root(self):
         response = self.client.get("/")
@@ -133,6 +208,49 @@ class PagetreeViewTestsAdmin(LoggedInSuperuserTestMixin, TestCase):
         r = self.client.get("/pages/edit/section-1/")
         self.assertEqual(r.status_code, 200)
 
+    def test_reorder_section_children(self):
+        self.root.add_child_section_from_dict({
+            'label': 'Section 2',
+            'slug': 'section-2',
+            'pageblocks': [],
+            'children': [],
+        })
+        sections = list(self.root.get_children())
+
+        # Another request rebuilds the snapshot after the view saves a
+        # Version, but before the sections are moved.
+        def rebuild_snapshot(sender, **kwargs):
+            get_hierarchy_snapshot()
+        post_save.connect(rebuild_snapshot, sender=Version)
+        try:
+            url = reverse('reorder-section-children', args=[self.root.id])
+            r = self.client.post('%s?section_id_0=%d&section_id_1=%d' % (
+                url, sections[1].id, sections[0].id))
+        finally:
+            post_save.disconnect(rebuild_snapshot, sender=Version)
+        self.assertEqual(r.status_code, 200)
+
+        snapshot = get_hierarchy_snapshot()
+        self.assertEqual(
+            [s.id for s in snapshot.get_children(self.root.id)],
+            [sections[1].id, sections[0].id])
+
+
+class BumpsPagetreeVersionTest(TestCase):
+    def setUp(self):
+        self.view = views.bumps_pagetree_version(
+            lambda request: HttpResponse('ok'))
+
+    def test_post(self):
+        version = get_pagetree_version()
+        self.view(RequestFactory().post('/'))
+        self.assertNotEqual(get_pagetree_version(), version)
+
+    def test_get(self):
+        version = get_pagetree_version()
+        self.view(RequestFactory().get('/'))
+        self.assertEqual(get_pagetree_version(), version)
+
 
 class ManageParticipantsAuthedTest(LoggedInFacilitatorTestMixin, TestCase):
     def test_get(self):
@@ -203,6 +321,49 @@ class SignInParticipantTest(LoggedInFacilitatorTestMixin, TestCase):
             response, 'data-cohort-id="%s"' % p1.cohort_id,
             msg_prefix='Incorrect participant dropdown cohort ID')
 
+    def test_participant_options(self):
+        UserPageVisit.objects.create(
+            user=self.p1.user, section=self.module3, status='complete')
+        UserPageVisit.objects.create(
+            user=self.p1.user, section=self.module1, status='complete')
+        UserPageVisit.objects.create(
+            user=self.p2.user, section=self.module4, status='complete')
+        ParticipantFactory(is_archived=True)
+
+        options = views.SignInParticipant.get_participant_options()
+        self.assertEqual(
+            [o['id'] for o in options],
+            [p.pk for p in Participant.objects.filter(
+                is_archived=False).order_by('study_id')])
+        for option in options:
+            participant = Participant.objects.get(pk=option['id'])
+            self.assertEqual(option['label'], participant.study_id)
+            self.assertEqual(option['last_location'],
+                             participant.last_location_verbose())
+            self.assertEqual(option['next_location'],
+                             participant.next_module_verbose())
+            self.assertEqual(option['highest_accessed'],
+                             participant.highest_module_accessed())
+
+        options = dict((o['id'], o) for o in options)
+        self.assertEqual(options[self.p1.pk]['highest_accessed'], 3)
+        self.assertEqual(options[self.p2.pk]['highest_accessed'], 4)
+        self.assertEqual(options[self.p3.pk]['highest_accessed'], -1)
+
+    def test_participant_options_query_count(self):
+        views.SignInParticipant.get_participant_options()
+        with self.assertNumQueries(1):
+            views.SignInParticipant.get_participant_options()
+
+        for i in range(5):
+            participant = ParticipantFactory()
+            UserPageVisit.objects.create(
+                user=participant.user, section=self.module2,
+                status='complete')
+        views.SignInParticipant.get_participant_options()
+        with self.assertNumQueries(1):
+            views.SignInParticipant.get_participant_options()
+
     def test_valid_form_submit_next_new_session_for_new_participant(self):
         """
         Test that a facilitator can log in a newly created participant that
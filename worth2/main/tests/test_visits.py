@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+from pagetree.helpers import get_hierarchy
+from pagetree.models import Section, UserPageVisit
+
+from worth2.main.models import ProgressSummary
+from worth2.main.tests.factories import ParticipantFactory
+from worth2.main.visits import (
+    FLUSHED_COUNT_KEY, PENDING_COUNT_KEY, CoalescingPageVisitor,
+    flush_pending_visits, pending_visit_key, queue_visit
+)
+
+
+class CoalescingPageVisitorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = ParticipantFactory().user
+        root = get_hierarchy('main', '/pages/').get_root()
+        root.add_child_section_from_dict({
+            'label': 'Session 1',
+            'slug': 'session-1',
+            'children': [{
+                'label': 'Page 1',
+                'slug': 'page-1',
+            }, {
+                'label': 'Page 2',
+                'slug': 'page-2',
+            }],
+        })
+        self.page1 = Section.objects.get(slug='page-1')
+        self.page2 = Section.objects.get(slug='page-2')
+
+    def test_repeat_visits_are_queued(self):
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        visit = UserPageVisit.objects.get(user=self.user, section=self.page1)
+        self.assertEqual(visit.status, 'complete')
+
+        # Another page's first visit is saved right away.
+        CoalescingPageVisitor(self.page2, self.user).visit()
+        self.assertEqual(
+            ProgressSummary.objects.for_user(self.user).last_section,
+            self.page2)
+
+        with self.assertNumQueries(0):
+            CoalescingPageVisitor(self.page1, self.user).visit()
+        self.assertEqual(
+            UserPageVisit.objects.get(pk=visit.pk).last_visit,
+            visit.last_visit)
+        self.assertEqual(
+            ProgressSummary.objects.for_user(self.user).last_section,
+            self.page2)
+
+        self.assertEqual(flush_pending_visits(), 1)
+        self.assertGreater(
+            UserPageVisit.objects.get(pk=visit.pk).last_visit,
+            visit.last_visit)
+        self.assertEqual(
+            ProgressSummary.objects.for_user(self.user).last_section,
+            self.page1)
+
+        self.assertEqual(flush_pending_visits(), 0)
+
+    def test_status_is_saved(self):
+        CoalescingPageVisitor(self.page1, self.user).visit(
+            status='incomplete')
+        CoalescingPageVisitor(self.page1, self.user).visit(status='complete')
+        self.assertEqual(
+            UserPageVisit.objects.get(
+                user=self.user, section=self.page1).status,
+            'complete')
+
+    def test_deleted_visit_is_saved_again(self):
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        UserPageVisit.objects.filter(user=self.user).delete()
+
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        self.assertTrue(UserPageVisit.objects.filter(
+            user=self.user, section=self.page1).exists())
+
+    def test_flush_keeps_latest_time(self):
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        visit = UserPageVisit.objects.get(user=self.user)
+        later = visit.last_visit + timedelta(minutes=5)
+        queue_visit(self.user.id, self.page1.id, later)
+        queue_visit(self.user.id, self.page1.id,
+                    visit.last_visit + timedelta(minutes=1))
+        queue_visit(self.user.id, self.page1.id,
+                    visit.last_visit - timedelta(minutes=1))
+
+        out = StringIO()
+        call_command('flush_page_visits', stdout=out)
+        self.assertIn('Updated 1 page visits.', out.getvalue())
+        self.assertEqual(UserPageVisit.objects.get(pk=visit.pk).last_visit,
+                         later)
+
+    def test_flush_skips_missing_visits(self):
+        queue_visit(self.user.id, self.page1.id, timezone.now())
+        self.assertEqual(flush_pending_visits(), 0)
+
+    def test_flush_waits_for_counted_visits(self):
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        visit = UserPageVisit.objects.get(user=self.user)
+        later = visit.last_visit + timedelta(minutes=5)
+
+        # Another process has counted a visit, but not written it yet.
+        cache.add(PENDING_COUNT_KEY, 0, None)
+        n = cache.incr(PENDING_COUNT_KEY)
+        queue_visit(self.user.id, self.page1.id, later)
+        self.assertEqual(flush_pending_visits(), 1)
+
+        cache.set(pending_visit_key(n),
+                  (self.user.id, self.page2.id, later), None)
+        CoalescingPageVisitor(self.page2, self.user).visit()
+        UserPageVisit.objects.filter(
+            user=self.user, section=self.page2).update(
+            last_visit=visit.last_visit)
+        self.assertEqual(flush_pending_visits(), 1)
+        self.assertEqual(
+            UserPageVisit.objects.get(
+                user=self.user, section=self.page2).last_visit,
+            later)
+        self.assertIsNone(cache.get(pending_visit_key(n)))
+        self.assertIsNone(cache.get(pending_visit_key(n + 1)))
+
+    def test_flush_skips_lost_visits(self):
+        CoalescingPageVisitor(self.page1, self.user).visit()
+        visit = UserPageVisit.objects.get(user=self.user)
+
+        # A visit is counted, but never written.
+        queue_visit(self.user.id, self.page1.id, timezone.now())
+        cache.delete(pending_visit_key(cache.get(PENDING_COUNT_KEY)))
+        flush_pending_visits()
+        self.assertEqual(cache.get(FLUSHED_COUNT_KEY), 0)
+
+        later = visit.last_visit + timedelta(minutes=5)
+        queue_visit(self.user.id, self.page1.id, later)
+        self.assertEqual(flush_pending_visits(), 1)
+        self.assertEqual(cache.get(FLUSHED_COUNT_KEY), 2)
+        self.assertEqual(UserPageVisit.objects.get(pk=visit.pk).last_visit,
+                         later)
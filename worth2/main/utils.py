@@ -1,8 +1,11 @@
-import re
-from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router
+from django.db.models import Case, Value, When
 from django.utils.encoding import smart_str
-from pagetree.models import PageBlock, Section
-from quizblock.models import Response
+
+from worth2.main.hierarchy import (
+    get_hierarchy_snapshot, get_hierarchy_snapshot_by_id,
+    get_section_block_index
+)
 
 
 def get_first_block_in_module(app_label, model, session_num, blocktest=None):
@@ -21,8 +24,9 @@ def get_first_block_in_module(app_label, model, session_num, blocktest=None):
     :rtype: A pageblock.
     """
     slug = 'session-%d' % session_num
-    topsection = Section.objects.get(slug=slug)
-    for section in topsection.get_children():
+    snapshot = get_hierarchy_snapshot()
+    topsection = snapshot.get_section_by_slug(slug)
+    for section in snapshot.get_children(topsection.id):
         block = get_first_block_of_type(section, app_label, model, blocktest)
         if block:
             return block
@@ -58,17 +62,8 @@ def get_first_block_of_type(section, app_label, model, blocktest=None):
 
     :rtype: A pageblock.
     """
-    contenttype = ContentType.objects.get(app_label=app_label, model=model)
-    pageblocks = section.pageblock_set.filter(content_type=contenttype)
-
-    if hasattr(blocktest, '__call__'):
-        pageblocks = filter(blocktest, pageblocks)
-        if len(pageblocks) > 0:
-            return pageblocks[0]
-        else:
-            return None
-    else:
-        return pageblocks.first()
+    index = get_section_block_index(section)
+    return index.get_first_block(app_label, model, blocktest)
 
 
 def get_module_number_from_section(section):
@@ -78,23 +73,12 @@ def get_module_number_from_section(section):
 
     :rtype: int
     """
-    if section is None or section.depth == 1:
-        return -1
-    elif section.depth == 2:
-        # depth == 2 is the expected depth for modules.
-        module_section = section
-    else:
-        # Find closest parent whose depth == 2
-        module_section = section
-        while module_section.depth > 2:
-            module_section = module_section.get_parent()
-
-    match = re.match(r'session-(\d)', module_section.slug)
-    if match:
-        return int(match.groups()[0])
-    else:
+    if section is None:
         return -1
 
+    snapshot = get_hierarchy_snapshot_by_id(section.hierarchy_id)
+    return snapshot.get_module_number(section.id)
+
 
 def get_module_number(pageblock):
     """Returns the module number that the given pageblock is in.
@@ -106,7 +90,7 @@ def get_module_number(pageblock):
     if pageblock is None:
         return -1
 
-    return get_module_number_from_section(pageblock.section.get_module())
+    return get_module_number_from_section(pageblock.section)
 
 
 def get_verbose_section_name(section):
@@ -115,7 +99,7 @@ def get_verbose_section_name(section):
     s = smart_str(section)
     module_num = -1
     if section is not None:
-        module_num = get_module_number_from_section(section.get_module())
+        module_num = get_module_number_from_section(section)
 
     # Only append the module number if it's valid.
     if module_num > -1:
@@ -124,41 +108,91 @@ def get_verbose_section_name(section):
         return s
 
 
-def get_quiz_responses_by_css_in_module(user, css_class, module):
-    """Get quiz responses for a pageblock.
+def bulk_update(objs, fields):
+    """Save these fields of each of these model instances, with one
+    UPDATE query.
 
-    :type user: User
-    :type css_class: string
-    :type module: int
+    Like QuerySet.update(), this doesn't call save() or send any
+    signals.
 
-    :rtype: queryset
+    :type objs: list of model instances, all of the same model
+    :type fields: list of field names
+
+    :rtype: int
     """
-    pageblocks = PageBlock.objects.filter(css_extra__contains=css_class)
-
-    # Filter non-QuizBlocks out of pageblocks.
-    quiztype = ContentType.objects.get(app_label='quizblock',
-                                       model='quiz')
-    blocks = map(lambda x: x.block(), pageblocks)
-    mapping = ContentType.objects.get_for_models(*blocks)
-    quizblocks = []
-    for k, v in mapping.iteritems():
-        if v == quiztype:
-            quizblocks.append(k)
-
-    # Find all quizblocks in the queried module.
-    quizblocks_in_module = []
-    for quizblock in quizblocks:
-        if get_module_number_from_section(
-                quizblock.pageblock().section) == module:
-            quizblocks_in_module.append(quizblock)
-
-    if len(quizblocks_in_module) == 0:
-        return Response.objects.none()
-    else:
-        # TODO, these need to be ordered by
-        # question__quiz__pageblock__section__path, but there's
-        # not a straightforward way to do that because of quiz's
-        # reverse relation to pageblock.
-        return Response.objects.filter(
-            submission__user=user,
-            question__quiz__in=quizblocks_in_module)
+    if not objs:
+        return 0
+
+    model = type(objs[0])
+    values = {}
+    for name in fields:
+        field = model._meta.get_field(name)
+        column = [getattr(obj, field.attname) for obj in objs]
+        if all(value is None for value in column):
+            # A CASE whose results are all NULL has no type to go on,
+            # and Postgres takes it as text, which can't be assigned to
+            # other column types.
+            values[name] = None
+            continue
+        values[name] = Case(
+            *[When(pk=obj.pk, then=Value(value))
+              for obj, value in zip(objs, column)],
+            output_field=field)
+    return model.objects.filter(pk__in=[obj.pk for obj in objs]).update(
+        **values)
+
+
+def bulk_insert_child_rows(objs):
+    """Insert the rows of these multi-table inherited model instances'
+    own table, with one executemany() call.
+
+    bulk_create() refuses models with a concrete parent. This is for
+    when the parent rows already exist, and each instance's parent
+    link is set. Like bulk_create(), this doesn't call save() or send
+    any signals.
+
+    :type objs: list of model instances, all of the same model
+    """
+    if not objs:
+        return
+
+    model = type(objs[0])
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    fields = model._meta.local_concrete_fields
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    params = [
+        [field.get_db_prep_save(field.pre_save(obj, True), connection)
+         for field in fields]
+        for obj in objs]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def apply_changes(obj, values):
+    """Set these field values on the model instance.
+
+    Related fields are compared by id, so their objects aren't loaded.
+
+    :param values: a dict of field name -> value, like a form's
+      cleaned_data.
+    :returns: True if any of the values changed.
+    :rtype: bool
+    """
+    changed = False
+    for name, value in values.items():
+        field = obj._meta.get_field(name)
+        if field.is_relation:
+            current = getattr(obj, field.attname)
+            new = value.pk if value is not None else None
+        else:
+            current = getattr(obj, name)
+            new = value
+
+        if current != new:
+            setattr(obj, name, value)
+            changed = True
+    return changed
@@ -1,57 +1,69 @@
+from functools import wraps
+import json
+
 from django import http
+from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
 from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template import TemplateDoesNotExist
 from django.utils.decorators import method_decorator
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 from django.views.generic.edit import FormView
 from django.views.generic.list import ListView
-from pagetree.generic.views import PageView
-from pagetree.models import PageBlock, Hierarchy, Section
-from quizblock.models import Quiz
-import unicodecsv
+from pagetree.generic.views import InstructorView, PageView
+from pagetree.models import Hierarchy, Section
 
 from worth2.goals.mixins import GoalCheckInViewMixin, GoalSettingViewMixin
-from worth2.goals.models import GoalSettingResponse
-from worth2.main.auth import generate_password, user_is_participant
+from worth2.main.auth import generate_password, get_request_role
 from worth2.main.forms import SignInParticipantForm
-from worth2.main.models import Encounter, Participant, Location
-from worth2.main.reports import ParticipantReport
+from worth2.main.models import (
+    Encounter, Participant, ProgressSummary, ReportJob, WatchedVideo,
+    get_next_module
+)
+from worth2.main.reports import report_data_version
+from worth2.main.hierarchy import (
+    bump_pagetree_version, get_hierarchy_snapshot,
+    get_hierarchy_snapshot_by_id, get_section_block_index,
+    get_section_pageblocks
+)
+from worth2.main.journal import get_journal_snapshot
+from worth2.main.progress import get_user_progress
 from worth2.main.utils import (
-    get_first_block_of_type, get_quiz_responses_by_css_in_module
+    get_module_number_from_section, get_verbose_section_name
 )
+from worth2.main.visits import CoalescingPageVisitor
 from worth2.protectivebehaviors.utils import remove_empty_submission
 from worth2.selftalk.mixins import (
     SelfTalkStatementViewMixin, SelfTalkRefutationViewMixin
 )
-from worth2.ssnm.models import Supporter
 
 
-def get_quiz_blocks(css_class):
-    quiz_type = ContentType.objects.get_for_model(Quiz)
-    blocks = PageBlock.objects.filter(css_extra__contains=css_class,
-                                      content_type=quiz_type)
-    return blocks
+def bumps_pagetree_version(view):
+    """Bump the pagetree version once a view has edited the tree.
 
-
-def has_responses(section):
-    quizzes = [p.block() for p in section.pageblock_set.all()
-               if hasattr(p.block(), 'needs_submit')
-               and p.block().needs_submit()]
-    return quizzes != []
+    pagetree's edit views save a Version of the section before making
+    any change, and moving or reordering sections doesn't send any
+    signal at all. Without this, a snapshot rebuilt in between would
+    be cached under the new version with the old tree.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.method == 'POST':
+            bump_pagetree_version()
+        return response
+    return wrapper
 
 
 class IndexView(TemplateView):
     template_name = 'main/index.html'
 
     def dispatch(self, *args, **kwargs):
-        user = self.request.user
-        if user_is_participant(user):
-            last_location = user.profile.last_location_url()
+        role = get_request_role(self.request)
+        if role.is_participant:
+            last_location = role.profile.last_location_url()
             if last_location == '/':
                 # To prevent a redirect loop, if the participant's last
                 # location is this index page, then default to showing them
@@ -93,98 +105,20 @@ class ParticipantJournalView(TemplateView):
             raise http.Http404
 
         context['session_num'] = session_num
-        slug = 'session-%d' % session_num
-        context['section'] = get_object_or_404(Section, slug=slug)
-
-        if session_num > 1:
-            context['i_am_worth_it_responses'] = \
-                map(lambda x: x.answer(),
-                    get_quiz_responses_by_css_in_module(
-                        user, 'i-am-worth-it-quiz', session_num))
-
-        # Add module-specific context data to the response here.
-        if session_num == 1:
-            # Find the first 'services' type goal setter in Session 1
-            context.update({
-                'session_title': 'Let\'s Talk: Sister to Sister',
-                'goals_services_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'services', session_num),
-            })
-        elif session_num == 2:
-            reflection_responses = get_quiz_responses_by_css_in_module(
-                user, 'post-video-quiz', 2)
-            context.update({
-                'session_title': 'What\'s the 411?',
-                'reflection_big_issues': filter(
-                    lambda x: x.value == '1',
-                    reflection_responses),
-                'reflection_issues': filter(
-                    lambda x: (x.value == '1' or x.value == '2'),
-                    reflection_responses),
-                'i_am_worth_it_responses':
-                    get_quiz_responses_by_css_in_module(
-                        user, 'i-am-worth-it-quiz', 2),
-                'rate_my_risk_response':
-                    get_quiz_responses_by_css_in_module(
-                        user, 'rate-my-risk', 2).first(),
-                'goals_risk_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'risk reduction', session_num),
-                'goals_services_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'services', session_num),
-            })
-        elif session_num == 3:
-            context.update({
-                'session_title': 'Protecting Myself. Protecting my community.',
-                'supporters': Supporter.objects.filter(user=user),
-                'goals_support_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'social support', session_num),
-                'goals_risk_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'risk reduction', session_num),
-                'goals_services_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'services', session_num),
-                'i_am_worth_it_responses':
-                    get_quiz_responses_by_css_in_module(
-                        user, 'i-am-worth-it-quiz', 3),
-            })
-        elif session_num == 4:
-            safety_plan_quiz_responses = get_quiz_responses_by_css_in_module(
-                user, 'safety-plan-quiz', 4)
-            context.update({
-                'session_title': 'Staying Safe and Strong',
-                'goals_support_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'social support', session_num),
-                'goals_risk_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'risk reduction', session_num),
-                'goals_services_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'services', session_num),
-                'i_am_worth_it_responses':
-                    get_quiz_responses_by_css_in_module(
-                        user, 'i-am-worth-it-quiz', 4),
-                'mylength': len(safety_plan_quiz_responses),
-                'safety_plan_quiz_responses': safety_plan_quiz_responses,
-            })
-        elif session_num == 5:
-            context.update({
-                'session_title': 'Because I am WORTH it!',
-                'goals_risk_responses':
-                    GoalSettingResponse.objects.find_by_module(
-                        user, 'risk reduction', session_num),
-                'i_am_worth_it_responses':
-                    get_quiz_responses_by_css_in_module(
-                        user, 'i-am-worth-it-quiz', 5),
-            })
-        else:
+        snapshot = get_hierarchy_snapshot()
+        try:
+            context['section'] = snapshot.get_section_by_slug(
+                'session-%d' % session_num)
+        except Section.DoesNotExist:
+            raise http.Http404
+
+        # All the sessions' journals are built, and cached, at once.
+        session_context = get_journal_snapshot(
+            user, snapshot).get_session(session_num)
+        if session_context is None:
             raise http.Http404
 
+        context.update(session_context)
         return context
 
     def get(self, request, *args, **kwargs):
@@ -207,9 +141,67 @@ class SignInParticipant(FormView):
     template_name = 'main/facilitator_sign_in_participant.html'
     form_class = SignInParticipantForm
 
+    @staticmethod
+    def get_participant_options():
+        """Returns the data for each option in the participant dropdown.
+
+        The participants' progress summaries are loaded along with them
+        in one query, and their sections are looked up in the hierarchy
+        snapshot.
+
+        :rtype: list of dicts
+        """
+        snapshot = get_hierarchy_snapshot()
+        participants = list(Participant.objects.select_related(
+            'user__progress_summary').filter(
+            is_archived=False).order_by('study_id'))
+
+        summaries = {}
+        sections = {}
+        for p in participants:
+            try:
+                summary = p.user.progress_summary
+            except ProgressSummary.DoesNotExist:
+                summary = ProgressSummary.objects.for_user(p.user)
+            summaries[p.pk] = summary
+            for section_id in (summary.last_section_id,
+                               summary.highest_section_id):
+                if section_id is not None:
+                    sections[section_id] = snapshot.get_section(section_id)
+
+        # Sections from other hierarchies aren't in the snapshot.
+        missing = [k for k, v in sections.items() if v is None]
+        if missing:
+            sections.update(Section.objects.in_bulk(missing))
+
+        next_modules = {}
+        options = []
+        for p in participants:
+            summary = summaries[p.pk]
+            highest_module = get_module_number_from_section(
+                sections.get(summary.highest_section_id))
+            next_module = get_next_module(highest_module)
+            if next_module not in next_modules:
+                next_modules[next_module] = get_verbose_section_name(
+                    snapshot.get_section_by_slug('session-%d' % next_module))
+
+            options.append({
+                'id': p.pk,
+                'label': unicode(p),
+                'cohort_id': p.cohort_id,
+                'last_location': get_verbose_section_name(
+                    sections.get(summary.last_section_id)),
+                'next_location': next_modules[next_module],
+                'highest_accessed': highest_module,
+            })
+        return options
+
     def get_context_data(self, **kwargs):
         ctx = super(SignInParticipant, self).get_context_data(**kwargs)
-        ctx.update({'cohorts': Participant.objects.cohort_ids()})
+        ctx.update({
+            'cohorts': Participant.objects.cohort_ids(),
+            'participant_options': self.get_participant_options(),
+        })
         return ctx
 
     def form_valid(self, form):
@@ -218,7 +210,8 @@ class SignInParticipant(FormView):
         password = generate_password(participant.user.username)
 
         user = authenticate(
-            username=participant.user.username, password=password)
+            participant_username=participant.user.username,
+            participant_password=password)
 
         if user is not None:
             login(self.request, user)
@@ -261,14 +254,15 @@ class ParticipantSessionPageView(
     def dispatch(self, request, *args, **kwargs):
         path = kwargs['path']
         self.section = self.get_section(path)
-        self.goalsettingblock = get_first_block_of_type(
-            self.section, 'goals', 'goalsettingblock')
-        self.goalcheckinblock = get_first_block_of_type(
-            self.section, 'goals', 'goalcheckinpageblock')
-        self.selftalkstatementblock = get_first_block_of_type(
-            self.section, 'selftalk', 'statementblock')
-        self.selftalkrefutationblock = get_first_block_of_type(
-            self.section, 'selftalk', 'refutationblock')
+        self.block_index = get_section_block_index(self.section)
+        self.goalsettingblock = self.block_index.get_first_block(
+            'goals', 'goalsettingblock')
+        self.goalcheckinblock = self.block_index.get_first_block(
+            'goals', 'goalcheckinpageblock')
+        self.selftalkstatementblock = self.block_index.get_first_block(
+            'selftalk', 'statementblock')
+        self.selftalkrefutationblock = self.block_index.get_first_block(
+            'selftalk', 'refutationblock')
 
         if self.goalsettingblock:
             self.create_goal_setting_formset(
@@ -286,6 +280,13 @@ class ParticipantSessionPageView(
         return super(ParticipantSessionPageView, self).dispatch(
             request, *args, **kwargs)
 
+    def perform_checks(self, request, path):
+        rv = super(ParticipantSessionPageView, self).perform_checks(
+            request, path)
+        if rv is None:
+            self.upv = CoalescingPageVisitor(self.section, request.user)
+        return rv
+
     def get_extra_context(self):
         ctx = super(ParticipantSessionPageView, self).get_extra_context()
 
@@ -305,25 +306,43 @@ class ParticipantSessionPageView(
                 'refutation_form': self.refutation_form,
             })
 
-        avatarselectorblock = get_first_block_of_type(
-            self.section, 'main', 'avatarselectorblock')
+        avatarselectorblock = self.block_index.get_first_block(
+            'main', 'avatarselectorblock')
         ctx.update({'avatarselectorblock': avatarselectorblock})
 
+        # The video blocks unlock the page without asking the API which
+        # videos were watched.
+        videoblock_ids = [
+            entry.object_id for entry in self.block_index.entries
+            if (entry.app_label, entry.model) == ('main', 'videoblock')]
+        if videoblock_ids:
+            ctx['watched_video_ids'] = json.dumps(
+                WatchedVideo.objects.watched_video_ids(
+                    self.request.user, videoblock_ids))
+
         return ctx
 
     def get_context_data(self, **kwargs):
+        snapshot = get_hierarchy_snapshot_by_id(self.section.hierarchy_id)
+        progress = get_user_progress(self.request.user, snapshot)
+
         allow_redo = False
-        needs_submit = self.section.needs_submit()
+        needs_submit = self.block_index.has_responses()
         if needs_submit:
             allow_redo = self.section.allow_redo()
         context = dict(
             section=self.section,
+            pageblocks=get_section_pageblocks(self.section),
             module=self.module,
             needs_submit=needs_submit,
             allow_redo=allow_redo,
-            is_submitted=self.section.submitted(self.request.user),
-            modules=self.root.get_children(),
-            root=self.section.hierarchy.get_root(),
+            is_submitted=progress.is_submitted(self.section.id),
+            is_section_unlocked=progress.is_unlocked(self.section.id),
+            toc=progress.get_toc(self.section),
+            previous_section=snapshot.get_previous(self.section.id),
+            next_section=snapshot.get_next(self.section.id),
+            modules=snapshot.get_modules(),
+            root=snapshot.root,
         )
         context.update(self.get_extra_context())
         return context
@@ -331,7 +350,7 @@ class ParticipantSessionPageView(
     def get(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         self.upv.visit()
-        instructor_link = has_responses(self.section)
+        instructor_link = self.block_index.has_responses()
 
         # This flag is always False on non-protective behaviors quizzes.
         is_submission_empty = remove_empty_submission(request.user,
@@ -359,56 +378,83 @@ class ParticipantSessionPageView(
             request, *args, **kwargs)
 
 
+class InstructorPageView(InstructorView):
+    """pagetree's InstructorView, with the section's blocks loaded
+    together.
+    """
+
+    def get_context_data(self, *args, **kwargs):
+        section = self.get_section(kwargs['path'])
+        snapshot = get_hierarchy_snapshot_by_id(section.hierarchy_id)
+
+        blocks = [p.block() for p in get_section_pageblocks(section)]
+        context = dict(
+            section=section,
+            quizzes=[b for b in blocks
+                     if hasattr(b, 'needs_submit') and b.needs_submit()],
+            module=snapshot.get_module(section.id),
+            modules=snapshot.get_modules(),
+            root=snapshot.root)
+        context.update(self.get_extra_context())
+        return context
+
+
 class LoggedInMixinStaff(object):
     @method_decorator(user_passes_test(lambda u: u.is_staff))
     def dispatch(self, *args, **kwargs):
         return super(LoggedInMixinStaff, self).dispatch(*args, **kwargs)
 
 
-class Echo(object):
-    """An object that implements just the write method of the file-like
-    interface.
-    """
-    def write(self, value):
-        """Write the value by returning it, instead of storing in a buffer."""
-        return value
+class ParticipantReportView(LoggedInMixinStaff, TemplateView):
+    """Queue report jobs and list the finished reports.
 
+    Reports are built in the background by the process_report_jobs
+    management command.
+    """
 
-class ParticipantReportView(LoggedInMixinStaff, TemplateView):
     template_name = 'main/participant_report.html'
 
-    def facilitators(self):
-        rows = [['Facilitator ID', 'Facilitator Name']]
-        for user in User.objects.filter(is_active=True, is_superuser=False):
-            rows.append([user.id, user.username, user.get_full_name()])
-        return rows
-
-    def locations(self):
-        rows = [['Location ID', 'Location Name']]
-        for location in Location.objects.all():
-            rows.append([location.id, location.name])
-        return rows
+    def get_context_data(self, **kwargs):
+        ctx = super(ParticipantReportView, self).get_context_data(**kwargs)
+        ctx.update({
+            'report_types': ReportJob.REPORT_TYPES,
+            'jobs': ReportJob.objects.order_by('-created_at')[:20],
+        })
+        return ctx
 
     def post(self, request):
-        hierarchies = Hierarchy.objects.filter(name="main")
+        hierarchy = Hierarchy.objects.filter(name="main").first()
 
         report_type = request.POST.get('report-type', 'keys')
-        report = ParticipantReport(hierarchies[0])
-
-        if report_type == 'facilitators':
-            rows = self.facilitators()
-        elif report_type == 'locations':
-            rows = self.locations()
-        elif report_type == 'values':
-            rows = report.values(hierarchies)
+        if report_type not in dict(ReportJob.REPORT_TYPES):
+            report_type = 'keys'
+
+        job, created = ReportJob.objects.request_job(
+            report_type, hierarchy, report_data_version(hierarchy),
+            request.user)
+
+        if created:
+            messages.success(
+                request, 'The %s report has been queued.' %
+                job.get_report_type_display())
+        elif job.is_complete():
+            messages.success(
+                request, 'The %s report is up to date and ready to '
+                'download.' % job.get_report_type_display())
         else:
-            rows = report.metadata(hierarchies)
+            messages.info(
+                request, 'The %s report is already being built.' %
+                job.get_report_type_display())
+
+        return redirect('participant-report')
+
 
-        pseudo_buffer = Echo()
-        writer = unicodecsv.writer(pseudo_buffer)
+class ReportJobDownloadView(LoggedInMixinStaff, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, status='complete')
 
-        fnm = "worth2_%s.csv" % report_type
         response = StreamingHttpResponse(
-            (writer.writerow(row) for row in rows), content_type="text/csv")
-        response['Content-Disposition'] = 'attachment; filename="' + fnm + '"'
+            job.open_artifact(), content_type='text/csv')
+        response['Content-Disposition'] = \
+            'attachment; filename="' + job.download_filename() + '"'
         return response
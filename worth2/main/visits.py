@@ -0,0 +1,135 @@
+"""Coalesced UserPageVisit writes.
+
+pagetree's UserPageVisitor saves the page's UserPageVisit every time
+it's viewed, just to move its last_visit forward, and participants
+page back and forth a lot. CoalescingPageVisitor skips that save when
+the user's visit to the same page was saved less than
+settings.PAGE_VISIT_WINDOW seconds ago. The skipped visit's time is
+queued in the cache instead, and the flush_page_visits management
+command saves the queued times in batches.
+
+Visits that set a status, like submitting or resetting a page, are
+always saved right away, as is a user's first visit to a page.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from pagetree.generic.views import UserPageVisitor
+from pagetree.models import UserPageVisit
+
+from worth2.main.models import ProgressSummary
+from worth2.main.utils import bulk_update
+
+
+PENDING_COUNT_KEY = 'worth2.visits.pending'
+FLUSHED_COUNT_KEY = 'worth2.visits.flushed'
+SEEN_COUNT_KEY = 'worth2.visits.seen'
+
+# Queued visits that still haven't been flushed after this many
+# seconds are dropped from the cache.
+PENDING_VISIT_TIMEOUT = 60 * 60 * 24
+
+
+def visit_key(user_id, section_id):
+    return 'worth2.visit.%d.%d' % (user_id, section_id)
+
+
+def pending_visit_key(n):
+    return 'worth2.visits.pending.%d' % n
+
+
+def start_visit_window(visit):
+    """Called when a UserPageVisit is saved."""
+    cache.set(visit_key(visit.user_id, visit.section_id), True,
+              settings.PAGE_VISIT_WINDOW)
+
+
+def end_visit_window(visit):
+    """Called when a UserPageVisit is deleted, so the next view saves
+    it again.
+    """
+    cache.delete(visit_key(visit.user_id, visit.section_id))
+
+
+def queue_visit(user_id, section_id, when):
+    """Queue a visit's time to be saved by flush_pending_visits()."""
+    cache.add(PENDING_COUNT_KEY, 0, None)
+    n = cache.incr(PENDING_COUNT_KEY)
+    cache.set(pending_visit_key(n), (user_id, section_id, when),
+              PENDING_VISIT_TIMEOUT)
+
+
+def flush_pending_visits():
+    """Save the queued visit times.
+
+    Each visit's last_visit is moved forward to its latest queued
+    time, with one UPDATE, and the users' progress summaries are
+    updated to match.
+
+    queue_visit() counts a visit before it writes it, so a visit that
+    was just counted may not be there to read yet. The flush stops
+    short of it, and it's read again next time. If it's still missing
+    by then, it was lost, and it's skipped.
+
+    :returns: the number of visits that were updated.
+    :rtype: int
+    """
+    cache.add(FLUSHED_COUNT_KEY, 0, None)
+    start = cache.get(FLUSHED_COUNT_KEY)
+    seen = cache.get(SEEN_COUNT_KEY) or 0
+    end = cache.get(PENDING_COUNT_KEY) or 0
+    if end < start:
+        # The queue's counter was evicted, and started again.
+        start = seen = 0
+
+    keys = [pending_visit_key(n) for n in range(start + 1, end + 1)]
+    queued = cache.get_many(keys)
+
+    flushed = start
+    for n, key in enumerate(keys, start + 1):
+        if key not in queued and n > seen:
+            break
+        flushed = n
+
+    latest = {}
+    for user_id, section_id, when in queued.values():
+        key = (user_id, section_id)
+        if key not in latest or when > latest[key]:
+            latest[key] = when
+
+    updated = []
+    with transaction.atomic():
+        visits = UserPageVisit.objects.select_for_update().filter(
+            user__id__in=set(k[0] for k in latest.keys()),
+            section__id__in=set(k[1] for k in latest.keys()),
+        ).select_related('section')
+        for visit in visits:
+            when = latest.get((visit.user_id, visit.section_id))
+            if when is not None and when > visit.last_visit:
+                visit.last_visit = when
+                updated.append(visit)
+
+        bulk_update(updated, ['last_visit'])
+        for visit in updated:
+            ProgressSummary.objects.record_visit(visit, False)
+
+    # The visits after the first missing one are read again next
+    # time, which doesn't change anything they've already moved.
+    cache.set(FLUSHED_COUNT_KEY, flushed, None)
+    cache.set(SEEN_COUNT_KEY, end, None)
+    cache.delete_many(keys[:flushed - start])
+    return len(updated)
+
+
+class CoalescingPageVisitor(UserPageVisitor):
+    """A UserPageVisitor that doesn't save repeat views right away."""
+
+    def visit(self, status=None):
+        if status is None and not self.user.is_anonymous() and \
+                cache.get(visit_key(self.user.id, self.section.id)):
+            # The visit's status wouldn't change, only its last_visit.
+            queue_visit(self.user.id, self.section.id, timezone.now())
+            return
+
+        super(CoalescingPageVisitor, self).visit(status)
@@ -1,30 +1,26 @@
 from django import template
-from quizblock.models import Response, Submission
 
-from worth2.main.views import get_quiz_blocks
+from worth2.main.hierarchy import get_css_class_quiz_index
+from worth2.protectivebehaviors.utils import get_latest_positive_responses
 
 register = template.Library()
 
 
-def get_positive_responses_from_blocks(blocks, user):
+def get_positive_responses(user, cls):
     """
-    Returns the responses to the quizzes in param 'blocks' that have
-    positive values (i.e. greater than 0).
+    Returns the responses to the quizzes with the css class 'cls' that
+    have positive values (i.e. greater than 0).
 
-    The returned array is sorted by value, descending.
+    The returned array is sorted by value, descending. Responses with
+    the same value stay in the order of their quizzes.
     """
 
-    positive_answers = []
-    for b in blocks:
-        # assumption: each of these quiz types has one question
-        latest_submission = Submission.objects.filter(
-            quiz=b.content_object, user=user).order_by('-submitted').first()
+    quiz_ids = get_css_class_quiz_index().get_quiz_ids(cls)
+    positions = dict((quiz_id, i) for i, quiz_id in enumerate(quiz_ids))
 
-        if latest_submission:
-            positive_responses = Response.objects.filter(
-                submission=latest_submission, value__gte=1)
-            for r in positive_responses:
-                positive_answers.append(r)
+    positive_answers = sorted(
+        get_latest_positive_responses(user, quiz_ids),
+        key=lambda answer: positions[answer.submission.quiz_id])
 
     sorted_answers = sorted(positive_answers,
                             key=lambda answer: answer.value,
@@ -32,8 +28,24 @@ def get_positive_responses_from_blocks(blocks, user):
     return sorted_answers
 
 
-@register.assignment_tag
-def get_quiz_summary(user, cls):
+def get_request_positive_responses(context, user, cls):
+    """Like get_positive_responses, but memoized on the request, so
+    the tags on one page share the work.
+    """
+    request = context.get('request')
+    if request is None:
+        return get_positive_responses(user, cls)
+
+    if not hasattr(request, '_positive_responses'):
+        request._positive_responses = {}
+    key = (user.pk, cls)
+    if key not in request._positive_responses:
+        request._positive_responses[key] = get_positive_responses(user, cls)
+    return request._positive_responses[key]
+
+
+@register.assignment_tag(takes_context=True)
+def get_quiz_summary(context, user, cls):
     """Aggregate a yes/no quiz by collecting all positive responses.
 
     The Quiz this works on is expected to be implemented as a series of
@@ -41,17 +53,17 @@ def get_quiz_summary(user, cls):
     false.
     """
 
-    return get_positive_responses_from_blocks(get_quiz_blocks(cls), user)
+    return get_request_positive_responses(context, user, cls)
 
 
-@register.assignment_tag
-def get_aggregate_level(user, cls):
+@register.assignment_tag(takes_context=True)
+def get_aggregate_level(context, user, cls):
     """
     Returns the max value for responses for 'user' on pageblocks associated
     with the css class 'cls'.
     """
 
-    responses = get_positive_responses_from_blocks(get_quiz_blocks(cls), user)
+    responses = get_request_positive_responses(context, user, cls)
 
     level = 0
     for r in responses:
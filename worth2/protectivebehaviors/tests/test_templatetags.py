@@ -1,7 +1,9 @@
 from django.test import TestCase
+from django.test.client import RequestFactory
 from pagetree.helpers import get_hierarchy
 from quizblock.models import Response, Submission
 
+from worth2.main.hierarchy import get_css_class_quiz_index
 from worth2.main.tests.mixins import LoggedInParticipantTestMixin
 from worth2.protectivebehaviors.templatetags.quizsummary import (
     get_quiz_summary, get_aggregate_level
@@ -96,7 +98,7 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_1,
             value='1')
 
-        results = get_quiz_summary(self.u, 'protective-behaviors')
+        results = get_quiz_summary({}, self.u, 'protective-behaviors')
 
         self.assertEqual(len(results), 1)
 
@@ -112,7 +114,7 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_2,
             value='0')
 
-        results = get_quiz_summary(self.u, 'protective-behaviors')
+        results = get_quiz_summary({}, self.u, 'protective-behaviors')
 
         self.assertEqual(len(results), 1)
 
@@ -128,7 +130,7 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_2,
             value='3')
 
-        results = get_quiz_summary(self.u, 'protective-behaviors')
+        results = get_quiz_summary({}, self.u, 'protective-behaviors')
 
         self.assertEqual(len(results), 2)
         self.assertEqual(results[0].question.text, 'Question 2')
@@ -148,7 +150,7 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_2,
             value='0')
 
-        level = get_aggregate_level(self.u, 'protective-behaviors')
+        level = get_aggregate_level({}, self.u, 'protective-behaviors')
         self.assertEqual(level, 1)
 
     def test_get_aggregate_level_2(self):
@@ -163,7 +165,7 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_2,
             value='0')
 
-        level = get_aggregate_level(self.u, 'protective-behaviors')
+        level = get_aggregate_level({}, self.u, 'protective-behaviors')
         self.assertEqual(level, 0)
 
     def test_get_aggregate_level_3(self):
@@ -182,5 +184,45 @@ class QuizSummaryTest(LoggedInParticipantTestMixin, TestCase):
             question=self.question_2,
             value='0')
 
-        level = get_aggregate_level(self.u, 'protective-behaviors')
+        level = get_aggregate_level({}, self.u, 'protective-behaviors')
+        self.assertEqual(level, 2)
+
+    def test_quizsummary_uses_latest_submission(self):
+        old = Submission.objects.create(quiz=self.quizblock.block(),
+                                        user=self.u)
+        Response.objects.create(
+            submission=old,
+            question=self.question_1,
+            value='1')
+        submission = Submission.objects.create(quiz=self.quizblock.block(),
+                                               user=self.u)
+        Response.objects.create(
+            submission=submission,
+            question=self.question_2,
+            value='3')
+
+        # Both submissions were made at the same time, so the newer one
+        # wins.
+        Submission.objects.filter(pk=submission.pk).update(
+            submitted=old.submitted)
+
+        results = get_quiz_summary({}, self.u, 'protective-behaviors')
+        self.assertEqual([r.question.text for r in results], ['Question 2'])
+
+    def test_summary_memoized_per_request(self):
+        submission = Submission.objects.create(quiz=self.quizblock.block(),
+                                               user=self.u)
+        Response.objects.create(
+            submission=submission,
+            question=self.question_3,
+            value='2')
+
+        get_css_class_quiz_index()
+        context = {'request': RequestFactory().get('/')}
+        with self.assertNumQueries(1):
+            results = get_quiz_summary(
+                context, self.u, 'protective-behaviors')
+            level = get_aggregate_level(
+                context, self.u, 'protective-behaviors')
+        self.assertEqual(results[0].question.text, 'Question 3')
         self.assertEqual(level, 2)
@@ -1,4 +1,5 @@
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db.models import Q
 
 import quizblock
@@ -38,3 +39,46 @@ def remove_empty_submission(user, section):
             is_submission_empty = True
 
     return is_submission_empty
+
+
+def get_latest_positive_responses(user, quiz_ids):
+    """Returns the positive responses in the user's latest submission
+    to each of these quizzes, with one query.
+
+    Positive responses are the ones with values greater than 0. When
+    two submissions have the same time, the newer one wins.
+
+    :rtype: queryset
+    """
+    if not quiz_ids:
+        return quizblock.models.Response.objects.none()
+
+    tables = {
+        'submission': quizblock.models.Submission._meta.db_table,
+        'quiz_ids': ', '.join(['%s'] * len(quiz_ids)),
+    }
+    if connection.vendor == 'postgresql':
+        latest = (
+            'SELECT id FROM ('
+            'SELECT id, row_number() OVER ('
+            'PARTITION BY quiz_id ORDER BY submitted DESC, id DESC'
+            ') AS position FROM %(submission)s '
+            'WHERE user_id = %%s AND quiz_id IN (%(quiz_ids)s)'
+            ') latest WHERE position = 1') % tables
+    else:
+        # Without window functions, a submission is the latest when
+        # there's no newer one.
+        latest = (
+            'SELECT s.id FROM %(submission)s s '
+            'WHERE s.user_id = %%s AND s.quiz_id IN (%(quiz_ids)s) '
+            'AND NOT EXISTS (SELECT 1 FROM %(submission)s newer '
+            'WHERE newer.user_id = s.user_id '
+            'AND newer.quiz_id = s.quiz_id '
+            'AND (newer.submitted > s.submitted OR '
+            '(newer.submitted = s.submitted AND newer.id > s.id)))') % tables
+
+    return quizblock.models.Response.objects.filter(
+        value__gte=1).select_related('question', 'submission').extra(
+        where=['%s.submission_id IN (%s)' % (
+            quizblock.models.Response._meta.db_table, latest)],
+        params=[user.pk] + list(quiz_ids))
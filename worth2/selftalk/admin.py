@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from worth2.main.admin import BumpsCatalogVersionMixin
 from worth2.selftalk.models import (
     Statement, Refutation,
     StatementBlock
@@ -10,7 +11,7 @@ class RefutationInline(admin.StackedInline):
     model = Refutation
 
 
-class StatementAdmin(admin.ModelAdmin):
+class StatementAdmin(BumpsCatalogVersionMixin, admin.ModelAdmin):
     list_display = ('text', 'refutations')
     inlines = [RefutationInline]
 
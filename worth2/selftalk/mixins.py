@@ -1,7 +1,9 @@
+from collections import OrderedDict
 from django import forms
 from django.contrib import messages
 from django.shortcuts import render
 
+from worth2.main.catalog import get_content_catalog, get_form_class
 from worth2.selftalk.forms import RefutationForm, StatementForm
 from worth2.selftalk.models import RefutationResponse, StatementResponse
 
@@ -12,19 +14,24 @@ class SelfTalkStatementViewMixin(object):
     def _make_statement_form_for_block(self, statementblock):
         """Make the Form class based on the statements in the block.
 
+        The class is cached until the block or its statements change.
+
         :returns: a class
         """
+        block = statementblock.block()
+
+        def build(catalog):
+            class DynamicStatementForm(StatementForm):
+                pass
 
-        class DynamicStatementForm(StatementForm):
-            def __init__(self, *args, **kwargs):
-                super(DynamicStatementForm, self).__init__(
-                    *args, **kwargs)
-                for statement in statementblock.block().statements.all():
-                    self.fields['%d' % statement.pk] = forms.BooleanField(
-                        label='"' + statement.text + '"',
-                        required=False)
+            DynamicStatementForm.base_fields = OrderedDict(
+                ('%d' % statement.pk, forms.BooleanField(
+                    label='"' + statement.text + '"',
+                    required=False))
+                for statement in block.statements.all())
+            return DynamicStatementForm
 
-        return DynamicStatementForm
+        return get_form_class(('selftalk-statement', block.pk), build)
 
     def create_selftalk_statement_form(self, request, statementblock):
         initial_data = {}
@@ -33,7 +40,7 @@ class SelfTalkStatementViewMixin(object):
         responses = StatementResponse.objects.filter(
             user=request.user,
             statement_block=statementblock.block())
-        for i, r in enumerate(responses.all()):
+        for i, r in enumerate(responses.select_related('statement')):
             initial_data[unicode(i)] = r.statement.text
 
         DynamicStatementForm = self._make_statement_form_for_block(
@@ -72,48 +79,83 @@ class SelfTalkStatementViewMixin(object):
 class SelfTalkRefutationViewMixin(object):
     """Mixin for RefutationBlock form functionality."""
 
+    @staticmethod
+    def _make_refutation_fields(catalog, statement_ids):
+        """Make the dropdown and "Other" fields for each statement.
+
+        :returns: an OrderedDict of field name -> field
+        """
+        fields = OrderedDict()
+        for statement_id in statement_ids:
+            statement = catalog.get_statement(statement_id)
+            choices = list(catalog.get_refutations(statement_id))
+            choice_ids = [r.pk for r in choices]
+
+            choices.insert(0, 'Select')
+            choice_ids.insert(0, None)
+
+            choices.append('Other')
+            choice_ids.append(0)
+
+            fields['refutation-%d' % statement_id] = forms.ChoiceField(
+                widget=forms.Select(
+                    attrs={'class': 'refutation-dropdown'}),
+                label=statement.text,
+                choices=zip(choice_ids, choices))
+
+            fields['other-%d' % statement_id] = forms.CharField(
+                widget=forms.TextInput(
+                    attrs={
+                        'class': 'refutation-other',
+                        'placeholder': 'Other',
+                    }),
+                label='',
+                required=False)
+        return fields
+
     def _make_refutation_form_for_block(self, user, refutationblock):
         """Make the Form class based on the statement responses in the block.
 
+        The fields for all of the block's statements are made once, and
+        cached until the block or its statements change. Each user's
+        class only has the fields for the statements they chose.
+
         :returns: a class
         """
+        block = refutationblock.block()
+        statement_ids = list(StatementResponse.objects.filter(
+            user=user,
+            statement_block__id=block.statement_block_id,
+        ).order_by('pk').values_list('statement_id', flat=True))
+
+        def build(catalog):
+            class BlockRefutationForm(RefutationForm):
+                pass
+
+            BlockRefutationForm.base_fields = self._make_refutation_fields(
+                catalog, block.statement_block.statements.values_list(
+                    'pk', flat=True))
+            return BlockRefutationForm
+
+        block_fields = get_form_class(
+            ('selftalk-refutation', block.pk), build).base_fields
+        # The user may have chosen statements that were taken out of
+        # the block since.
+        missing = [statement_id for statement_id in statement_ids
+                   if 'refutation-%d' % statement_id not in block_fields]
+        if missing:
+            block_fields = OrderedDict(block_fields)
+            block_fields.update(self._make_refutation_fields(
+                get_content_catalog(), missing))
 
         class DynamicRefutationForm(RefutationForm):
-            def __init__(self, *args, **kwargs):
-                super(DynamicRefutationForm, self).__init__(
-                    *args, **kwargs)
-
-                statement_block = refutationblock.block().statement_block
-                responses = statement_block.statementresponse_set.filter(
-                    user=user)
-
-                for response in responses:
-                    statement = response.statement
-                    choices = list(statement.refutation_set.all())
-                    choice_ids = [r.pk for r in choices]
-
-                    choices.insert(0, 'Select')
-                    choice_ids.insert(0, None)
-
-                    choices.append('Other')
-                    choice_ids.append(0)
-
-                    self.fields['refutation-%d' % statement.pk] = \
-                        forms.ChoiceField(
-                            widget=forms.Select(
-                                attrs={'class': 'refutation-dropdown'}),
-                            label=statement.text,
-                            choices=zip(choice_ids, choices))
-
-                    self.fields['other-%d' % statement.pk] = forms.CharField(
-                        widget=forms.TextInput(
-                            attrs={
-                                'class': 'refutation-other',
-                                'placeholder': 'Other',
-                            }),
-                        label='',
-                        required=False)
+            pass
 
+        DynamicRefutationForm.base_fields = OrderedDict(
+            (name, block_fields[name])
+            for statement_id in statement_ids
+            for name in ('refutation-%d' % statement_id,
+                         'other-%d' % statement_id))
         return DynamicRefutationForm
 
     def create_selftalk_refutation_form(self, request, refutationblock):
@@ -124,13 +166,11 @@ class SelfTalkRefutationViewMixin(object):
             user=request.user,
             refutation_block=refutationblock.block())
         for r in responses.all():
-            statement_pk = r.statement.pk
-            try:
-                initial_data['refutation-%d' % statement_pk] = r.refutation.pk
-            except:
-                # If r.refutation is None, this is an 'Other' answer, so give
-                # it pk=0.
-                initial_data['refutation-%d' % statement_pk] = 0
+            statement_pk = r.statement_id
+            # If r.refutation is None, this is an 'Other' answer, so give
+            # it pk=0.
+            initial_data['refutation-%d' % statement_pk] = \
+                r.refutation_id or 0
             initial_data['other-%d' % statement_pk] = r.other_text
 
         DynamicRefutationForm = self._make_refutation_form_for_block(
@@ -1,11 +1,13 @@
 import re
 from django import forms
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from ordered_model.models import OrderedModel
 from pagetree.generic.models import BasePageBlock
 
+from worth2.main.catalog import get_content_catalog
 from worth2.main.utils import get_module_number
+from worth2.selftalk.signals import selftalk_responses_saved
 
 
 class Statement(OrderedModel):
@@ -90,24 +92,47 @@ class StatementBlock(BasePageBlock):
         )
         return qs.count() > 0
 
+    @classmethod
+    def bulk_unlocked(cls, user, block_ids):
+        """Returns the ids of these blocks that are unlocked for the user."""
+        return StatementResponse.objects.filter(
+            user=user, statement_block__id__in=block_ids).values_list(
+            'statement_block_id', flat=True)
+
     def submit(self, user, request_data):
-        for k, v in request_data.iteritems():
-            statement = Statement.objects.get(pk=int(k))
-            if v is True:
-                StatementResponse.objects.update_or_create(
-                    statement=statement,
-                    statement_block=self,
-                    user=user,
-                )
-            elif v is False:
-                try:
-                    to_delete = StatementResponse.objects.get(
-                        statement=statement,
-                        statement_block=self,
-                        user=user)
-                    to_delete.delete()
-                except:
-                    pass
+        """Save the user's chosen statements.
+
+        Statements that aren't in the block any more, because they
+        were taken out after the form was built, are ignored.
+
+        :param request_data: a dict of Statement id -> True if the
+          statement was checked, or False if it wasn't.
+        """
+        submitted_ids = set(int(k) for k in request_data.keys())
+        statement_ids = set(self.statements.filter(
+            pk__in=submitted_ids).values_list('pk', flat=True))
+
+        chosen = set(int(k) for k, v in request_data.items()
+                     if v is True) & statement_ids
+        unchosen = set(int(k) for k, v in request_data.items()
+                       if v is False) & statement_ids
+
+        with transaction.atomic():
+            responses = StatementResponse.objects.select_for_update().filter(
+                user=user, statement_block=self)
+            existing = set(responses.values_list('statement_id', flat=True))
+
+            StatementResponse.objects.bulk_create([
+                StatementResponse(
+                    statement_id=statement_id, statement_block=self,
+                    user=user)
+                for statement_id in chosen - existing])
+            if unchosen & existing:
+                responses.filter(
+                    statement__id__in=unchosen & existing).delete()
+
+        if chosen - existing:
+            selftalk_responses_saved.send(sender=self.__class__, user=user)
 
     def clear_user_submissions(self, user):
         StatementResponse.objects.filter(
@@ -198,30 +223,87 @@ class RefutationBlock(BasePageBlock):
         )
         return qs.count() > 0
 
-    def submit(self, user, request_data):
-        # Loop through the refutations the user chose
+    @classmethod
+    def bulk_unlocked(cls, user, block_ids):
+        """Returns the ids of these blocks that are unlocked for the user."""
+        return RefutationResponse.objects.filter(
+            user=user, refutation_block__id__in=block_ids).values_list(
+            'refutation_block_id', flat=True)
+
+    @staticmethod
+    def parse_choices(request_data):
+        """Find the refutations the user chose, by statement.
+
+        :param request_data: a dict with a 'refutation-<statement id>'
+          key for each statement, whose value is the Refutation id, or
+          0 for 'Other', and an optional 'other-<statement id>' key
+          with the 'Other' text.
+
+        :returns: a dict of Statement id -> (Refutation id, other
+          text). The Refutation id is None for 'Other' answers.
+        :rtype: dict
+        """
+        choices = {}
         for k, v in request_data.iteritems():
             match = re.match(r'^refutation-(\d+)$', k)
             if not match:
                 continue
 
             statement_pk = int(match.groups()[0])
-            refutation_pk = int(v)
-
             # Find the optional 'other' text to attach to this response.
-            other_text = ''
-            if ('other-%d' % statement_pk) in request_data:
-                other_text = request_data['other-%d' % statement_pk]
-
-            refutation = Refutation.objects.filter(pk=refutation_pk).first()
-            statement = Statement.objects.get(pk=statement_pk)
-            RefutationResponse.objects.update_or_create(
-                refutation=refutation,
-                statement=statement,
-                refutation_block=self,
-                user=user,
-                other_text=other_text,
-            )
+            choices[statement_pk] = (
+                int(v), request_data.get('other-%d' % statement_pk, ''))
+
+        catalog = get_content_catalog()
+        for statement_pk, choice in choices.items():
+            # Statements deleted since the form was built are ignored.
+            if catalog.get_statement(statement_pk) is None:
+                del choices[statement_pk]
+                continue
+
+            # Refutations that don't exist are saved as 'Other' answers.
+            if catalog.get_refutation(choice[0]) is None:
+                choices[statement_pk] = (None, choice[1])
+        return choices
+
+    def submit(self, user, request_data):
+        """Save the user's refutation for each statement.
+
+        Each statement's previous responses are replaced with the
+        chosen refutation, or with the 'Other' text.
+        """
+        choices = self.parse_choices(request_data)
+
+        with transaction.atomic():
+            responses = RefutationResponse.objects.select_for_update().filter(
+                user=user, refutation_block=self,
+                statement__id__in=choices.keys())
+
+            stale_ids = []
+            kept = set()
+            for pk, statement_pk, refutation_pk, other_text in \
+                    responses.values_list('pk', 'statement_id',
+                                          'refutation_id', 'other_text'):
+                if statement_pk not in kept and \
+                        choices[statement_pk] == (refutation_pk, other_text):
+                    kept.add(statement_pk)
+                else:
+                    stale_ids.append(pk)
+
+            if stale_ids:
+                RefutationResponse.objects.filter(pk__in=stale_ids).delete()
+
+            created = []
+            for statement_pk, choice in choices.items():
+                if statement_pk not in kept:
+                    created.append(RefutationResponse(
+                        refutation_id=choice[0], statement_id=statement_pk,
+                        refutation_block=self, user=user,
+                        other_text=choice[1]))
+            RefutationResponse.objects.bulk_create(created)
+
+        if created:
+            selftalk_responses_saved.send(sender=self.__class__, user=user)
 
     def clear_user_submissions(self, user):
         RefutationResponse.objects.filter(
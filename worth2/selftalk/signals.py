@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent when a user's self-talk responses are written in bulk, since
+# bulk writes don't send post_save.
+selftalk_responses_saved = Signal(providing_args=['user'])
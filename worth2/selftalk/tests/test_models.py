@@ -1,5 +1,8 @@
 from django.test import TestCase
 
+from worth2.main.catalog import get_content_catalog
+from worth2.main.tests.factories import UserFactory
+from worth2.selftalk.models import RefutationResponse, StatementResponse
 from worth2.selftalk.tests.factories import (
     StatementFactory, RefutationFactory,
     ExternalStatementBlockFactory, InternalStatementBlockFactory,
@@ -45,6 +48,38 @@ class InternalStatementBlockTest(TestCase):
     def test_is_valid_from_factory(self):
         self.o.full_clean()
 
+    def test_submit(self):
+        statements = [StatementFactory() for i in range(20)]
+        self.o.statements.add(*statements)
+        user = UserFactory()
+        StatementResponseFactory(
+            user=user, statement_block=self.o, statement=statements[0])
+        StatementResponseFactory(
+            user=user, statement_block=self.o, statement=statements[1])
+
+        request_data = dict(('%d' % s.pk, i % 2 == 0)
+                            for i, s in enumerate(statements))
+        with self.assertNumQueries(7):
+            self.o.submit(user, request_data)
+
+        self.assertEqual(
+            set(StatementResponse.objects.filter(
+                user=user, statement_block=self.o).values_list(
+                'statement_id', flat=True)),
+            set(s.pk for s in statements[::2]))
+
+    def test_submit_unknown_statement(self):
+        statement = StatementFactory()
+        self.o.statements.add(statement)
+        user = UserFactory()
+        self.o.submit(user, {'%d' % StatementFactory().pk: True,
+                             '%d' % statement.pk: True})
+        self.assertEqual(
+            list(StatementResponse.objects.filter(
+                user=user, statement_block=self.o).values_list(
+                'statement_id', flat=True)),
+            [statement.pk])
+
 
 class ExternalRefutationBlockTest(TestCase):
     def setUp(self):
@@ -61,6 +96,71 @@ class InternalRefutationBlockTest(TestCase):
     def test_is_valid_from_factory(self):
         self.o.full_clean()
 
+    def test_submit(self):
+        statement1 = StatementFactory()
+        statement2 = StatementFactory()
+        statement3 = StatementFactory()
+        refutation1 = RefutationFactory(statement=statement1)
+        refutation2 = RefutationFactory(statement=statement1)
+        refutation3 = RefutationFactory(statement=statement2)
+        user = UserFactory()
+        kept = RefutationResponseFactory(
+            user=user, refutation_block=self.o, statement=statement2,
+            refutation=refutation3, other_text='')
+        RefutationResponseFactory(
+            user=user, refutation_block=self.o, statement=statement1,
+            refutation=refutation1, other_text='')
+
+        self.o.submit(user, {
+            'refutation-%d' % statement1.pk: '%d' % refutation2.pk,
+            'other-%d' % statement1.pk: '',
+            'refutation-%d' % statement2.pk: '%d' % refutation3.pk,
+            'other-%d' % statement2.pk: '',
+            'refutation-%d' % statement3.pk: '0',
+            'other-%d' % statement3.pk: 'my own words',
+        })
+
+        responses = RefutationResponse.objects.filter(
+            user=user, refutation_block=self.o)
+        self.assertEqual(
+            set(responses.values_list(
+                'statement_id', 'refutation_id', 'other_text')),
+            set([(statement1.pk, refutation2.pk, ''),
+                 (statement2.pk, refutation3.pk, ''),
+                 (statement3.pk, None, 'my own words')]))
+        self.assertTrue(responses.filter(pk=kept.pk).exists())
+
+    def test_submit_unchanged(self):
+        response = RefutationResponseFactory(
+            refutation_block=self.o, other_text='')
+
+        # The statements and refutations come from the catalog.
+        get_content_catalog()
+        with self.assertNumQueries(3):
+            self.o.submit(response.user, {
+                'refutation-%d' % response.statement.pk:
+                '%d' % response.refutation.pk,
+            })
+        self.assertEqual(RefutationResponse.objects.get().pk, response.pk)
+
+    def test_submit_deleted_statement(self):
+        statement = StatementFactory()
+        deleted = StatementFactory()
+        user = UserFactory()
+        request_data = {
+            'refutation-%d' % statement.pk: '0',
+            'other-%d' % statement.pk: 'my own words',
+            'refutation-%d' % deleted.pk: '0',
+        }
+        deleted.delete()
+
+        self.o.submit(user, request_data)
+        self.assertEqual(
+            list(RefutationResponse.objects.filter(
+                user=user, refutation_block=self.o).values_list(
+                'statement_id', 'other_text')),
+            [(statement.pk, 'my own words')])
+
 
 class StatementResponseTest(TestCase):
     def setUp(self):
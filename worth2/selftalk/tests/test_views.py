@@ -2,6 +2,7 @@ from django.test import TestCase
 from pagetree.helpers import get_hierarchy
 
 from worth2.main.tests.mixins import LoggedInParticipantTestMixin
+from worth2.selftalk.mixins import SelfTalkRefutationViewMixin
 from worth2.selftalk.tests.factories import (
     StatementFactory, StatementResponseFactory, RefutationFactory
 )
@@ -88,6 +89,22 @@ class ExternalStatementBlockTest(LoggedInParticipantTestMixin, TestCase):
         self.assertTrue(form.is_valid())
         self.assertEqual(responses.count(), 2)
 
+    def test_post_removed_statement(self):
+        # Build the form class, then take a statement out of the block
+        # without any signals, like a request that raced the edit.
+        self.client.get(self.url)
+        StatementBlock.statements.through.objects.filter(
+            statementblock=self.statementblock,
+            statement=self.statement3).delete()
+
+        r = self.client.post(self.url, self.valid_post_data)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            set(StatementResponse.objects.filter(
+                statement_block=self.statementblock,
+                user=self.u).values_list('statement_id', flat=True)),
+            set([self.statement1.pk, self.statement2.pk]))
+
 
 class ExternalRefutationBlockTest(LoggedInParticipantTestMixin, TestCase):
     def setUp(self):
@@ -396,6 +413,42 @@ class InternalRefutationBlockTest(LoggedInParticipantTestMixin, TestCase):
                 self.p, self.statement3.pk): self.refutation7.pk,
         }
 
+    def test_form_class(self):
+        view = SelfTalkRefutationViewMixin()
+        pageblock = self.refutationblock.pageblock()
+        DynamicRefutationForm = view._make_refutation_form_for_block(
+            self.u, pageblock)
+        self.assertEqual(
+            [k for k in DynamicRefutationForm.base_fields.keys()
+             if k.startswith('refutation-')],
+            ['refutation-%d' % s.pk for s in (
+                self.statement1, self.statement2, self.statement3)])
+        self.assertEqual(
+            DynamicRefutationForm.base_fields[
+                'refutation-%d' % self.statement1.pk].choices,
+            [(None, 'Select'),
+             (self.refutation1.pk, self.refutation1),
+             (self.refutation2.pk, self.refutation2),
+             (self.refutation3.pk, self.refutation3),
+             (0, 'Other')])
+
+        # Only the user's statements are looked up, and the block's
+        # fields are reused.
+        with self.assertNumQueries(1):
+            form_class = view._make_refutation_form_for_block(
+                self.u, pageblock)
+        for name, field in form_class.base_fields.items():
+            self.assertIs(field, DynamicRefutationForm.base_fields[name])
+
+        self.statementresponse2.delete()
+        form_class = view._make_refutation_form_for_block(self.u, pageblock)
+        self.assertNotIn('refutation-%d' % self.statement2.pk,
+                         form_class.base_fields)
+        self.assertIs(
+            form_class.base_fields['refutation-%d' % self.statement3.pk],
+            DynamicRefutationForm.base_fields[
+                'refutation-%d' % self.statement3.pk])
+
     def test_get(self):
         r = self.client.get(self.url)
         self.assertEqual(r.status_code, 200)
@@ -107,6 +107,7 @@ MIDDLEWARE_CLASSES = (
     'impersonate.middleware.ImpersonateMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'waffle.middleware.WaffleMiddleware',
+    'worth2.main.middleware.UserRoleMiddleware',
 )
 
 ROOT_URLCONF = 'worth2.urls'
@@ -207,7 +208,8 @@ SERVER_EMAIL = "worth2@ccnmtl.columbia.edu"
 DEFAULT_FROM_EMAIL = SERVER_EMAIL
 
 # CAS settings
-AUTHENTICATION_BACKENDS = ('djangowind.auth.SAMLAuthBackend',
+AUTHENTICATION_BACKENDS = ('worth2.main.auth.ParticipantBackend',
+                           'djangowind.auth.SAMLAuthBackend',
                            'django.contrib.auth.backends.ModelBackend', )
 CAS_BASE = "https://cas.columbia.edu/"
 WIND_PROFILE_HANDLERS = ['djangowind.auth.CDAPProfileHandler']
@@ -236,6 +238,13 @@ ACCOUNT_ACTIVATION_DAYS = 7
 # change on production / staging
 PARTICIPANT_SECRET = 'something secret'
 
+# Background report jobs write their CSVs here.
+REPORT_JOB_ROOT = '/tmp/worth2/reports/'
+
+# Repeat views of a page within this many seconds don't save its
+# UserPageVisit right away. See worth2.main.visits.
+PAGE_VISIT_WINDOW = 60
+
 REGISTRATION_APPLICATION_MODEL = 'registration.Application'
 
 MIGRATION_MODULES = {
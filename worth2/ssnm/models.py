@@ -2,8 +2,9 @@ from django import forms
 from django.contrib.auth.models import User
 from django.db import models
 from pagetree.generic.models import BasePageBlock
-from pagetree.reports import ReportColumnInterface, StandaloneReportColumn, \
-    ReportableInterface
+from pagetree.reports import ReportColumnInterface, ReportableInterface
+
+from worth2.main.generic.reports import BulkStandaloneReportColumn
 
 
 class Supporter(models.Model):
@@ -105,15 +106,25 @@ class SupporterReportColumn(ReportColumnInterface):
         supporter = supporters[self.idx]
         return getattr(supporter, self.field, '')
 
+    def bulk_user_value(self, user, data):
+        supporters = data.user_supporters(user)
+
+        if len(supporters) <= self.idx:
+            return ''
+
+        supporter = supporters[self.idx]
+        return getattr(supporter, self.field, '')
+
 
 class SsnmReport(ReportableInterface):
 
     def standalone_columns(self):
         return [
-            StandaloneReportColumn(
+            BulkStandaloneReportColumn(
                 'supporter_count', 'Social Support Network',
                 'count', 'Supporter Count',
-                lambda x: Supporter.objects.filter(user=x).count())]
+                lambda x: Supporter.objects.filter(user=x).count(),
+                lambda x, data: len(data.user_supporters(x)))]
 
     def report_metadata(self):
         cols = self.standalone_columns()
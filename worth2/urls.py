@@ -5,7 +5,8 @@ from django.contrib import admin
 from django.contrib.auth.decorators import user_passes_test
 from django.conf import settings
 from django.views.generic import TemplateView
-from pagetree.generic.views import EditView, InstructorView
+from pagetree import urls as pagetree_urls
+from pagetree.generic.views import EditView
 from rest_framework import routers
 
 from worth2.main import apiviews, auth, views
@@ -27,6 +28,13 @@ if hasattr(settings, 'CAS_BASE'):
         'djangowind.views.logout',
         {'next_page': redirect_after_logout})
 
+# pagetree's views, bumping the pagetree version after each edit
+pagetree_urlpatterns = [
+    url(pattern.regex.pattern,
+        views.bumps_pagetree_version(pattern.callback),
+        pattern.default_args, pattern.name)
+    for pattern in pagetree_urls.urlpatterns]
+
 rest_router = routers.DefaultRouter()
 rest_router.register(r'participants', apiviews.ParticipantViewSet)
 rest_router.register(r'watched_videos', apiviews.WatchedVideoViewSet,
@@ -58,7 +66,7 @@ urlpatterns = patterns(
     (r'^uploads/(?P<path>.*)$',
      'django.views.static.serve', {'document_root': settings.MEDIA_ROOT}),
 
-    (r'^pagetree/', include('pagetree.urls')),
+    (r'^pagetree/', include(pagetree_urlpatterns)),
     (r'^quizblock/', include('quizblock.urls')),
     url(r'^pages/edit/(?P<path>.*)$',
         user_passes_test(lambda u: u.is_superuser)(
@@ -68,7 +76,7 @@ urlpatterns = patterns(
         {}, 'edit-page'),
     url(r'^pages/instructor/(?P<path>.*)$',
         user_passes_test(lambda u: auth.user_is_facilitator(u))(
-            InstructorView.as_view(
+            views.InstructorPageView.as_view(
                 hierarchy_name="main",
                 hierarchy_base="/pages/"))),
     url(r'^pages/(?P<path>.*)$', views.ParticipantSessionPageView.as_view(
@@ -91,6 +99,10 @@ urlpatterns = patterns(
         user_passes_test(lambda u: auth.user_is_facilitator(u))(
             views.ParticipantReportView.as_view()),
         name='participant-report'),
+    url(r'^participant-report/(?P<pk>\d+)/download/$',
+        user_passes_test(lambda u: auth.user_is_facilitator(u))(
+            views.ReportJobDownloadView.as_view()),
+        name='report-job-download'),
 
     # Social Support Network Map activity
     url(r'^ssnm/api/', include(ssnm_rest_router.urls)),